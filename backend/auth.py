@@ -1,8 +1,13 @@
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 import os
+import threading
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -12,8 +17,26 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 INTERNAL_SIGNUP_CODE = os.getenv("INTERNAL_SIGNUP_CODE", "secret123")
 
+# Verified token -> user snapshot, so authenticated requests (the dashboard
+# polls every few seconds) skip the JWT check and the users query. Entries
+# expire with the token or after AUTH_CACHE_TTL_SECONDS, whichever comes
+# first. Profile updates invalidate this process's entries; other workers
+# catch up within the TTL. 0 disables the cache.
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+
+# Password hashing cost. Hashes made with other rounds are upgraded on the
+# next successful login. Empty keeps passlib's default.
+AUTH_HASH_ROUNDS = os.getenv("AUTH_HASH_ROUNDS", "")
+# Hashing runs on its own small pool so a burst of logins can't take the
+# request threadpool or the event loop; beyond AUTH_HASH_MAX_PENDING queued
+# hashes, login/signup answer 503.
+AUTH_HASH_WORKERS = int(os.getenv("AUTH_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+AUTH_HASH_MAX_PENDING = int(os.getenv("AUTH_HASH_MAX_PENDING", "256"))
+
 # Using pbkdf2_sha256 for better compatibility (no C extensions required)
-pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+pwd_context_options = {"pbkdf2_sha256__rounds": int(AUTH_HASH_ROUNDS)} if AUTH_HASH_ROUNDS else {}
+pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto", **pwd_context_options)
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -21,6 +44,55 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+def verify_and_update_password(plain_password, hashed_password) -> Tuple[bool, Optional[str]]:
+    """(valid, new hash if the stored one uses outdated parameters)"""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+class PasswordHashBusy(Exception):
+    pass
+
+
+class PasswordHasher:
+    """Bounded thread pool for password hashing (hashlib's PBKDF2 releases the GIL)."""
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = max(workers, 1)
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    def _submit(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise PasswordHashBusy()
+            self._pending += 1
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self._lock:
+            self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await asyncio.wrap_future(self._submit(get_password_hash, password))
+
+    async def verify_and_update(self, plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        return await asyncio.wrap_future(self._submit(verify_and_update_password, plain_password, hashed_password))
+
+    def hash_sync(self, password: str) -> str:
+        # For sync endpoints, which already run in the request threadpool
+        return self._submit(get_password_hash, password).result()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"workers": self.workers, "pending": self._pending, "max_pending": self.max_pending}
+
+
+password_hasher = PasswordHasher(AUTH_HASH_WORKERS, AUTH_HASH_MAX_PENDING)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -30,3 +102,80 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
+
+
+def token_expiry(token: str) -> Optional[float]:
+    # Only for tokens that were already verified
+    exp = jwt.get_unverified_claims(token).get("exp")
+    return float(exp) if exp is not None else None
+
+
+class TokenCache:
+    """Size-bounded LRU of token -> user snapshot with per-entry expiry."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # token -> (expires_at, user), least recently used first
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl_seconds > 0
+
+    def get(self, token: str):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(token)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[token]
+            self.misses += 1
+            return None
+
+    def put(self, token: str, user):
+        """Cache a detached copy of `user` and return it."""
+        from .models import User
+
+        snapshot = User(id=user.id, username=user.username, email=user.email)
+        if not self.enabled:
+            return snapshot
+        expires_at = time.time() + self.ttl_seconds
+        token_expires_at = token_expiry(token)
+        if token_expires_at is not None:
+            expires_at = min(expires_at, token_expires_at)
+        with self._lock:
+            self._entries[token] = (expires_at, snapshot)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return snapshot
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            for token in [token for token, (_, user) in self._entries.items() if user.id == user_id]:
+                del self._entries[token]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+token_cache = TokenCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL_SECONDS)
@@ -0,0 +1,75 @@
+import os
+import zlib
+from sqlalchemy.types import TypeDecorator, LargeBinary
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Large text columns (raw_text, corrected_html) are stored compressed in a
+# binary column. The first byte says how; values written before the columns
+# were compressed (plain text, or its UTF-8 bytes after a type change) are
+# still read back as is.
+
+TEXT_COMPRESSION = os.getenv("TEXT_COMPRESSION", "zlib") # zlib, zstd (needs the zstandard package)
+TEXT_COMPRESSION_LEVEL = int(os.getenv("TEXT_COMPRESSION_LEVEL", "6"))
+# Shorter values aren't worth compressing
+TEXT_COMPRESSION_MIN_BYTES = 256
+
+RAW = b"\x00"
+ZLIB = b"\x01"
+ZSTD = b"\x02"
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+if TEXT_COMPRESSION == "zstd" and zstandard is None:
+    print("TEXT_COMPRESSION=zstd but the zstandard package is not installed, using zlib")
+    TEXT_COMPRESSION = "zlib"
+
+
+def compress_text(value: str) -> bytes:
+    data = value.encode("utf-8")
+    if len(data) < TEXT_COMPRESSION_MIN_BYTES:
+        return RAW + data
+    if TEXT_COMPRESSION == "zstd":
+        return ZSTD + zstandard.ZstdCompressor(level=TEXT_COMPRESSION_LEVEL).compress(data)
+    return ZLIB + zlib.compress(data, TEXT_COMPRESSION_LEVEL)
+
+
+def decompress_text(value) -> str:
+    if isinstance(value, str):
+        return value # Legacy row in a text column
+    value = bytes(value)
+    marker, body = value[:1], value[1:]
+    if marker == ZLIB:
+        return zlib.decompress(body).decode("utf-8")
+    if marker == ZSTD:
+        if zstandard is None:
+            raise RuntimeError("Value is zstd-compressed but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(body).decode("utf-8")
+    if marker == RAW:
+        return body.decode("utf-8")
+    return value.decode("utf-8") # Legacy text converted to bytes by the migration
+
+
+def is_compressed(value) -> bool:
+    return isinstance(value, (bytes, bytearray, memoryview)) and bytes(value[:1]) in (RAW, ZLIB, ZSTD)
+
+
+class CompressedText(TypeDecorator):
+    """A str attribute stored as compressed bytes."""
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return compress_text(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return decompress_text(value)
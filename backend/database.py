@@ -1,8 +1,14 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+import asyncio
 import os
+import threading
+from typing import Optional
 from dotenv import load_dotenv
+from . import metrics
 
 load_dotenv()
 
@@ -10,9 +16,149 @@ load_dotenv()
 # SQLite Connection (Default for Cloud/Demo)
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./text_extractor.db")
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# Connection pool. Sync endpoints run in a threadpool of 40 workers; keep
+# pool_size + max_overflow above that plus the dispatcher and export threads,
+# or requests queue for a connection (and fail after DB_POOL_TIMEOUT).
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "50"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# MySQL drops idle connections after wait_timeout (8h by default)
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+# SQLite: WAL lets readers run alongside the (single) writer; with
+# synchronous=NORMAL a commit no longer fsyncs, only checkpoints do.
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+# Async engine for the hot endpoints (auth, document list/get/save, N8N
+# callback). Needs the dialect's async driver: aiosqlite, asyncmy or asyncpg.
+# Every other endpoint keeps using the sync engine.
+DATABASE_ASYNC = os.getenv("DATABASE_ASYNC", "false").lower() in ("1", "true", "yes")
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "mysql": "asyncmy", "postgresql": "asyncpg"}
+
+
+class PoolMetrics:
+    """Counters fed by pool events, for GET /database/stats."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.invalidated = 0
+        self.checked_out = 0
+        self.max_checked_out = 0
+
+    def attach(self, engine):
+        event.listen(engine, "connect", self._on_connect)
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "checkin", self._on_checkin)
+        event.listen(engine, "invalidate", self._on_invalidate)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.checked_out = max(self.checked_out - 1, 0)
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidated += 1
+
+    def stats(self, engine) -> dict:
+        pool = engine.pool
+        with self._lock:
+            stats = {
+                "dialect": engine.dialect.name,
+                "pool": type(pool).__name__,
+                "checked_out": self.checked_out,
+                "max_checked_out": self.max_checked_out,
+                "checkouts": self.checkouts,
+                "connects": self.connects,
+                "invalidated": self.invalidated,
+            }
+        if hasattr(pool, "size"):
+            stats.update(size=pool.size(), overflow=pool.overflow(), checked_in=pool.checkedin())
+        return stats
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+        if SQLITE_JOURNAL_MODE:
+            cursor.execute(f"PRAGMA journal_mode = {SQLITE_JOURNAL_MODE}")
+        if SQLITE_SYNCHRONOUS:
+            cursor.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+    finally:
+        cursor.close()
+
+
+def _engine_options(url) -> dict:
+    if url.get_backend_name() == "sqlite":
+        options = {"connect_args": {"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}}
+        if url.get_driver_name() == "pysqlite":
+            options["connect_args"]["check_same_thread"] = False
+        if url.database in (None, "", ":memory:"):
+            # Every connection would get its own empty in-memory database
+            options["poolclass"] = StaticPool
+        else:
+            options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+        return options
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+def create_db_engine(url: str = SQLALCHEMY_DATABASE_URL, metrics: Optional[PoolMetrics] = None):
+    """An engine with the pool and connection settings that suit the URL's dialect."""
+    parsed = make_url(url)
+    engine = create_engine(url, **_engine_options(parsed))
+    if parsed.get_backend_name() == "sqlite":
+        event.listen(engine, "connect", _set_sqlite_pragmas)
+    if metrics is not None:
+        metrics.attach(engine)
+    return engine
+
+
+def async_database_url(url: str) -> str:
+    """The same database with the dialect's async driver, e.g. sqlite+aiosqlite://."""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver known for {backend}")
+    return parsed.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}").render_as_string(hide_password=False)
+
+
+def create_async_db_engine(url: str = SQLALCHEMY_DATABASE_URL, metrics: Optional[PoolMetrics] = None):
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    parsed = make_url(async_database_url(url))
+    engine = create_async_engine(parsed, **_engine_options(parsed))
+    # Pool events are registered on the sync engine the async one wraps
+    if parsed.get_backend_name() == "sqlite":
+        event.listen(engine.sync_engine, "connect", _set_sqlite_pragmas)
+    if metrics is not None:
+        metrics.attach(engine.sync_engine)
+    return engine
+
+
+pool_metrics = PoolMetrics()
+engine = create_db_engine(SQLALCHEMY_DATABASE_URL, pool_metrics)
+metrics.instrument_engine(engine, "sync")
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -23,3 +169,57 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+
+async_pool_metrics = PoolMetrics()
+async_engine = None
+AsyncSessionLocal = None
+if DATABASE_ASYNC:
+    try:
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+        async_engine = create_async_db_engine(SQLALCHEMY_DATABASE_URL, async_pool_metrics)
+        metrics.instrument_engine(async_engine.sync_engine, "async")
+        # Objects stay usable after commit: attribute access can't lazily hit the database outside an await
+        AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    except (ImportError, ValueError) as e:
+        print(f"DATABASE_ASYNC is set but the async engine is unavailable ({e}), using the sync engine")
+        DATABASE_ASYNC = False
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def run_write(db, fn, *args):
+    """Run fn(session, *args), a write that commits, from an async endpoint.
+
+    MySQL/Postgres: on the request's AsyncSession through run_sync. SQLite
+    allows a single writer, and every statement of the transaction would wait
+    for a turn on a busy event loop while holding the write lock (autosaves
+    dropped from 13/s to under 2/s in bench_db_concurrency), so there the write
+    runs in a worker thread on the sync engine.
+    """
+    if async_engine.dialect.name != "sqlite":
+        return await db.run_sync(fn, *args)
+
+    def write():
+        # Returned objects stay readable after the session closes
+        with SessionLocal(expire_on_commit=False) as session:
+            return fn(session, *args)
+    return await asyncio.to_thread(write)
+
+
+def pool_stats() -> dict:
+    stats = pool_metrics.stats(engine)
+    if async_engine is not None:
+        stats["async"] = async_pool_metrics.stats(async_engine.sync_engine)
+    return stats
+
+
+def _pool_checked_out() -> dict:
+    values = {("sync",): pool_metrics.checked_out}
+    if async_engine is not None:
+        values[("async",)] = async_pool_metrics.checked_out
+    return values
+
+metrics.gauge("db_pool_connections_checked_out", "Connections currently checked out of the pool, by engine.", ("engine",), collect=_pool_checked_out)
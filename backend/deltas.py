@@ -0,0 +1,40 @@
+from typing import List, Optional
+
+# Editor autosave sends changes as Quill-style delta ops against the stored
+# corrected_html string:
+#   [{"retain": 120}, {"delete": 4}, {"insert": "<b>new</b>"}]
+# Anything after the last op is kept as is. Lengths count UTF-16 code units,
+# like JavaScript string lengths, so the browser can compute them directly.
+
+
+class DeltaError(Exception):
+    pass
+
+
+def apply_delta(base: Optional[str], ops: List[dict]) -> str:
+    source = (base or "").encode("utf-16-le")
+    out = []
+    position = 0  # In bytes of `source`, two per code unit
+
+    for op in ops:
+        if op.get("insert") is not None:
+            if not isinstance(op["insert"], str):
+                raise DeltaError("insert must be a string")
+            out.append(op["insert"].encode("utf-16-le", "surrogatepass"))
+            continue
+
+        count = op.get("retain") if op.get("retain") is not None else op.get("delete")
+        if not isinstance(count, int) or isinstance(count, bool) or count < 0:
+            raise DeltaError("retain/delete must be a non-negative integer")
+        end = position + count * 2
+        if end > len(source):
+            raise DeltaError("Delta is longer than the document")
+        if op.get("retain") is not None:
+            out.append(source[position:end])
+        position = end
+
+    out.append(source[position:])
+    try:
+        return b"".join(out).decode("utf-16-le")
+    except UnicodeDecodeError:
+        raise DeltaError("Delta splits a surrogate pair")
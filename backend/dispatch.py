@@ -0,0 +1,267 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func, insert, literal, select
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+from .database import SessionLocal
+from .models import Document, DispatchJob
+from . import metrics
+from .tasks import process_document_task, extract_document_task, set_status, DispatchError, N8N_CONCURRENCY
+
+load_dotenv()
+
+# Durable extraction dispatch.
+# Every upload writes a DispatchJob row in the same transaction as its
+# Document, and a small pool of worker threads sends due jobs to N8N (or
+# extracts them locally, see backend/extractors.py).
+# Jobs survive restarts, failed sends are retried with exponential backoff,
+# and a periodic sweep re-queues documents left behind by a crash.
+
+DISPATCH_MAX_ATTEMPTS = int(os.getenv("DISPATCH_MAX_ATTEMPTS", "5"))
+DISPATCH_BACKOFF_SECONDS = float(os.getenv("DISPATCH_BACKOFF_SECONDS", "2"))
+DISPATCH_BACKOFF_MAX_SECONDS = float(os.getenv("DISPATCH_BACKOFF_MAX_SECONDS", "300"))
+# Uploads are refused with 503 once this many jobs are waiting
+DISPATCH_MAX_PENDING = int(os.getenv("DISPATCH_MAX_PENDING", "1000"))
+DISPATCH_POLL_SECONDS = float(os.getenv("DISPATCH_POLL_SECONDS", "5"))
+DISPATCH_SWEEP_SECONDS = float(os.getenv("DISPATCH_SWEEP_SECONDS", "60"))
+# A job claimed longer ago than this is assumed to belong to a dead worker
+DISPATCH_STALE_SECONDS = float(os.getenv("DISPATCH_STALE_SECONDS", "120"))
+# Documents N8N accepted but never called back for are sent again (0 disables)
+DISPATCH_CALLBACK_TIMEOUT_SECONDS = float(os.getenv("DISPATCH_CALLBACK_TIMEOUT_SECONDS", "1800"))
+DISPATCH_MAX_REDISPATCH = int(os.getenv("DISPATCH_MAX_REDISPATCH", "1"))
+
+ACTIVE_STATUSES = ("pending", "in_flight")
+
+
+class DispatchQueueFull(Exception):
+    pass
+
+
+def backoff_delay(attempts: int) -> float:
+    return min(DISPATCH_BACKOFF_SECONDS * (2 ** max(attempts - 1, 0)), DISPATCH_BACKOFF_MAX_SECONDS)
+
+
+def pending_count(db: Session) -> int:
+    return db.query(func.count(DispatchJob.id)).filter(DispatchJob.status.in_(ACTIVE_STATUSES)).scalar()
+
+
+def check_capacity(db: Session, incoming: int = 1):
+    if pending_count(db) + incoming > DISPATCH_MAX_PENDING:
+        raise DispatchQueueFull()
+
+
+def new_job(doc_id: int, delay: float = 0) -> DispatchJob:
+    return DispatchJob(
+        document_id=doc_id,
+        status="pending",
+        attempts=0,
+        next_attempt_at=time.time() + delay,
+        created_at=str(datetime.utcnow()),
+    )
+
+
+def enqueue_documents(db: Session, *conditions, delay: float = 0) -> int:
+    """Queue a job for each document matching `conditions` that has no active job yet.
+
+    One INSERT ... SELECT, so the check and the insert are a single statement
+    and two sweeps (threads or processes) can't both queue the same document.
+    Returns the number of jobs added; they are sent once the caller commits.
+    """
+    active = select(DispatchJob.document_id).where(DispatchJob.status.in_(ACTIVE_STATUSES))
+    rows = select(
+        Document.id,
+        literal("pending"),
+        literal(0),
+        literal(time.time() + delay),
+        literal(str(datetime.utcnow())),
+    ).where(*conditions, ~Document.id.in_(active))
+    result = db.execute(insert(DispatchJob).from_select(["document_id", "status", "attempts", "next_attempt_at", "created_at"], rows))
+    return result.rowcount
+
+
+def enqueue(db: Session, doc_id: int, delay: float = 0):
+    """The document's active job, added unless it already has one."""
+    enqueue_documents(db, Document.id == doc_id, delay=delay)
+    return db.query(DispatchJob).filter(DispatchJob.document_id == doc_id, DispatchJob.status.in_(ACTIVE_STATUSES)).first()
+
+
+class Dispatcher:
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._sweep_lock = threading.Lock()
+        self._last_sweep = 0.0
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            self._stop.clear()
+            for i in range(self.concurrency):
+                thread = threading.Thread(target=self._run, name=f"dispatch-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout: float = 5):
+        self._stop.set()
+        self._wake.set()
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for thread in threads:
+            thread.join(timeout)
+
+    def wake(self):
+        self.start()
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self._sweep_due():
+                    recover()
+                if self._process_one():
+                    continue
+            except Exception as e:
+                print(f"Dispatch worker error: {e}")
+            self._wake.wait(DISPATCH_POLL_SECONDS)
+            self._wake.clear()
+
+    def _sweep_due(self) -> bool:
+        # Only one worker thread sweeps; the others see the new time and go on
+        with self._sweep_lock:
+            if time.time() - self._last_sweep < DISPATCH_SWEEP_SECONDS:
+                return False
+            self._last_sweep = time.time()
+            return True
+
+    def _claim(self, db: Session):
+        now = time.time()
+        candidates = (
+            db.query(DispatchJob.id)
+            .filter(DispatchJob.status == "pending", DispatchJob.next_attempt_at <= now)
+            .order_by(DispatchJob.next_attempt_at)
+            .limit(self.concurrency)
+            .all()
+        )
+        for (job_id,) in candidates:
+            # Conditional update so two workers (or processes) never claim the same job
+            claimed = (
+                db.query(DispatchJob)
+                .filter(DispatchJob.id == job_id, DispatchJob.status == "pending")
+                .update({"status": "in_flight", "claimed_at": now}, synchronize_session=False)
+            )
+            db.commit()
+            if claimed:
+                job = db.query(DispatchJob).filter(DispatchJob.id == job_id).first()
+                metrics.dispatch_wait_seconds.observe(max(now - (job.next_attempt_at or now), 0))
+                return job
+        return None
+
+    def _process_one(self) -> bool:
+        db = SessionLocal()
+        try:
+            job = self._claim(db)
+            if job is None:
+                return False
+
+            attempt = (job.attempts or 0) + 1
+            start = time.perf_counter()
+            try:
+                # Text-layer files are extracted here when EXTRACTOR_BACKEND=local; the rest go to N8N
+                if extract_document_task(job.document_id):
+                    outcome = "extracted"
+                else:
+                    process_document_task(job.document_id, final_attempt=attempt >= DISPATCH_MAX_ATTEMPTS)
+                    outcome = "sent"
+                job.status = "done"
+                job.last_error = None
+            except Exception as e:
+                if isinstance(e, DispatchError):
+                    job.last_error = f"{e.status}: {e}"[:1000]
+                else:
+                    # Anything else (a locked SQLite file, a crash in an extractor) is a failed attempt
+                    # too; otherwise the job sits in_flight until recover() re-queues it, forever
+                    print(f"Dispatch of document {job.document_id} failed: {e}")
+                    db.rollback()
+                    job.last_error = f"{type(e).__name__}: {e}"[:1000]
+                if attempt >= DISPATCH_MAX_ATTEMPTS:
+                    job.status = "failed"
+                    outcome = "failed"
+                    if not isinstance(e, DispatchError):
+                        # process_document_task only sets the status for DispatchError
+                        fail_document(job.document_id)
+                else:
+                    job.status = "pending"
+                    job.next_attempt_at = time.time() + backoff_delay(attempt)
+                    outcome = "retry"
+            metrics.dispatch_seconds.observe(time.perf_counter() - start, outcome)
+            metrics.dispatch_jobs.inc(outcome)
+            job.attempts = attempt
+            db.commit()
+            return True
+        finally:
+            db.close()
+
+
+def fail_document(doc_id: int):
+    """Show Error on a document whose last attempt failed, so recover() doesn't take it for orphaned."""
+    db = SessionLocal()
+    try:
+        doc = db.query(Document).filter(Document.id == doc_id).first()
+        if doc:
+            set_status(db, doc, "Error", from_statuses=("Processing",))
+    except Exception as e:
+        print(f"Marking document {doc_id} failed: {e}")
+    finally:
+        db.close()
+
+
+def recover():
+    """Re-queue work lost by a crash or a silent N8N failure."""
+    db = SessionLocal()
+    try:
+        now = time.time()
+        # Jobs whose worker died mid-send
+        db.query(DispatchJob).filter(
+            DispatchJob.status == "in_flight",
+            DispatchJob.claimed_at < now - DISPATCH_STALE_SECONDS,
+        ).update({"status": "pending", "next_attempt_at": now}, synchronize_session=False)
+
+        # Documents still "Processing" without any queued job (e.g. uploaded before a crash)
+        requeued = enqueue_documents(db, Document.status == "Processing")
+
+        # Documents N8N accepted but never called back for
+        if DISPATCH_CALLBACK_TIMEOUT_SECONDS > 0:
+            cutoff = str(datetime.utcnow() - timedelta(seconds=DISPATCH_CALLBACK_TIMEOUT_SECONDS))
+            sent = select(DispatchJob.document_id).where(DispatchJob.status == "done").group_by(DispatchJob.document_id).having(func.count(DispatchJob.id) > DISPATCH_MAX_REDISPATCH)
+            requeued += enqueue_documents(
+                db,
+                Document.status == "Sending to N8N...",
+                Document.updated_at < cutoff,
+                ~Document.id.in_(sent),
+            )
+
+        db.commit()
+        if requeued:
+            print(f"Dispatch recovery re-queued {requeued} document(s)")
+    finally:
+        db.close()
+
+
+dispatcher = Dispatcher(N8N_CONCURRENCY)
+
+
+def _queue_depth() -> dict:
+    db = SessionLocal()
+    try:
+        counts = dict(db.query(DispatchJob.status, func.count(DispatchJob.id)).filter(DispatchJob.status.in_(ACTIVE_STATUSES)).group_by(DispatchJob.status).all())
+    finally:
+        db.close()
+    return {(status,): counts.get(status, 0) for status in ACTIVE_STATUSES}
+
+metrics.gauge("dispatch_queue_depth", "Dispatch jobs waiting (pending) or being sent (in_flight).", ("status",), collect=_queue_depth)
@@ -0,0 +1,136 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Max number of pending events per connected client. When a slow client falls
+# behind, the oldest events are dropped (the dashboard only needs the latest status).
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "100"))
+
+# Optional broker for multi-worker deployments, e.g. redis://localhost:6379/1
+# Leave empty to keep events inside this process.
+EVENT_BROKER_URL = os.getenv("EVENT_BROKER_URL", "")
+EVENT_CHANNEL = os.getenv("EVENT_CHANNEL", "document-status")
+# Wait before reconnecting after the broker connection drops, doubling up to the max
+EVENT_BROKER_RETRY_SECONDS = float(os.getenv("EVENT_BROKER_RETRY_SECONDS", "1"))
+EVENT_BROKER_RETRY_MAX_SECONDS = float(os.getenv("EVENT_BROKER_RETRY_MAX_SECONDS", "30"))
+
+
+class Subscription:
+    def __init__(self, user_id: int, loop: asyncio.AbstractEventLoop):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=EVENT_QUEUE_SIZE)
+
+    def _put(self, event: dict):
+        # Runs on the subscriber's event loop
+        if self.queue.full():
+            try:
+                self.queue.get_nowait()
+            except asyncio.QueueEmpty:
+                pass
+        self.queue.put_nowait(event)
+
+    def deliver(self, event: dict):
+        # Safe to call from any thread (sync endpoints run in the threadpool)
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            pass  # Loop already closed, subscriber is gone
+
+
+class InProcessBroker:
+    """Fans events out to subscribers connected to this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}  # user_id -> set of Subscription
+
+    def subscribe(self, user_id: int) -> Subscription:
+        sub = Subscription(user_id, asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        with self._lock:
+            subs = self._subscribers.get(sub.user_id)
+            if subs:
+                subs.discard(sub)
+                if not subs:
+                    del self._subscribers[sub.user_id]
+
+    def publish(self, user_id: int, event: dict):
+        with self._lock:
+            subs = list(self._subscribers.get(user_id, ()))
+        for sub in subs:
+            sub.deliver(event)
+
+
+class RedisBroker(InProcessBroker):
+    """Publishes through Redis so every worker's subscribers receive the event."""
+
+    def __init__(self, url: str, channel: str):
+        super().__init__()
+        import redis  # Optional dependency, only needed for multi-worker setups
+
+        self._redis = redis.Redis.from_url(url)
+        self._channel = channel
+        self._listener = None
+
+    def _listen(self):
+        # Runs for the life of the process: a dropped connection is retried, otherwise
+        # this worker's subscribers would stop getting events for good
+        delay = EVENT_BROKER_RETRY_SECONDS
+        while True:
+            pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(self._channel)
+                delay = EVENT_BROKER_RETRY_SECONDS
+                for message in pubsub.listen():
+                    try:
+                        data = json.loads(message["data"])
+                        InProcessBroker.publish(self, data["user_id"], data["event"])
+                    except (ValueError, KeyError, TypeError) as e:
+                        print(f"Ignoring malformed status event: {e}")
+            except Exception as e:
+                print(f"Status event listener lost the broker, reconnecting in {delay:g}s: {e}")
+            finally:
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+            time.sleep(delay)
+            delay = min(delay * 2, EVENT_BROKER_RETRY_MAX_SECONDS)
+
+    def subscribe(self, user_id: int) -> Subscription:
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, daemon=True)
+                self._listener.start()
+        return super().subscribe(user_id)
+
+    def publish(self, user_id: int, event: dict):
+        self._redis.publish(self._channel, json.dumps({"user_id": user_id, "event": event}))
+
+
+def create_broker():
+    if EVENT_BROKER_URL:
+        return RedisBroker(EVENT_BROKER_URL, EVENT_CHANNEL)
+    return InProcessBroker()
+
+
+broker = create_broker()
+
+
+def publish_status(doc):
+    """Notify the document owner's open dashboards about a status change."""
+    try:
+        broker.publish(doc.user_id, {"doc_id": doc.id, "status": doc.status})
+    except Exception as e:
+        # Status notifications are best effort; clients fall back to polling
+        print(f"Failed to publish status for doc {doc.id}: {e}")
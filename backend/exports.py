@@ -0,0 +1,408 @@
+import hashlib
+import io
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+from xhtml2pdf import pisa
+from dotenv import load_dotenv
+from . import html_to_docx, metrics
+
+load_dotenv()
+
+# Rendered exports are kept on disk, keyed by document id + content hash + format
+EXPORT_CACHE_DIR = os.getenv("EXPORT_CACHE_DIR", "export_cache")
+EXPORT_CACHE_MAX_BYTES = int(os.getenv("EXPORT_CACHE_MAX_MB", "256")) * 1024 * 1024
+
+# Comma separated formats to render right after a save (e.g. "pdf,docx"), empty to disable
+EXPORT_PREWARM_FORMATS = [f.strip() for f in os.getenv("EXPORT_PREWARM", "").split(",") if f.strip()]
+
+# Rendering runs in worker processes so xhtml2pdf never holds the web worker's GIL
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "2"))
+EXPORT_MAX_JOBS_PER_USER = int(os.getenv("EXPORT_MAX_JOBS_PER_USER", "3"))
+EXPORT_JOB_TTL_SECONDS = int(os.getenv("EXPORT_JOB_TTL_SECONDS", "600"))
+
+
+class ExportError(Exception):
+    pass
+
+
+class TooManyExportJobs(Exception):
+    pass
+
+
+def export_source(doc) -> str:
+    return doc.corrected_html or doc.raw_text or ""
+
+
+def render_pdf(html_content: str, title: str) -> bytes:
+    # Wrap in basic HTML structure if missing
+    if "<html>" not in html_content:
+        html_content = f"<html><body>{html_content}</body></html>"
+
+    pdf_buffer = io.BytesIO()
+    pisa_status = pisa.CreatePDF(html_content, dest=pdf_buffer)
+    if pisa_status.err:
+        raise ExportError("Error generating PDF")
+    return pdf_buffer.getvalue()
+
+
+def render_docx(html_content: str, title: str) -> bytes:
+    docx_buffer = io.BytesIO()
+    try:
+        html_to_docx.convert([html_content], title, docx_buffer)
+    except Exception as e:
+        print(f"DOCX conversion failed: {e}")
+        raise ExportError("Error generating DOCX")
+    return docx_buffer.getvalue()
+
+
+RENDERERS = {
+    "pdf": render_pdf,
+    "docx": render_docx,
+}
+
+
+def content_hash(html_content: str, title: str) -> str:
+    digest = hashlib.sha256()
+    digest.update(title.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(html_content.encode("utf-8"))
+    return digest.hexdigest()[:32]
+
+
+class ExportCache:
+    """Size-bounded LRU of rendered exports stored as files in one directory."""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = None  # name -> size, least recently used first
+        self._total = 0
+
+    def _load(self):
+        # Rebuild the LRU order from file mtimes the first time the cache is used
+        if self._entries is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+        files.sort()
+        self._entries = OrderedDict((name, size) for _, name, size in files)
+        self._total = sum(self._entries.values())
+
+    @staticmethod
+    def _name(doc_id: int, digest: str, fmt: str) -> str:
+        return f"{doc_id}-{digest}.{fmt}"
+
+    def get(self, doc_id: int, digest: str, fmt: str) -> Optional[bytes]:
+        name = self._name(doc_id, digest, fmt)
+        path = os.path.join(self.directory, name)
+        with self._lock:
+            self._load()
+            if name not in self._entries:
+                return None
+            self._entries.move_to_end(name)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # Keep LRU order across restarts
+            return data
+        except OSError:
+            with self._lock:
+                self._total -= self._entries.pop(name, 0)
+            return None
+
+    def has(self, doc_id: int, digest: str, fmt: str) -> bool:
+        name = self._name(doc_id, digest, fmt)
+        with self._lock:
+            self._load()
+            return name in self._entries
+
+    def put(self, doc_id: int, digest: str, fmt: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        name = self._name(doc_id, digest, fmt)
+        path = os.path.join(self.directory, name)
+        with self._lock:
+            self._load()
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"Failed to cache export {name}: {e}")
+                return
+            self._total += len(data) - self._entries.pop(name, 0)
+            self._entries[name] = len(data)
+            self._evict()
+
+    def invalidate(self, doc_id: int):
+        self.invalidate_many([doc_id])
+
+    def invalidate_many(self, doc_ids):
+        # One pass over the entries however many documents changed
+        prefixes = tuple(f"{doc_id}-" for doc_id in doc_ids)
+        if not prefixes:
+            return
+        with self._lock:
+            self._load()
+            for name in [n for n in self._entries if n.startswith(prefixes)]:
+                self._remove(name)
+
+    def _remove(self, name: str):
+        self._total -= self._entries.pop(name, 0)
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except OSError:
+            pass
+
+    def _evict(self):
+        while self._total > self.max_bytes and self._entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+
+
+cache = ExportCache(EXPORT_CACHE_DIR, EXPORT_CACHE_MAX_BYTES)
+
+
+def _render(fmt: str, html_content: str, title: str) -> tuple:
+    # Entry point inside the worker process; timed here so queueing for a worker isn't counted
+    start = time.perf_counter()
+    data = RENDERERS[fmt](html_content, title)
+    return data, time.perf_counter() - start
+
+
+def _rendered(fmt: str, result: tuple) -> bytes:
+    data, seconds = result
+    metrics.export_render_seconds.observe(seconds, fmt)
+    return data
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=EXPORT_WORKERS)
+        return _executor
+
+
+def _replace_broken(executor: ProcessPoolExecutor):
+    # A worker that died (OOM kill, crash in the renderer) breaks the whole pool for good;
+    # drop it so the next get_executor() starts a new one
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False)
+
+
+def _submit(fmt: str, html_content: str, title: str) -> tuple:
+    """Submit a render; returns (executor, future). A broken pool is replaced and the submit retried once."""
+    executor = get_executor()
+    try:
+        return executor, executor.submit(_render, fmt, html_content, title)
+    except BrokenProcessPool:
+        _replace_broken(executor)
+    executor = get_executor()
+    return executor, executor.submit(_render, fmt, html_content, title)
+
+
+def render(fmt: str, html_content: str, title: str) -> bytes:
+    """Render in the pool and wait. A render lost to a dead worker is run once more on a new pool."""
+    for attempt in range(2):
+        executor, future = _submit(fmt, html_content, title)
+        try:
+            return _rendered(fmt, future.result())
+        except BrokenProcessPool:
+            _replace_broken(executor)
+    raise ExportError("Export worker stopped unexpectedly")
+
+
+def get_or_render(doc_id: int, html_content: str, title: str, fmt: str) -> bytes:
+    digest = content_hash(html_content, title)
+    data = cache.get(doc_id, digest, fmt)
+    metrics.export_cache.inc(fmt, "miss" if data is None else "hit")
+    if data is None:
+        # Blocks only this request's thread; the GIL-heavy work happens in the pool
+        data = render(fmt, html_content, title)
+        cache.put(doc_id, digest, fmt, data)
+    return data
+
+
+class ExportJob:
+    def __init__(self, user_id: int, doc_id: int, fmt: str, filename: str):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.doc_id = doc_id
+        self.format = fmt
+        self.filename = filename
+        self.status = "queued" # queued, done, error
+        self.error = None
+        self.result = None
+        self.digest = None # Set instead of result when the export was already cached
+        self.created = time.monotonic()
+        self.finished = None
+        self.source = None # (html_content, title) until finished, to run it again on a new pool
+        self.retried = False
+
+    def data(self) -> Optional[bytes]:
+        """The rendered file; None if it was a cache hit and has been evicted since."""
+        if self.result is not None:
+            return self.result
+        return cache.get(self.doc_id, self.digest, self.format) if self.digest else None
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "doc_id": self.doc_id,
+            "format": self.format,
+            "status": self.status,
+            "error": self.error,
+        }
+
+
+class ExportJobManager:
+    """Tracks asynchronous export jobs submitted to the render process pool."""
+
+    def __init__(self, max_jobs_per_user: int, ttl_seconds: int):
+        self.max_jobs_per_user = max_jobs_per_user
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._active = {}  # user_id -> number of unfinished jobs
+
+    def submit(self, user_id: int, doc_id: int, html_content: str, title: str, fmt: str) -> ExportJob:
+        self._prune()
+        job = ExportJob(user_id, doc_id, fmt, title)
+        digest = content_hash(html_content, title)
+
+        cached = cache.has(doc_id, digest, fmt)
+        metrics.export_cache.inc(fmt, "hit" if cached else "miss")
+        with self._lock:
+            if self._active.get(user_id, 0) >= self.max_jobs_per_user:
+                raise TooManyExportJobs()
+            if cached:
+                # Done at once; the job only points at the cache entry, it doesn't hold the bytes
+                job.status = "done"
+                job.digest = digest
+                job.finished = time.monotonic()
+                self._jobs[job.id] = job
+                return job
+            self._active[user_id] = self._active.get(user_id, 0) + 1
+            self._jobs[job.id] = job
+
+        job.source = (html_content, title)
+        try:
+            self._start(job, digest)
+        except Exception:
+            self._finish(job)
+            raise
+        return job
+
+    def _start(self, job: ExportJob, digest: str):
+        executor, future = _submit(job.format, *job.source)
+        future.add_done_callback(lambda f: self._on_done(job, digest, executor, f))
+
+    def _on_done(self, job: ExportJob, digest: str, executor: ProcessPoolExecutor, future):
+        try:
+            job.result = _rendered(job.format, future.result())
+            cache.put(job.doc_id, digest, job.format, job.result)
+            job.status = "done"
+        except BrokenProcessPool:
+            _replace_broken(executor)
+            if not job.retried:
+                # Lost with the worker that died, not because of this document: once more on a new pool
+                job.retried = True
+                try:
+                    self._start(job, digest)
+                    return
+                except Exception as e:
+                    job.error = str(e)
+            job.status = "error"
+            job.error = job.error or "Export worker stopped unexpectedly"
+        except Exception as e:
+            job.status = "error"
+            job.error = str(e) or "Error generating export"
+        self._finish(job)
+
+    def _finish(self, job: ExportJob):
+        with self._lock:
+            job.finished = time.monotonic()
+            job.source = None
+            remaining = self._active.get(job.user_id, 1) - 1
+            if remaining > 0:
+                self._active[job.user_id] = remaining
+            else:
+                self._active.pop(job.user_id, None)
+
+    def get(self, job_id: str, user_id: int) -> Optional[ExportJob]:
+        self._prune()
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None or job.user_id != user_id:
+            return None
+        return job
+
+    def _prune(self):
+        # Finished results are only kept long enough for the client to download them
+        cutoff = time.monotonic() - self.ttl_seconds
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items() if job.finished and job.finished < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def queue_depth(self) -> int:
+        with self._lock:
+            return sum(self._active.values())
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queue_depth": sum(self._active.values()),
+                "jobs_tracked": len(self._jobs),
+                "workers": EXPORT_WORKERS,
+                "max_jobs_per_user": self.max_jobs_per_user,
+            }
+
+
+jobs = ExportJobManager(EXPORT_MAX_JOBS_PER_USER, EXPORT_JOB_TTL_SECONDS)
+
+metrics.gauge("export_jobs_queue_depth", "Asynchronous export jobs not finished yet.", collect=lambda: {(): jobs.queue_depth()})
+
+
+def prewarm_exports(doc_id: int):
+    """Render the configured formats in the background so the next download is a cache hit."""
+    from .database import SessionLocal
+    from .models import Document
+
+    db = SessionLocal()
+    try:
+        doc = db.query(Document).filter(Document.id == doc_id).first()
+        if not doc:
+            return
+        html_content = export_source(doc)
+        title = doc.filename or "Document"
+    finally:
+        db.close()
+
+    for fmt in EXPORT_PREWARM_FORMATS:
+        if fmt not in RENDERERS:
+            continue
+        try:
+            get_or_render(doc_id, html_content, title, fmt)
+        except Exception as e:
+            print(f"Failed to pre-render {fmt} for doc {doc_id}: {e}")
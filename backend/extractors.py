@@ -0,0 +1,163 @@
+import html
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Local text extraction, as an alternative to the N8N round trip.
+# With EXTRACTOR_BACKEND=local the dispatcher first tries to read the text
+# straight from the stored upload (text-layer PDFs, DOCX, plain text), parsing
+# PDF and DOCX in worker processes. Files without usable text (scans, photos,
+# anything without an extractor) still go to N8N for OCR.
+
+EXTRACTOR_BACKEND = os.getenv("EXTRACTOR_BACKEND", "n8n") # n8n, local
+# Worker processes for PDF/DOCX parsing; 0 parses in the dispatcher thread
+# (no process hop, but the parsing then competes for the web worker's GIL).
+# The default leaves a core to the web worker, so a single-CPU host parses inline.
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", str(max(min(2, (os.cpu_count() or 1) - 1), 0))))
+EXTRACT_TIMEOUT_SECONDS = float(os.getenv("EXTRACT_TIMEOUT_SECONDS", "60"))
+# A PDF with less text than this per page is treated as a scan
+EXTRACT_MIN_CHARS_PER_PAGE = int(os.getenv("EXTRACT_MIN_CHARS_PER_PAGE", "25"))
+
+try:
+    import pypdf
+except ImportError:
+    pypdf = None
+
+try:
+    import docx
+except ImportError:
+    docx = None
+
+if EXTRACTOR_BACKEND not in ("n8n", "local"):
+    print(f"Unknown EXTRACTOR_BACKEND={EXTRACTOR_BACKEND}, using n8n")
+    EXTRACTOR_BACKEND = "n8n"
+
+
+class NeedsOCR(Exception):
+    pass
+
+
+def paragraphs_html(paragraphs) -> str:
+    return "".join(f"<p>{html.escape(p)}</p>" for p in paragraphs if p.strip())
+
+
+def extract_plain_text(path: str) -> tuple:
+    with open(path, "rb") as f:
+        data = f.read()
+    try:
+        text = data.decode("utf-8")
+    except UnicodeDecodeError:
+        text = data.decode("latin-1")
+    return text, paragraphs_html(text.splitlines())
+
+
+def extract_pdf(path: str) -> tuple:
+    if pypdf is None:
+        raise NeedsOCR("pypdf is not installed")
+    reader = pypdf.PdfReader(path)
+    pages = [page.extract_text() or "" for page in reader.pages]
+    if sum(len(page.strip()) for page in pages) < EXTRACT_MIN_CHARS_PER_PAGE * max(len(pages), 1):
+        raise NeedsOCR("No text layer")
+    text = "\n\n".join(page.strip() for page in pages)
+    return text, "".join(f'<div class="page">{paragraphs_html(page.splitlines())}</div>' for page in pages)
+
+
+def extract_docx(path: str) -> tuple:
+    if docx is None:
+        raise NeedsOCR("python-docx is not installed")
+    document = docx.Document(path)
+    lines, parts = [], []
+    for paragraph in document.paragraphs:
+        if not paragraph.text.strip():
+            continue
+        lines.append(paragraph.text)
+        style = paragraph.style.name if paragraph.style is not None else ""
+        level = style[len("Heading "):] if style.startswith("Heading ") else ""
+        tag = f"h{level}" if level in ("1", "2", "3") else "p"
+        parts.append(f"<{tag}>{html.escape(paragraph.text)}</{tag}>")
+    for table in document.tables:
+        rows = []
+        for row in table.rows:
+            cells = [cell.text for cell in row.cells]
+            lines.append("\t".join(cells))
+            rows.append("<tr>" + "".join(f"<td>{html.escape(cell)}</td>" for cell in cells) + "</tr>")
+        parts.append("<table>" + "".join(rows) + "</table>")
+    if not lines:
+        raise NeedsOCR("No text")
+    return "\n".join(lines), "".join(parts)
+
+
+# Extension -> extractor, each returns (raw_text, corrected_html) or raises NeedsOCR
+EXTRACTORS = {
+    ".txt": extract_plain_text,
+    ".md": extract_plain_text,
+    ".csv": extract_plain_text,
+    ".pdf": extract_pdf,
+    ".docx": extract_docx,
+}
+
+
+def extract_file(path: str) -> tuple:
+    # Entry point inside the worker process
+    extractor = EXTRACTORS.get(os.path.splitext(path)[1].lower())
+    if extractor is None:
+        raise NeedsOCR("No local extractor for this file type")
+    return extractor(path)
+
+
+# Cheap enough that the round trip to a worker process would cost more than the work
+INLINE_EXTENSIONS = {".txt", ".md", ".csv"}
+
+
+def can_extract(path: str) -> bool:
+    return os.path.splitext(path or "")[1].lower() in EXTRACTORS
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=EXTRACT_WORKERS)
+        return _executor
+
+
+def _replace_broken(executor: ProcessPoolExecutor):
+    # A worker that died breaks the pool for good; the next get_executor() starts a new one
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False)
+
+
+def extract(path: str) -> Optional[tuple]:
+    """(raw_text, corrected_html) for the stored file, or None when it has to go to N8N."""
+    if EXTRACTOR_BACKEND != "local" or not can_extract(path):
+        return None
+    try:
+        if EXTRACT_WORKERS <= 0 or os.path.splitext(path)[1].lower() in INLINE_EXTENSIONS:
+            return extract_file(path)
+        executor = get_executor()
+        try:
+            return executor.submit(extract_file, path).result(timeout=EXTRACT_TIMEOUT_SECONDS)
+        except BrokenProcessPool:
+            _replace_broken(executor)
+            raise
+    except NeedsOCR:
+        return None
+    except FutureTimeout:
+        print(f"Local extraction of {path} timed out, sending it to N8N")
+        return None
+    except Exception as e:
+        # Corrupt or encrypted files: N8N may still manage
+        print(f"Local extraction of {path} failed ({e}), sending it to N8N")
+        return None
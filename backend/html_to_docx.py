@@ -0,0 +1,346 @@
+import io
+import re
+import zipfile
+from html.parser import HTMLParser
+from typing import BinaryIO, Iterable
+from xml.sax.saxutils import escape
+from docx import Document as DocxDocument
+
+# Single-pass HTML -> DOCX conversion.
+# The HTML is fed to an incremental parser and every block is written exactly
+# once as WordprocessingML, straight into the zip entry for word/document.xml.
+# Nested markup costs linear time and neither the DOM nor a python-docx object
+# tree is ever built. Styles, numbering etc. come from python-docx's default
+# template, so the output matches what python-docx would produce.
+
+BLOCK_TAGS = {"p", "div", "h1", "h2", "h3", "h4", "h5", "h6", "li", "blockquote", "pre", "section", "article", "header", "footer"}
+LIST_TAGS = {"ul", "ol"}
+SKIP_TAGS = {"script", "style", "head", "title"}
+BOLD_TAGS = {"b", "strong"}
+ITALIC_TAGS = {"i", "em", "cite"}
+UNDERLINE_TAGS = {"u", "ins"}
+VOID_TAGS = {"br", "img", "hr", "meta", "link", "input", "col"}
+
+MAX_LIST_LEVEL = 3  # The default template ships "List Bullet" .. "List Bullet 3"
+WHITESPACE = re.compile(r"\s+")
+QUILL_INDENT = re.compile(r"ql-indent-(\d+)")
+INVALID_XML_CHARS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+DOCUMENT_XML = "word/document.xml"
+BODY_FLUSH_SIZE = 64 * 1024
+
+_template = None
+
+
+def _load_template():
+    # Parts of an empty python-docx document, split around the body content
+    global _template
+    if _template is None:
+        buffer = io.BytesIO()
+        DocxDocument().save(buffer)
+        with zipfile.ZipFile(buffer) as package:
+            parts = [(info.filename, package.read(info.filename)) for info in package.infolist()]
+        document_xml = dict(parts)[DOCUMENT_XML].decode("utf-8")
+        body_start = document_xml.index("<w:body>") + len("<w:body>")
+        body_end = document_xml.rindex("<w:sectPr")
+        _template = (parts, document_xml[:body_start], document_xml[body_end:])
+    return _template
+
+
+def _text_xml(text: str) -> str:
+    return f'<w:t xml:space="preserve">{escape(INVALID_XML_CHARS.sub("", text))}</w:t>'
+
+
+def _run_xml(text: str, fmt: tuple) -> str:
+    bold, italic, underline = fmt
+    props = ("<w:b/>" if bold else "") + ("<w:i/>" if italic else "") + ('<w:u w:val="single"/>' if underline else "")
+    props = f"<w:rPr>{props}</w:rPr>" if props else ""
+    body = "<w:br/>".join(_text_xml(piece) for piece in text.split("\n"))
+    return f"<w:r>{props}{body}</w:r>"
+
+
+def _paragraph_xml(style: str, runs: str) -> str:
+    props = f'<w:pPr><w:pStyle w:val="{style}"/></w:pPr>' if style else ""
+    return f"<w:p>{props}{runs}</w:p>"
+
+
+class _Table:
+    def __init__(self):
+        self.rows = []  # list of rows, each a list of cells, each a list of run XML
+
+    def start_row(self):
+        self.rows.append([])
+
+    def start_cell(self):
+        if not self.rows:
+            self.start_row()
+        self.rows[-1].append([])
+
+    def cell_has_content(self) -> bool:
+        return bool(self.rows and self.rows[-1] and self.rows[-1][-1])
+
+    def add_run(self, run_xml: str):
+        if not self.rows or not self.rows[-1]:
+            self.start_cell()
+        self.rows[-1][-1].append(run_xml)
+
+
+class DocxBuilder(HTMLParser):
+    def __init__(self, write):
+        super().__init__(convert_charrefs=True)
+        self.write = write  # Receives WordprocessingML fragments in document order
+        self.style = None  # Style of the paragraph being built
+        self.runs = []  # Finished run XML of the current paragraph
+        self.text = []  # Text pending for the current run
+        self.text_fmt = None
+        self.open = False
+        self.pending_style = None  # (kind, level) for the next paragraph
+        self.lists = []  # stack of "ul" / "ol"
+        self.items = []  # (kind, level) of each open <li>
+        self.bold = 0
+        self.italic = 0
+        self.underline = 0
+        self.skip = 0
+        self.pre = 0
+        self.table = None  # Buffered until </table>, rows need their column count
+        self.table_depth = 0
+        self.at_line_start = True
+
+    # --- paragraph management ---
+
+    def _flush_run(self):
+        if self.text:
+            self.runs.append(_run_xml("".join(self.text), self.text_fmt))
+            self.text = []
+
+    def _end_paragraph(self):
+        if self.open:
+            self._flush_run()
+            self.write(_paragraph_xml(self.style, "".join(self.runs)))
+            self.runs = []
+            self.open = False
+        self.at_line_start = True
+
+    def _end_block(self):
+        self._end_paragraph()
+        # Text after a nested list or paragraph belongs to the enclosing item again
+        self.pending_style = self.items[-1] if self.items else None
+
+    def _start_block(self, kind, level=0):
+        self._end_paragraph()
+        self.pending_style = (kind, level)
+
+    def _open_paragraph(self):
+        if self.open:
+            return
+        kind, level = self.pending_style or ("p", 0)
+        if kind == "h":
+            self.style = f"Heading{level}"
+        elif kind in LIST_TAGS:
+            base = "ListBullet" if kind == "ul" else "ListNumber"
+            self.style = base if level <= 1 else f"{base}{min(level, MAX_LIST_LEVEL)}"
+        elif kind == "blockquote":
+            self.style = "Quote"
+        else:
+            self.style = None
+        self.open = True
+
+    def _emit_text(self, text):
+        if not self.pre:
+            text = WHITESPACE.sub(" ", text)
+            if self.at_line_start:
+                text = text.lstrip()
+        if not text:
+            return
+        self.at_line_start = text.endswith("\n")
+
+        fmt = (self.bold > 0, self.italic > 0, self.underline > 0)
+        if self.table is not None:
+            self.table.add_run(_run_xml(text, fmt))
+            return
+
+        self._open_paragraph()
+        # Consecutive text with the same formatting is merged into one run
+        if fmt != self.text_fmt:
+            self._flush_run()
+            self.text_fmt = fmt
+        self.text.append(text)
+
+    def _line_break(self):
+        if self.table is not None:
+            self.table.add_run("<w:r><w:br/></w:r>")
+            return
+        self._open_paragraph()
+        self._flush_run()
+        self.runs.append("<w:r><w:br/></w:r>")
+        self.at_line_start = True
+
+    def _flush_table(self):
+        table, self.table = self.table, None
+        rows = [row for row in table.rows if row]
+        if not rows:
+            return
+        cols = max(len(row) for row in rows)
+        xml = ['<w:tbl><w:tblPr><w:tblStyle w:val="TableGrid"/><w:tblW w:type="auto" w:w="0"/></w:tblPr><w:tblGrid>']
+        xml.append("<w:gridCol/>" * cols)
+        xml.append("</w:tblGrid>")
+        for row in rows:
+            xml.append("<w:tr>")
+            for c in range(cols):
+                runs = "".join(row[c]) if c < len(row) else ""
+                xml.append(f'<w:tc><w:tcPr><w:tcW w:type="auto" w:w="0"/></w:tcPr><w:p>{runs}</w:p></w:tc>')
+            xml.append("</w:tr>")
+        xml.append("</w:tbl>")
+        self.write("".join(xml))
+        self.at_line_start = True
+
+    # --- parser callbacks ---
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self.skip += 1
+            return
+        if self.skip:
+            return
+
+        if tag == "table":
+            self.table_depth += 1
+            if self.table_depth == 1:
+                self._end_paragraph()
+                self.table = _Table()
+            return
+        if self.table is not None:
+            # Nested tables and block tags inside cells are flattened into the cell text
+            if self.table_depth == 1 and tag == "tr":
+                self.table.start_row()
+                self.at_line_start = True
+            elif self.table_depth == 1 and tag in ("td", "th"):
+                self.table.start_cell()
+                self.at_line_start = True
+                if tag == "th":
+                    self.bold += 1
+            elif tag == "br" or (tag in BLOCK_TAGS and self.table.cell_has_content()):
+                self._line_break()
+            self._inline_start(tag)
+            return
+
+        if tag in LIST_TAGS:
+            self.lists.append(tag)
+            self._end_paragraph()
+        elif tag == "li":
+            level = len(self.lists)
+            indent = QUILL_INDENT.search(dict(attrs).get("class") or "")
+            if indent:
+                level += int(indent.group(1))
+            self.items.append((self.lists[-1] if self.lists else "ul", max(level, 1)))
+            self._start_block(*self.items[-1])
+        elif len(tag) == 2 and tag[0] == "h" and tag[1].isdigit():
+            self._start_block("h", min(max(int(tag[1]), 1), 9))
+        elif tag in BLOCK_TAGS:
+            if tag == "pre":
+                self.pre += 1
+            # <li><p>..</p></li> keeps the bullet of the enclosing item
+            self._start_block(*(self.items[-1] if self.items else (tag, 0)))
+        elif tag == "br":
+            self._line_break()
+        else:
+            self._inline_start(tag)
+
+    def _inline_start(self, tag):
+        if tag in BOLD_TAGS:
+            self.bold += 1
+        elif tag in ITALIC_TAGS:
+            self.italic += 1
+        elif tag in UNDERLINE_TAGS:
+            self.underline += 1
+
+    def _inline_end(self, tag):
+        if tag in BOLD_TAGS:
+            self.bold = max(self.bold - 1, 0)
+        elif tag in ITALIC_TAGS:
+            self.italic = max(self.italic - 1, 0)
+        elif tag in UNDERLINE_TAGS:
+            self.underline = max(self.underline - 1, 0)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self.skip = max(self.skip - 1, 0)
+            return
+        if self.skip:
+            return
+
+        if tag == "table":
+            self.table_depth = max(self.table_depth - 1, 0)
+            if self.table_depth == 0 and self.table is not None:
+                self._flush_table()
+            return
+        if self.table is not None:
+            if tag == "th" and self.table_depth == 1:
+                self.bold = max(self.bold - 1, 0)
+            self._inline_end(tag)
+            return
+
+        if tag in LIST_TAGS:
+            if self.lists:
+                self.lists.pop()
+            self._end_block()
+        elif tag == "li":
+            if self.items:
+                self.items.pop()
+            self._end_block()
+        elif tag in BLOCK_TAGS or (len(tag) == 2 and tag[0] == "h" and tag[1].isdigit()):
+            if tag == "pre":
+                self.pre = max(self.pre - 1, 0)
+            self._end_block()
+        else:
+            self._inline_end(tag)
+
+    def handle_data(self, data):
+        if self.skip:
+            return
+        self._emit_text(data)
+
+    def close(self):
+        super().close()
+        if self.table is not None:
+            self._flush_table()
+        self._end_paragraph()
+
+
+def convert(chunks: Iterable[str], title: str, out: BinaryIO):
+    """Convert HTML (given as one or more chunks) to DOCX, streaming the package into `out`.
+
+    `out` only needs a write() method; the zip is written sequentially.
+    """
+    parts, body_head, body_tail = _load_template()
+
+    with zipfile.ZipFile(out, "w", compression=zipfile.ZIP_DEFLATED) as package:
+        for filename, data in parts:
+            if filename != DOCUMENT_XML:
+                package.writestr(filename, data)
+
+        with package.open(DOCUMENT_XML, "w") as document_xml:
+            pending = [body_head, _paragraph_xml("Title", _run_xml(title, (False, False, False)))]
+            size = 0
+
+            def write(fragment: str):
+                nonlocal size
+                pending.append(fragment)
+                size += len(fragment)
+                if size >= BODY_FLUSH_SIZE:
+                    document_xml.write("".join(pending).encode("utf-8"))
+                    pending.clear()
+                    size = 0
+
+            builder = DocxBuilder(write)
+            for chunk in chunks:
+                builder.feed(chunk)
+            builder.close()
+
+            pending.append(body_tail)
+            document_xml.write("".join(pending).encode("utf-8"))
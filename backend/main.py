@@ -1,35 +1,52 @@
-from fastapi import FastAPI, Depends, HTTPException, status, File, UploadFile, BackgroundTasks
-from pydantic import BaseModel
+from fastapi import FastAPI, Depends, HTTPException, status, File, UploadFile, BackgroundTasks, Response, Request
+from pydantic import BaseModel, ValidationError
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, StreamingResponse
-from sqlalchemy.orm import Session
-from . import models, schemas, database, auth
-from .tasks import process_document_task
-from datetime import datetime
+from fastapi.responses import FileResponse, StreamingResponse, JSONResponse, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session, load_only, selectinload, undefer_group
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import IntegrityError
+from . import models, schemas, database, auth, events, exports, dispatch, storage, search, deltas, versions, migrations, tasks, originals, pages, metrics, profiler, tags as tagging
+from datetime import datetime, timezone
 import os
-import shutil
+import hmac
 import uuid
-import io
-from xhtml2pdf import pisa
-from bs4 import BeautifulSoup
-from docx import Document as DocxDocument
+import mimetypes
+import json
+import asyncio
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional, List, Union
+from contextlib import asynccontextmanager
 
-# Create DB tables (simplest migration strategy for now)
+# Create missing tables, then bring existing ones up to date (see backend/migrations.py)
 models.Base.metadata.create_all(bind=database.engine)
+migrations.upgrade(database.engine)
 
-# Attempt migration for filename column (simple hack for dev)
-from sqlalchemy import text
-try:
-    with database.engine.connect() as conn:
-        conn.execute(text("ALTER TABLE documents ADD COLUMN filename VARCHAR(255)"))
-        conn.execute(text("UPDATE documents SET filename = SUBSTRING_INDEX(original_path, '/', -1)")) # Default older
-        conn.commit()
-except Exception as e:
-    pass # Column likely exists
+from sqlalchemy import func, select
 
-app = FastAPI(title="Secure Document Processor")
+# Picks FTS5 or the built-in index and creates its table, then fills it on first start
+search.get_backend()
+search.ensure_index()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Start sending queued documents to N8N; the first sweep re-queues anything a crash left behind
+    dispatch.dispatcher.start()
+    compaction = asyncio.create_task(compact_versions_periodically())
+    yield
+    compaction.cancel()
+    dispatch.dispatcher.stop()
+
+async def compact_versions_periodically():
+    if versions.VERSION_COMPACT_INTERVAL_SECONDS <= 0:
+        return
+    while True:
+        await asyncio.sleep(versions.VERSION_COMPACT_INTERVAL_SECONDS)
+        await run_in_threadpool(versions.run_compaction)
+
+app = FastAPI(title="Secure Document Processor", lifespan=lifespan)
 
 # CORS Setup
 app.add_middleware(
@@ -40,122 +57,942 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Multipart slack on top of the file itself
+app.add_middleware(
+    storage.UploadSizeLimitMiddleware,
+    max_body_bytes=storage.UPLOAD_MAX_BYTES + 64 * 1024,
+    path_limits={
+        "/upload_batches": storage.UPLOAD_BATCH_MAX_BYTES + storage.UPLOAD_BATCH_MAX_FILES * 1024,
+        "/n8n/callback/batch": tasks.N8N_CALLBACK_BATCH_MAX_BYTES,
+    },
+)
+
+# Outermost, so requests refused by the middlewares above are counted too
+app.add_middleware(metrics.MetricsMiddleware)
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+# For the file endpoints, which also accept a signed file key instead
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+def decode_user_id(token: str) -> Optional[int]:
     try:
         payload = auth.jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
         user_id: str = payload.get("sub")
         if user_id is None:
-            raise credentials_exception
-    except auth.JWTError:
-        raise credentials_exception
-    user = db.query(models.User).filter(models.User.id == int(user_id)).first()
+            return None
+        return int(user_id)
+    except (auth.JWTError, ValueError):
+        return None
+
+def credentials_error() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+# Both return a detached snapshot of the user (id, username, email) from
+# auth.token_cache; endpoints that change the user load it themselves.
+
+# A plain def, so the lookup runs in the threadpool rather than blocking the event loop
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
+    cached = auth.token_cache.get(token)
+    if cached is not None:
+        return cached
+    user_id = decode_user_id(token)
+    if user_id is None:
+        raise credentials_error()
+    user = db.query(models.User).filter(models.User.id == user_id).first()
     if user is None:
-        raise credentials_exception
-    return user
+        raise credentials_error()
+    return auth.token_cache.put(token, user)
+
+async def get_current_user_async(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(database.get_async_db)):
+    cached = auth.token_cache.get(token)
+    if cached is not None:
+        return cached
+    user_id = decode_user_id(token)
+    if user_id is None:
+        raise credentials_error()
+    user = (await db.execute(select(models.User).where(models.User.id == user_id))).scalar_one_or_none()
+    if user is None:
+        raise credentials_error()
+    return auth.token_cache.put(token, user)
 
-async def get_current_active_user(current_user: models.User = Depends(get_current_user)):
+# With DATABASE_ASYNC the hot endpoints below are registered as their *_async
+# twins, which share the request's AsyncSession with get_current_user_async.
+# The write paths reuse the sync code (search, versions) via database.run_write.
+def db_endpoint(sync_endpoint, async_endpoint):
+    return async_endpoint if database.DATABASE_ASYNC else sync_endpoint
+
+async def get_current_active_user(current_user: models.User = Depends(db_endpoint(get_current_user, get_current_user_async))):
     return current_user
 
+def document_cache_headers(doc_id: int, revision: Optional[int], updated_at: Optional[str], variant: str = "") -> dict:
+    headers = {
+        "ETag": f'"doc-{doc_id}-r{revision or 0}{variant}"',
+        "Cache-Control": "private, no-cache", # Always revalidate, but reuse on 304
+    }
+    if updated_at:
+        try:
+            modified = datetime.fromisoformat(updated_at).replace(tzinfo=timezone.utc)
+            headers["Last-Modified"] = format_datetime(modified, usegmt=True)
+        except ValueError:
+            pass
+    return headers
+
+def is_not_modified(request: Request, headers: dict) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or headers["ETag"] in tags or f"W/{headers['ETag']}" in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and "Last-Modified" in headers:
+        try:
+            return parsedate_to_datetime(headers["Last-Modified"]) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def is_conditional(request: Request) -> bool:
+    return "if-none-match" in request.headers or "if-modified-since" in request.headers
+
+def document_revision_query(doc_id: int, user_id: int):
+    # Only reads the revision columns, so a 304 never loads the document body
+    return select(models.Document.revision, models.Document.updated_at).where(models.Document.id == doc_id, models.Document.user_id == user_id)
+
+def not_modified_response(request: Request, doc_id: int, row, variant: str = "") -> Optional[Response]:
+    if not row:
+        raise HTTPException(status_code=404, detail="Document not found")
+    headers = document_cache_headers(doc_id, row.revision, row.updated_at, variant)
+    if is_not_modified(request, headers):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return None
+
+def check_document_not_modified(request: Request, doc_id: int, user_id: int, db: Session, variant: str = "") -> Optional[Response]:
+    if not is_conditional(request):
+        return None
+    return not_modified_response(request, doc_id, db.execute(document_revision_query(doc_id, user_id)).first(), variant)
+
+async def check_document_not_modified_async(request: Request, doc_id: int, user_id: int, db: AsyncSession, variant: str = "") -> Optional[Response]:
+    if not is_conditional(request):
+        return None
+    return not_modified_response(request, doc_id, (await db.execute(document_revision_query(doc_id, user_id))).first(), variant)
+
+def password_hasher_busy_error() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many sign-ins in progress, please retry shortly",
+        headers={"Retry-After": "5"},
+    )
+
+# signup and login are async so password hashing waits on auth.password_hasher's
+# pool instead of holding a request thread; their queries go to the threadpool.
 @app.post("/signup", response_model=schemas.UserResponse)
-def signup(user: schemas.UserCreate, db: Session = Depends(database.get_db)):
+async def signup(user: schemas.UserCreate, db: Session = Depends(database.get_db)):
     if user.security_code != auth.INTERNAL_SIGNUP_CODE:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Invalid Security Code. Only internal employees can sign up."
         )
 
-    db_user = db.query(models.User).filter(models.User.email == user.email).first()
+    db_user = await run_in_threadpool(lambda: db.query(models.User).filter(models.User.email == user.email).first())
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    hashed_password = auth.get_password_hash(user.password)
+    try:
+        hashed_password = await auth.password_hasher.hash(user.password)
+    except auth.PasswordHashBusy:
+        raise password_hasher_busy_error()
     new_user = models.User(username=user.username, email=user.email, hashed_password=hashed_password)
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-    return new_user
+
+    def save():
+        db.add(new_user)
+        db.commit()
+        db.refresh(new_user)
+        return schemas.UserResponse.model_validate(new_user)
+    return await run_in_threadpool(save)
 
 @app.post("/token", response_model=schemas.Token)
-def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.get_db)):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.get_db)):
     # The frontend code sends email in the 'username' field
-    user = db.query(models.User).filter(models.User.email == form_data.username).first()
-    if not user or not auth.verify_password(form_data.password, user.hashed_password):
+    user = await run_in_threadpool(lambda: db.query(models.User).filter(models.User.email == form_data.username).first())
+    valid, new_hash = False, None
+    if user:
+        try:
+            valid, new_hash = await auth.password_hasher.verify_and_update(form_data.password, user.hashed_password)
+        except auth.PasswordHashBusy:
+            raise password_hasher_busy_error()
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    user_id = user.id
+    if new_hash:
+        # Stored with older hashing parameters (see AUTH_HASH_ROUNDS)
+        user.hashed_password = new_hash
+        await run_in_threadpool(db.commit)
     
     access_token_expires = auth.timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = auth.create_access_token(
-        data={"sub": str(user.id)}, expires_delta=access_token_expires 
+        data={"sub": str(user_id)}, expires_delta=access_token_expires 
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
-@app.post("/upload_and_convert", status_code=status.HTTP_202_ACCEPTED)
-def upload_and_convert(background_tasks: BackgroundTasks, file: UploadFile = File(...), current_user: models.User = Depends(get_current_active_user), db: Session = Depends(database.get_db)):
-    file_id = str(uuid.uuid4())
-    extension = os.path.splitext(file.filename)[1]
-    file_location = f"uploads/{file_id}{extension}"
-    
-    os.makedirs("uploads", exist_ok=True)
-    
-    with open(file_location, "wb+") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
-    new_doc = models.Document(
-        user_id=current_user.id,
-        upload_date=str(datetime.utcnow()),
-        original_path=file_location,
-        filename=file.filename, 
-        status="Processing"
-    )
-    db.add(new_doc)
+def check_dispatch_capacity(db: Session, incoming: int = 1):
+    try:
+        dispatch.check_capacity(db, incoming)
+    except dispatch.DispatchQueueFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many documents waiting for processing, please retry shortly",
+            headers={"Retry-After": "30"},
+        )
+
+def find_extracted_duplicates(db: Session, user_id: int, content_hashes: list) -> dict:
+    """content_hash -> the newest Ready document with that upload, in one query."""
+    # Only the uploader's own documents: corrected_html may contain their manual edits
+    sources = db.query(models.Document).options(undefer_group("content")).filter(
+        models.Document.user_id == user_id,
+        models.Document.content_hash.in_(set(content_hashes)),
+        models.Document.status == "Ready",
+    ).order_by(models.Document.id).all()
+    return {doc.content_hash: doc for doc in sources}
+
+def create_uploaded_documents(db: Session, user_id: int, uploads: list, batch_id: Optional[str] = None) -> list:
+    """Documents for stored uploads ({"filename", "path", "size", "sha256"} each), in one transaction.
+
+    Unpins the uploads' blobs (see storage.store_blob) whether or not it succeeds.
+    """
+    try:
+        return _create_uploaded_documents(db, user_id, uploads, batch_id)
+    finally:
+        storage.release_blobs(upload["path"] for upload in uploads)
+
+def _create_uploaded_documents(db: Session, user_id: int, uploads: list, batch_id: Optional[str]) -> list:
+    now = str(datetime.utcnow())
+    # Same file extracted before: reuse the text instead of another N8N round trip
+    sources = find_extracted_duplicates(db, user_id, [upload["sha256"] for upload in uploads])
+
+    new_docs = []
+    for upload in uploads:
+        new_doc = models.Document(
+            user_id=user_id,
+            upload_date=now,
+            original_path=upload["path"],
+            filename=upload["filename"],
+            status="Processing",
+            content_hash=upload["sha256"],
+            file_size=upload["size"],
+            batch_id=batch_id,
+        )
+        source = sources.get(upload["sha256"])
+        if source:
+            new_doc.raw_text = source.raw_text
+            new_doc.corrected_html = source.corrected_html
+            new_doc.status = "Ready"
+        new_docs.append(new_doc)
+
+    db.add_all(new_docs)
+    db.flush() # One multi-row INSERT for the whole batch
+    queued = [doc.id for doc in new_docs if doc.status == "Processing"]
+    for doc in new_docs:
+        if doc.status == "Ready":
+            search.index_document(db, doc)
+            versions.record(db, doc, source="extraction")
+    # Same transaction, so a crash can't lose the jobs
+    db.add_all(dispatch.new_job(doc_id) for doc_id in queued)
     db.commit()
-    db.refresh(new_doc)
+    # Reloads every expired row in one SELECT instead of a refresh per document
+    db.query(models.Document).filter(models.Document.id.in_([doc.id for doc in new_docs])).all()
+    for doc in new_docs:
+        events.publish_status(doc)
 
-    background_tasks.add_task(process_document_task, new_doc.id)
+    if queued:
+        dispatch.dispatcher.wake()
+    return new_docs
 
+def create_uploaded_document(db: Session, user_id: int, filename: str, file_location: str, content_hash: str, file_size: int) -> models.Document:
+    upload = {"filename": filename, "path": file_location, "size": file_size, "sha256": content_hash}
+    return create_uploaded_documents(db, user_id, [upload])[0]
+
+@app.post("/upload_and_convert", status_code=status.HTTP_202_ACCEPTED)
+async def upload_and_convert(file: UploadFile = File(...), current_user: models.User = Depends(get_current_active_user), db: Session = Depends(database.get_db)):
+    # DB work goes to the threadpool; the file is streamed in large chunks with thread-offloaded writes
+    await run_in_threadpool(check_dispatch_capacity, db)
+
+    try:
+        file_location, file_size, content_hash = await storage.save_upload(file)
+    except storage.UploadTooLarge:
+        raise HTTPException(status_code=413, detail="Upload too large")
+
+    new_doc = await run_in_threadpool(create_uploaded_document, db, current_user.id, file.filename, file_location, content_hash, file_size)
     return {"message": "File uploaded and processing started", "document_id": new_doc.id}
 
-@app.get("/documents", response_model=list[schemas.DocumentResponse])
-def get_documents(skip: int = 0, limit: int = 100, current_user: models.User = Depends(get_current_active_user), db: Session = Depends(database.get_db)):
-    documents = db.query(models.Document).filter(models.Document.user_id == current_user.id).offset(skip).limit(limit).all()
+# Batch uploads: many files and/or zip archives in one multipart request
+# (repeat the "files" field). One transaction inserts every document and its
+# dispatch job; GET /upload_batches/{batch_id} reports the batch's progress.
+
+@app.post("/upload_batches", response_model=schemas.UploadBatchResponse, status_code=status.HTTP_202_ACCEPTED)
+async def upload_batch(files: List[UploadFile] = File(...), current_user: models.User = Depends(get_current_active_user), db: Session = Depends(database.get_db)):
+    if len(files) > storage.UPLOAD_BATCH_MAX_FILES:
+        raise HTTPException(status_code=413, detail=f"At most {storage.UPLOAD_BATCH_MAX_FILES} files per batch")
+    # Archives count as one file here; their entries are bounded by UPLOAD_BATCH_MAX_FILES
+    await run_in_threadpool(check_dispatch_capacity, db, len(files))
+
+    results = await storage.save_batch(files)
+    stored = [result for result in results if "error" not in result]
+    batch_id = uuid.uuid4().hex
+    if stored:
+        # Unpins the stored blobs whether or not the insert succeeds; save_batch() does if storing fails
+        new_docs = await run_in_threadpool(create_uploaded_documents, db, current_user.id, stored, batch_id)
+        for result, doc in zip(stored, new_docs):
+            result.update(document_id=doc.id, status=doc.status)
+    return {
+        "batch_id": batch_id,
+        "accepted": len(stored),
+        "rejected": len(results) - len(stored),
+        "files": results,
+    }
+
+# Anything that isn't still on its way through N8N or finished counts as failed
+BATCH_PENDING_STATUSES = ("Processing", "Sending to N8N...")
+
+@app.get("/upload_batches/{batch_id}", response_model=schemas.UploadBatchStatus)
+def get_upload_batch(batch_id: str, current_user: models.User = Depends(get_current_active_user), db: Session = Depends(database.get_db)):
+    counts = dict(
+        db.query(models.Document.status, func.count(models.Document.id))
+        .filter(models.Document.batch_id == batch_id, models.Document.user_id == current_user.id)
+        .group_by(models.Document.status)
+        .all()
+    )
+    if not counts:
+        raise HTTPException(status_code=404, detail="Upload batch not found")
+    processing = sum(counts.get(s, 0) for s in BATCH_PENDING_STATUSES)
+    ready = counts.get("Ready", 0)
+    total = sum(counts.values())
+    return {
+        "batch_id": batch_id,
+        "total": total,
+        "ready": ready,
+        "processing": processing,
+        "failed": total - ready - processing,
+        "statuses": counts,
+        "complete": processing == 0,
+    }
+
+# Resumable chunked uploads for large scans:
+# POST /upload_sessions, then PUT /upload_sessions/{id}?offset=N with raw bytes
+# (GET tells how much arrived after a dropped connection), then POST .../complete.
+
+def get_upload_session(upload_id: str, user_id: int) -> dict:
+    meta = storage.upload_sessions.get(upload_id, user_id)
+    if not meta:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return meta
+
+@app.post("/upload_sessions", response_model=schemas.UploadSessionResponse, status_code=status.HTTP_201_CREATED)
+def create_upload_session(session: schemas.UploadSessionCreate, current_user: models.User = Depends(get_current_active_user)):
+    try:
+        return storage.upload_sessions.create(current_user.id, session.filename, session.size)
+    except storage.UploadTooLarge:
+        raise HTTPException(status_code=413, detail="Upload too large")
+
+@app.get("/upload_sessions/{upload_id}", response_model=schemas.UploadSessionResponse)
+def get_upload_session_status(upload_id: str, current_user: models.User = Depends(get_current_active_user)):
+    return get_upload_session(upload_id, current_user.id)
+
+@app.put("/upload_sessions/{upload_id}", response_model=schemas.UploadSessionResponse)
+async def upload_session_chunk(upload_id: str, request: Request, offset: int = 0, current_user: models.User = Depends(get_current_active_user)):
+    async with storage.upload_sessions.locked(upload_id, current_user.id) as meta:
+        if not meta:
+            raise HTTPException(status_code=404, detail="Upload session not found")
+        try:
+            return await storage.upload_sessions.append(meta, offset, request.stream())
+        except storage.UploadOffsetMismatch as e:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Upload offset mismatch, resume at {e.expected}")
+        except storage.UploadTooLarge:
+            raise HTTPException(status_code=413, detail="Upload too large")
+
+@app.post("/upload_sessions/{upload_id}/complete", status_code=status.HTTP_202_ACCEPTED)
+async def complete_upload_session(upload_id: str, current_user: models.User = Depends(get_current_active_user), db: Session = Depends(database.get_db)):
+    async with storage.upload_sessions.locked(upload_id, current_user.id) as meta:
+        if not meta:
+            raise HTTPException(status_code=404, detail="Upload session not found")
+        await run_in_threadpool(check_dispatch_capacity, db)
+        try:
+            file_location, file_size, content_hash = await run_in_threadpool(storage.upload_sessions.complete, meta)
+        except storage.UploadOffsetMismatch as e:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Upload incomplete, resume at {e.expected}")
+
+    new_doc = await run_in_threadpool(create_uploaded_document, db, current_user.id, meta["filename"], file_location, content_hash, file_size)
+    return {"message": "File uploaded and processing started", "document_id": new_doc.id, "sha256": content_hash}
+
+@app.delete("/upload_sessions/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+def abort_upload_session(upload_id: str, current_user: models.User = Depends(get_current_active_user)):
+    storage.upload_sessions.abort(get_upload_session(upload_id, current_user.id))
+    return None
+
+def tag_filter(tags: Optional[str], match: str) -> Optional[List[str]]:
+    # ?tags=finance,2023&match=all|any
+    if match not in ("all", "any"):
+        raise HTTPException(status_code=400, detail="match must be 'all' or 'any'")
+    try:
+        names = tagging.normalize_names(tags.split(",")) if tags else []
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if len(names) > tagging.TAG_FILTER_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {tagging.TAG_FILTER_MAX} tags")
+    return names or None
+
+def documents_page_query(user_id: int, skip: int, limit: int, cursor: Optional[int], summary: bool, tag_names: Optional[List[str]] = None, match_all: bool = True):
+    query = select(models.Document).where(models.Document.user_id == user_id)
+    # The same value as Document.id; with tags, the one an index returns in order
+    key = models.Document.id
+    if tag_names:
+        query, key = tagging.filter_documents(query, user_id, tag_names, match_all)
+
+    # Summary mode only pulls the columns the dashboard table needs
+    if summary:
+        query = query.options(load_only(
+            models.Document.id,
+            models.Document.filename,
+            models.Document.status,
+            models.Document.upload_date,
+            models.Document.original_path,
+        ))
+    else:
+        query = query.options(undefer_group("content"))
+    # Load tags for the whole page in one extra query instead of one per row
+    query = query.options(selectinload(models.Document.tags)).order_by(key)
+
+    # Keyset pagination: pass the X-Next-Cursor header back as ?cursor=
+    if cursor is not None:
+        query = query.where(key > cursor)
+    else:
+        query = query.offset(skip)
+    return query.limit(limit)
+
+def documents_page(response: Response, documents: list, limit: int, summary: bool):
+    if len(documents) == limit:
+        response.headers["X-Next-Cursor"] = str(documents[-1].id)
+
+    if summary:
+        return [schemas.DocumentSummary.model_validate(doc) for doc in documents]
     return documents
 
-@app.get("/documents/{doc_id}", response_model=schemas.DocumentResponse)
-def get_document(doc_id: int, current_user: models.User = Depends(get_current_active_user), db: Session = Depends(database.get_db)):
-    doc = db.query(models.Document).filter(models.Document.id == doc_id, models.Document.user_id == current_user.id).first()
+def get_documents(response: Response, skip: int = 0, limit: int = 100, cursor: Optional[int] = None, summary: bool = False, tags: Optional[str] = None, match: str = "all", current_user: models.User = Depends(get_current_active_user), db: Session = Depends(database.get_db)):
+    query = documents_page_query(current_user.id, skip, limit, cursor, summary, tag_filter(tags, match), match == "all")
+    documents = db.execute(query).scalars().all()
+    return documents_page(response, documents, limit, summary)
+
+async def get_documents_async(response: Response, skip: int = 0, limit: int = 100, cursor: Optional[int] = None, summary: bool = False, tags: Optional[str] = None, match: str = "all", current_user: models.User = Depends(get_current_active_user), db: AsyncSession = Depends(database.get_async_db)):
+    query = documents_page_query(current_user.id, skip, limit, cursor, summary, tag_filter(tags, match), match == "all")
+    documents = (await db.execute(query)).scalars().all()
+    return documents_page(response, documents, limit, summary)
+
+app.get("/documents", response_model=Union[List[schemas.DocumentResponse], List[schemas.DocumentSummary]])(db_endpoint(get_documents, get_documents_async))
+
+def get_query_token_user(token: str):
+    # A Session only connects when queried, so a token cache hit costs no connection
+    with database.SessionLocal() as db:
+        return get_current_user(token, db)
+
+@app.get("/documents/events")
+async def document_events(request: Request, token: str):
+    # EventSource can't send an Authorization header, so the token comes in the query string.
+    # The lookup runs in the threadpool: a SQLite busy_timeout wait mustn't stall the event loop
+    user = await get_current_active_user(await run_in_threadpool(get_query_token_user, token))
+
+    async def stream():
+        sub = events.broker.subscribe(user.id)
+        try:
+            yield "retry: 5000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(sub.queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"  # Keeps proxies from closing an idle connection
+                    continue
+                yield f"event: status\ndata: {json.dumps(event)}\n\n"
+        finally:
+            events.broker.unsubscribe(sub)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/documents/search", response_model=List[schemas.SearchResultResponse])
+def search_documents(q: str, tags: Optional[str] = None, match: str = "all", limit: int = 20, offset: int = 0, current_user: models.User = Depends(get_current_active_user), db: Session = Depends(database.get_db)):
+    # ?q=invoice acme*  (trailing * = prefix)  &tags=finance,2023  &match=all|any
+    tag_names = tag_filter(tags, match)
+    limit = min(max(limit, 1), 100)
+
+    results = search.search(db, current_user.id, q, tag_names, match == "all", limit, max(offset, 0))
+    if not results:
+        return []
+
+    documents = db.query(models.Document).options(
+        load_only(models.Document.id, models.Document.filename, models.Document.status, models.Document.upload_date, models.Document.original_path),
+        selectinload(models.Document.tags),
+    ).filter(models.Document.id.in_([r.document_id for r in results]), models.Document.user_id == current_user.id).all()
+    by_id = {doc.id: doc for doc in documents}
+
+    response = []
+    for result in results:
+        doc = by_id.get(result.document_id)
+        if doc:
+            item = schemas.SearchResultResponse.model_validate(doc)
+            item.score = result.score
+            item.snippet = result.snippet
+            response.append(item)
+    return response
+
+@app.get("/documents/file_key", response_model=schemas.FileKeyResponse)
+def get_file_key(current_user: models.User = Depends(get_current_active_user)):
+    # For <img>/<iframe> URLs of the file endpoints below, which can't send the Authorization header
+    key, expires = originals.user_file_key(current_user.id)
+    return {"key": key, "expires": expires}
+
+def get_file_document(doc_id: int, key: Optional[str] = None, token: Optional[str] = Depends(optional_oauth2_scheme), db: Session = Depends(database.get_db)):
+    if token:
+        user_id = get_current_user(token, db).id
+    elif key:
+        if originals.key_scope(key) is None:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="File key is invalid or expired")
+        user_id = None
+    else:
+        raise credentials_error()
+
+    doc = db.query(models.Document).options(load_only(
+        models.Document.id,
+        models.Document.user_id,
+        models.Document.filename,
+        models.Document.original_path,
+        models.Document.content_hash,
+    )).filter(models.Document.id == doc_id).first()
+    allowed = doc is not None and (doc.user_id == user_id if token else originals.key_allows(key, doc.id, doc.user_id))
+    if not allowed:
+        raise HTTPException(status_code=404, detail="Document not found")
+    if not doc.original_path or not os.path.isfile(doc.original_path):
+        raise HTTPException(status_code=404, detail="Original file not found")
+    return doc
+
+# Range / If-Range are handled by FileResponse, which also hands the file to the
+# server (http.response.pathsend) when it supports that
+@app.api_route("/documents/{doc_id}/original", methods=["GET", "HEAD"])
+def get_original(request: Request, download: bool = False, doc: models.Document = Depends(get_file_document)):
+    headers = {"ETag": originals.file_etag(doc), "Cache-Control": originals.IMMUTABLE_CACHE_CONTROL}
+    if is_not_modified(request, headers):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    # By the stored path: the display name may have lost its extension
+    media_type = mimetypes.guess_type(doc.original_path)[0] or "application/octet-stream"
+    if originals.FILE_SENDFILE_HEADER:
+        return Response(media_type=media_type, headers={**headers, **originals.sendfile_headers(doc.original_path)})
+    return FileResponse(
+        doc.original_path,
+        media_type=media_type,
+        headers=headers,
+        filename=doc.filename or os.path.basename(doc.original_path),
+        content_disposition_type="attachment" if download else "inline",
+    )
+
+@app.get("/documents/{doc_id}/thumbnail")
+def get_thumbnail(request: Request, size: int = 192, doc: models.Document = Depends(get_file_document)):
+    size = originals.thumbnail_size(size)
+    headers = {"ETag": originals.file_etag(doc, f"-{size}"), "Cache-Control": originals.IMMUTABLE_CACHE_CONTROL}
+    if is_not_modified(request, headers):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    try:
+        path = originals.get_thumbnail(doc, size)
+    except originals.NoThumbnail:
+        # Let the browser remember, so the dashboard doesn't ask again on every load
+        raise HTTPException(status_code=404, detail="No thumbnail for this file", headers={"Cache-Control": "private, max-age=86400"})
+    return FileResponse(path, media_type="image/jpeg", headers=headers)
+
+def document_query(doc_id: int, user_id: int):
+    return select(models.Document).options(undefer_group("content"), selectinload(models.Document.tags)) \
+        .where(models.Document.id == doc_id, models.Document.user_id == user_id)
+
+def document_response(response: Response, doc: Optional[models.Document]) -> models.Document:
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
+    response.headers.update(document_cache_headers(doc.id, doc.revision, doc.updated_at))
     return doc
 
-from typing import Optional
+def get_document(doc_id: int, request: Request, response: Response, current_user: models.User = Depends(get_current_active_user), db: Session = Depends(database.get_db)):
+    not_modified = check_document_not_modified(request, doc_id, current_user.id, db)
+    if not_modified:
+        return not_modified
+    return document_response(response, db.execute(document_query(doc_id, current_user.id)).scalar_one_or_none())
+
+async def get_document_async(doc_id: int, request: Request, response: Response, current_user: models.User = Depends(get_current_active_user), db: AsyncSession = Depends(database.get_async_db)):
+    not_modified = await check_document_not_modified_async(request, doc_id, current_user.id, db)
+    if not_modified:
+        return not_modified
+    return document_response(response, (await db.execute(document_query(doc_id, current_user.id))).scalar_one_or_none())
+
+app.get("/documents/{doc_id}", response_model=schemas.DocumentResponse)(db_endpoint(get_document, get_document_async))
 
 class DocumentUpdate(BaseModel):
     corrected_html: Optional[str] = None
     filename: Optional[str] = None
+    base_revision: Optional[int] = None # content_revision the edit started from; 409 if content was saved since
 
-@app.put("/documents/{doc_id}", response_model=schemas.DocumentResponse)
-def update_document(doc_id: int, update_data: DocumentUpdate, current_user: models.User = Depends(get_current_active_user), db: Session = Depends(database.get_db)):
-    doc = db.query(models.Document).filter(models.Document.id == doc_id, models.Document.user_id == current_user.id).first()
+def document_saved(doc_id: int, background_tasks: BackgroundTasks):
+    exports.cache.invalidate(doc_id)
+    if exports.EXPORT_PREWARM_FORMATS:
+        background_tasks.add_task(exports.prewarm_exports, doc_id)
+
+def stale_revision_error(content_revision: int) -> HTTPException:
+    # The header is the content_revision a new base_revision has to match
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="Document was changed by another save, reload it",
+        headers={"X-Document-Revision": str(content_revision)},
+    )
+
+def save_document(db: Session, doc_id: int, user_id: int, update_data: DocumentUpdate):
+    """Full save (PUT). Returns the document and whether anything was written."""
+    doc = db.query(models.Document).filter(models.Document.id == doc_id, models.Document.user_id == user_id).first()
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
+    base_revision = update_data.base_revision
+    if base_revision is not None and base_revision != (doc.content_revision or 0):
+        raise stale_revision_error(doc.content_revision or 0)
     
-    if update_data.corrected_html is not None:
+    changed = False
+    if update_data.corrected_html is not None and update_data.corrected_html != doc.corrected_html:
         doc.corrected_html = update_data.corrected_html
-    if update_data.filename is not None:
+        doc.page_count = None
+        changed = True
+    if update_data.filename is not None and update_data.filename != doc.filename:
         doc.filename = update_data.filename
+        search.index_document(db, doc) # Only the filename is indexed from here; raw_text is N8N's
+        changed = True
+    if not changed:
+        return doc, False # Nothing to write
+    doc.touch(content=True)
+    db.flush()
+    # Another save that got in after the read above has bumped content_revision past ours
+    if base_revision is not None and doc.content_revision != base_revision + 1:
+        db.rollback()
+        current = db.query(models.Document.content_revision).filter(models.Document.id == doc_id).scalar()
+        raise stale_revision_error(current or 0)
+    if update_data.corrected_html is not None:
+        versions.record(db, doc)
         
     db.commit()
     db.refresh(doc)
+    return doc, True
+
+def update_document(doc_id: int, update_data: DocumentUpdate, background_tasks: BackgroundTasks, current_user: models.User = Depends(get_current_active_user), db: Session = Depends(database.get_db)):
+    doc, changed = save_document(db, doc_id, current_user.id, update_data)
+    if changed:
+        document_saved(doc.id, background_tasks)
+    return doc
+
+async def update_document_async(doc_id: int, update_data: DocumentUpdate, background_tasks: BackgroundTasks, current_user: models.User = Depends(get_current_active_user), db: AsyncSession = Depends(database.get_async_db)):
+    def save(sync_db: Session):
+        doc, changed = save_document(sync_db, doc_id, current_user.id, update_data)
+        # Serialized here, where lazy loads can still reach the database
+        return schemas.DocumentResponse.model_validate(doc), changed
+    doc, changed = await database.run_write(db, save)
+    if changed:
+        document_saved(doc.id, background_tasks)
+    return doc
+
+app.put("/documents/{doc_id}", response_model=schemas.DocumentResponse)(db_endpoint(update_document, update_document_async))
+
+def content_revision_values(content_revision: int) -> dict:
+    # revision is incremented in SQL: tags bump it without touching content_revision
+    return {
+        "content_revision": content_revision + 1,
+        "revision": models.Document.revision + 1,
+        "updated_at": str(datetime.utcnow()),
+    }
+
+def apply_document_patch(db: Session, doc_id: int, user_id: int, patch: schemas.DocumentPatch) -> dict:
+    # Autosave: apply delta ops to corrected_html instead of re-sending the whole document
+    doc = db.query(models.Document).options(load_only(
+        models.Document.id,
+        models.Document.user_id,
+        models.Document.filename,
+        models.Document.corrected_html,
+        models.Document.revision,
+        models.Document.content_revision,
+        models.Document.updated_at,
+    )).filter(models.Document.id == doc_id, models.Document.user_id == user_id).first()
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    # Checked against the content only: tagging or a status change in between doesn't conflict
+    content_revision = doc.content_revision or 0
+    if patch.base_revision != content_revision:
+        raise stale_revision_error(content_revision)
+
+    try:
+        new_html = deltas.apply_delta(doc.corrected_html, [op.model_dump(exclude_none=True) for op in patch.ops])
+    except deltas.DeltaError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    values = {}
+    if new_html != (doc.corrected_html or ""):
+        values["corrected_html"] = new_html
+        values["page_count"] = None
+    if patch.filename is not None and patch.filename != doc.filename:
+        values["filename"] = patch.filename
+    if not values:
+        return {"id": doc.id, "revision": doc.revision, "content_revision": content_revision, "updated_at": doc.updated_at, "changed": False}
+
+    values.update(content_revision_values(content_revision))
+    # Only succeeds if nobody saved content since we read the row
+    updated = db.query(models.Document).filter(
+        models.Document.id == doc.id,
+        models.Document.content_revision == doc.content_revision,
+    ).update(values, synchronize_session="fetch")
+    if not updated:
+        db.rollback()
+        current = db.query(models.Document.content_revision).filter(models.Document.id == doc.id).scalar()
+        raise stale_revision_error(current or 0)
+
+    if "filename" in values:
+        search.index_document(db, doc)
+    if "corrected_html" in values:
+        versions.record(db, doc)
+    db.commit()
+    return {"id": doc.id, "revision": doc.revision, "content_revision": doc.content_revision, "updated_at": doc.updated_at, "changed": True}
+
+def patch_document(doc_id: int, patch: schemas.DocumentPatch, background_tasks: BackgroundTasks, current_user: models.User = Depends(get_current_active_user), db: Session = Depends(database.get_db)):
+    result = apply_document_patch(db, doc_id, current_user.id, patch)
+    if result["changed"]:
+        document_saved(doc_id, background_tasks)
+    return result
+
+async def patch_document_async(doc_id: int, patch: schemas.DocumentPatch, background_tasks: BackgroundTasks, current_user: models.User = Depends(get_current_active_user), db: AsyncSession = Depends(database.get_async_db)):
+    result = await database.run_write(db, apply_document_patch, doc_id, current_user.id, patch)
+    if result["changed"]:
+        document_saved(doc_id, background_tasks)
+    return result
+
+app.patch("/documents/{doc_id}", response_model=schemas.DocumentPatchResponse)(db_endpoint(patch_document, patch_document_async))
+
+# Page-level access for long documents (see backend/pages.py): the editor loads
+# a few pages at a time and autosaves only the pages that changed.
+
+def pages_variant(start: int, count: int) -> str:
+    return f"-pages{start}-{count}"
+
+def clamp_page_range(start: int, count: int) -> tuple:
+    return max(start, 1), min(max(count, 1), pages.DOCUMENT_PAGES_MAX_FETCH)
+
+def read_document_pages(db: Session, doc_id: int, user_id: int, start: int, count: int) -> schemas.DocumentPagesResponse:
+    for attempt in range(2):
+        doc = db.query(models.Document).options(load_only(
+            models.Document.id,
+            models.Document.user_id,
+            models.Document.filename,
+            models.Document.original_path,
+            models.Document.revision,
+            models.Document.content_revision,
+            models.Document.updated_at,
+            models.Document.page_count,
+        )).filter(models.Document.id == doc_id, models.Document.user_id == user_id).first()
+        if not doc:
+            raise HTTPException(status_code=404, detail="Document not found")
+        split = doc.page_count is None
+        try:
+            rows = pages.page_range(db, doc, start, count)
+            result = schemas.DocumentPagesResponse(
+                id=doc.id,
+                filename=doc.filename,
+                original_path=doc.original_path,
+                revision=doc.revision,
+                content_revision=doc.content_revision,
+                page_count=doc.page_count,
+                pages=[schemas.DocumentPageResponse(number=page.page_number, html=page.html, revision=page.revision) for page in rows],
+            )
+            if split:
+                db.commit()
+            return result
+        except IntegrityError:
+            # Another request split the same document first; read its pages
+            db.rollback()
+    raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Document pages are being rebuilt, retry")
+
+def get_document_pages(doc_id: int, request: Request, response: Response, start: int = 1, count: int = 10, current_user: models.User = Depends(get_current_active_user), db: Session = Depends(database.get_db)):
+    start, count = clamp_page_range(start, count)
+    not_modified = check_document_not_modified(request, doc_id, current_user.id, db, variant=pages_variant(start, count))
+    if not_modified:
+        return not_modified
+    result = read_document_pages(db, doc_id, current_user.id, start, count)
+    response.headers.update(document_cache_headers(result.id, result.revision, None, pages_variant(start, count)))
+    return result
+
+async def get_document_pages_async(doc_id: int, request: Request, response: Response, start: int = 1, count: int = 10, current_user: models.User = Depends(get_current_active_user), db: AsyncSession = Depends(database.get_async_db)):
+    start, count = clamp_page_range(start, count)
+    not_modified = await check_document_not_modified_async(request, doc_id, current_user.id, db, variant=pages_variant(start, count))
+    if not_modified:
+        return not_modified
+    # May split the pages, so it runs as a write
+    result = await database.run_write(db, read_document_pages, doc_id, current_user.id, start, count)
+    response.headers.update(document_cache_headers(result.id, result.revision, None, pages_variant(start, count)))
+    return result
+
+app.get("/documents/{doc_id}/pages", response_model=schemas.DocumentPagesResponse)(db_endpoint(get_document_pages, get_document_pages_async))
+
+PAGE_SAVE_ATTEMPTS = 3
+
+def save_document_pages(db: Session, doc_id: int, user_id: int, update: schemas.DocumentPagesUpdate) -> dict:
+    """Apply page edits, then rebuild corrected_html from the pages.
+
+    Each page is checked against its own revision, so saves of different pages
+    (from two tabs, say) don't conflict; a save that lost the race for the
+    document row, or for splitting its pages, is redone on top of the other one.
+    """
+    for attempt in range(PAGE_SAVE_ATTEMPTS):
+        doc = db.query(models.Document).options(load_only(
+            models.Document.id,
+            models.Document.user_id,
+            models.Document.filename,
+            models.Document.revision,
+            models.Document.content_revision,
+            models.Document.updated_at,
+            models.Document.page_count,
+        )).filter(models.Document.id == doc_id, models.Document.user_id == user_id).first()
+        if not doc:
+            raise HTTPException(status_code=404, detail="Document not found")
+
+        content_revision = doc.content_revision or 0
+        try:
+            by_number = pages.pages_by_number(db, doc, {page_update.number for page_update in update.pages})
+        except IntegrityError:
+            # Another request split the same document first; redo the save on its pages
+            db.rollback()
+            continue
+        new_html, stale = {}, []
+        for page_update in update.pages:
+            page = by_number.get(page_update.number)
+            if page is None:
+                raise HTTPException(status_code=404, detail=f"Page {page_update.number} not found")
+            if page.revision != page_update.base_revision:
+                stale.append(page_update.number)
+                continue
+            if page_update.html is not None:
+                html = page_update.html
+            else:
+                try:
+                    html = deltas.apply_delta(page.html, [op.model_dump(exclude_none=True) for op in page_update.ops or []])
+                except deltas.DeltaError as e:
+                    raise HTTPException(status_code=422, detail=f"Page {page_update.number}: {e}")
+            if html != page.html:
+                new_html[page.page_number] = html
+        if stale:
+            db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Pages {', '.join(map(str, stale))} were changed by another save, reload them",
+                headers={"X-Document-Revision": str(content_revision)},
+            )
+
+        values = {}
+        if new_html:
+            values["corrected_html"] = pages.replace_pages(db, doc, new_html)
+            for number, html in new_html.items():
+                by_number[number].html = html
+                by_number[number].size = len(html)
+                by_number[number].revision = content_revision + 1
+        if update.filename is not None and update.filename != doc.filename:
+            values["filename"] = update.filename
+        if not values:
+            db.commit() # Keeps the pages if they were just split
+            return {"id": doc.id, "revision": doc.revision, "content_revision": content_revision, "updated_at": doc.updated_at, "changed": False, "pages": []}
+
+        values.update(content_revision_values(content_revision))
+        updated = db.query(models.Document).filter(
+            models.Document.id == doc.id,
+            models.Document.content_revision == doc.content_revision,
+        ).update(values, synchronize_session="fetch")
+        if not updated:
+            db.rollback()
+            continue
+
+        if "filename" in values:
+            search.index_document(db, doc)
+        if "corrected_html" in values:
+            versions.record(db, doc)
+        db.commit()
+        return {
+            "id": doc.id,
+            "revision": doc.revision,
+            "content_revision": doc.content_revision,
+            "updated_at": doc.updated_at,
+            "changed": True,
+            "pages": [{"number": number, "revision": doc.content_revision} for number in sorted(new_html)],
+        }
+
+    current = db.query(models.Document.content_revision).filter(models.Document.id == doc_id).scalar()
+    raise stale_revision_error(current or 0)
+
+def update_document_pages(doc_id: int, update: schemas.DocumentPagesUpdate, background_tasks: BackgroundTasks, current_user: models.User = Depends(get_current_active_user), db: Session = Depends(database.get_db)):
+    result = save_document_pages(db, doc_id, current_user.id, update)
+    if result["changed"]:
+        document_saved(doc_id, background_tasks)
+    return result
+
+async def update_document_pages_async(doc_id: int, update: schemas.DocumentPagesUpdate, background_tasks: BackgroundTasks, current_user: models.User = Depends(get_current_active_user), db: AsyncSession = Depends(database.get_async_db)):
+    result = await database.run_write(db, save_document_pages, doc_id, current_user.id, update)
+    if result["changed"]:
+        document_saved(doc_id, background_tasks)
+    return result
+
+app.put("/documents/{doc_id}/pages", response_model=schemas.DocumentPagesSaveResponse)(db_endpoint(update_document_pages, update_document_pages_async))
+
+def get_owned_document_id(db: Session, doc_id: int, user_id: int) -> int:
+    if not db.query(models.Document.id).filter(models.Document.id == doc_id, models.Document.user_id == user_id).first():
+        raise HTTPException(status_code=404, detail="Document not found")
+    return doc_id
+
+@app.get("/documents/{doc_id}/versions", response_model=List[schemas.DocumentVersionResponse])
+def list_document_versions(doc_id: int, current_user: models.User = Depends(get_current_active_user), db: Session = Depends(database.get_db)):
+    get_owned_document_id(db, doc_id, current_user.id)
+    return versions.list_versions(db, doc_id)
+
+@app.get("/documents/{doc_id}/versions/{version_number}", response_model=schemas.DocumentVersionContent)
+def get_document_version(doc_id: int, version_number: int, current_user: models.User = Depends(get_current_active_user), db: Session = Depends(database.get_db)):
+    get_owned_document_id(db, doc_id, current_user.id)
+    version = db.query(models.DocumentVersion).filter(models.DocumentVersion.document_id == doc_id, models.DocumentVersion.version_number == version_number).first()
+    if not version:
+        raise HTTPException(status_code=404, detail="Version not found")
+    return schemas.DocumentVersionContent(
+        **schemas.DocumentVersionResponse.model_validate(version).model_dump(),
+        corrected_html=versions.content_at(db, doc_id, version_number),
+    )
+
+@app.post("/documents/{doc_id}/versions/{version_number}/restore", response_model=schemas.DocumentResponse)
+def restore_document_version(doc_id: int, version_number: int, background_tasks: BackgroundTasks, current_user: models.User = Depends(get_current_active_user), db: Session = Depends(database.get_db)):
+    doc = db.query(models.Document).filter(models.Document.id == doc_id, models.Document.user_id == current_user.id).first()
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+    try:
+        html = versions.content_at(db, doc_id, version_number)
+    except versions.VersionNotFound:
+        raise HTTPException(status_code=404, detail="Version not found")
+
+    # Restoring adds a new version, so the content it replaces stays in the history
+    doc.corrected_html = html
+    doc.page_count = None
+    doc.touch(content=True)
+    versions.record(db, doc, source="restore")
+    db.commit()
+    db.refresh(doc)
+    document_saved(doc.id, background_tasks)
     return doc
 
 @app.delete("/documents/{doc_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -164,14 +1001,24 @@ def delete_document(doc_id: int, current_user: models.User = Depends(get_current
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    if doc.original_path and os.path.exists(doc.original_path):
-        try:
-            os.remove(doc.original_path)
-        except OSError as e:
-            print(f"Error checking file: {e}") 
-    
+    original_path = doc.original_path
+    thumbnails = originals.file_id(doc) if original_path else None
+
+    search.remove_document(db, doc.id)
+    versions.delete_versions(db, doc.id)
+    pages.delete_pages(db, doc.id)
     db.delete(doc)
     db.commit()
+    exports.cache.invalidate(doc_id)
+
+    # Uploads are content-addressed, so the file is only removed with its last reference.
+    # Counted after the commit and under the blob lock, so an upload of the same content
+    # either still finds the file pinned or stores it again
+    def references() -> int:
+        return db.query(func.count(models.Document.id)).filter(models.Document.original_path == original_path).scalar()
+
+    if original_path and storage.remove_unused_blob(original_path, references):
+        originals.remove_thumbnails(thumbnails)
     return None
 
 # User Profile Routes
@@ -179,74 +1026,148 @@ def delete_document(doc_id: int, current_user: models.User = Depends(get_current
 async def read_users_me(current_user: models.User = Depends(get_current_active_user)):
     return current_user
 
-@app.put("/users/me", response_model=schemas.UserResponse)
-async def update_user_me(user_update: schemas.UserUpdate, current_user: models.User = Depends(get_current_active_user), db: Session = Depends(database.get_db)):
-    if user_update.email and user_update.email != current_user.email:
+def update_user_me(user_update: schemas.UserUpdate, current_user: models.User = Depends(get_current_active_user), db: Session = Depends(database.get_db)):
+    user = db.query(models.User).filter(models.User.id == current_user.id).first() # current_user is a cached snapshot
+    if user is None:
+        raise credentials_error()
+    if user_update.email and user_update.email != user.email:
         db_user = db.query(models.User).filter(models.User.email == user_update.email).first()
         if db_user:
             raise HTTPException(status_code=400, detail="Email already registered")
-        current_user.email = user_update.email
+        user.email = user_update.email
     
     if user_update.username:
-        current_user.username = user_update.username
+        user.username = user_update.username
         
     if user_update.password:
-        current_user.hashed_password = auth.get_password_hash(user_update.password)
+        try:
+            user.hashed_password = auth.password_hasher.hash_sync(user_update.password)
+        except auth.PasswordHashBusy:
+            raise password_hasher_busy_error()
         
     db.commit()
-    db.refresh(current_user)
-    return current_user
+    db.refresh(user)
+    auth.token_cache.invalidate_user(user.id)
+    return user
+
+async def update_user_me_async(user_update: schemas.UserUpdate, current_user: models.User = Depends(get_current_active_user), db: AsyncSession = Depends(database.get_async_db)):
+    user = await db.get(models.User, current_user.id) # current_user is a cached snapshot
+    if user is None:
+        raise credentials_error()
+    if user_update.email and user_update.email != user.email:
+        db_user = (await db.execute(select(models.User.id).where(models.User.email == user_update.email))).first()
+        if db_user:
+            raise HTTPException(status_code=400, detail="Email already registered")
+        user.email = user_update.email
+
+    if user_update.username:
+        user.username = user_update.username
+
+    if user_update.password:
+        try:
+            user.hashed_password = await auth.password_hasher.hash(user_update.password)
+        except auth.PasswordHashBusy:
+            raise password_hasher_busy_error()
+
+    await db.commit()
+    await db.refresh(user)
+    auth.token_cache.invalidate_user(user.id)
+    return user
+
+app.put("/users/me", response_model=schemas.UserResponse)(db_endpoint(update_user_me, update_user_me_async))
 
 
 # --- Tagging Endpoints ---
 
+def tag_names_or_400(names: List[str]) -> List[str]:
+    try:
+        names = tagging.normalize_names(names)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not names:
+        raise HTTPException(status_code=400, detail="No tag names given")
+    if len(names) > tagging.TAG_FILTER_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {tagging.TAG_FILTER_MAX} tags")
+    return names
+
+def get_owned_document(db: Session, doc_id: int, user_id: int) -> models.Document:
+    doc = db.query(models.Document).filter(models.Document.id == doc_id, models.Document.user_id == user_id).first()
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return doc
+
+@app.get("/tags", response_model=List[schemas.TagWithCount])
+def list_tags(current_user: models.User = Depends(get_current_active_user), db: Session = Depends(database.get_db)):
+    return [
+        schemas.TagWithCount(id=tag.id, name=tag.name, color=tag.color, document_count=count)
+        for tag, count in tagging.tag_counts(db, current_user.id)
+    ]
+
 @app.post("/tags", response_model=schemas.TagResponse)
-def create_tag(tag: schemas.TagCreate, db: Session = Depends(database.get_db)):
-    # Check if tag exists
-    existing_tag = db.query(models.Tag).filter(models.Tag.name == tag.name).first()
-    if existing_tag:
-        return existing_tag # Return existing if duplicate to avoid errors
-    
-    new_tag = models.Tag(name=tag.name, color=tag.color)
-    db.add(new_tag)
+def create_tag(tag: schemas.TagCreate, current_user: models.User = Depends(get_current_active_user), db: Session = Depends(database.get_db)):
+    # Returns the existing tag for a duplicate name
+    name = tag_names_or_400([tag.name])[0]
+    for attempt in range(2):
+        try:
+            result = tagging.get_or_create_tags(db, current_user.id, [name], tag.color)[name]
+            db.commit()
+            return result
+        except IntegrityError:
+            # Another request created it first
+            db.rollback()
+    raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Tag is being changed, retry")
+
+@app.post("/tags/bulk", response_model=schemas.TagBulkResult)
+def bulk_add_tags(body: schemas.TagBulkUpdate, current_user: models.User = Depends(get_current_active_user), db: Session = Depends(database.get_db)):
+    # Tags every one of the user's documents in document_ids with every tag; others are ignored
+    if len(body.document_ids) > tagging.TAG_BULK_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {tagging.TAG_BULK_MAX} documents per request")
+    names = tag_names_or_400(body.tags)
+    for attempt in range(2):
+        try:
+            found = tagging.get_or_create_tags(db, current_user.id, names, body.color)
+            pairs, documents = tagging.add_tags(db, current_user.id, body.document_ids, [tag.id for tag in found.values()])
+            result = schemas.TagBulkResult(tags=[found[name] for name in names], pairs=pairs, documents=documents)
+            db.commit()
+            return result
+        except IntegrityError:
+            # A concurrent request added some of the same tags or pairs
+            db.rollback()
+    raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Tags are being changed, retry")
+
+@app.post("/tags/bulk/remove", response_model=schemas.TagBulkResult)
+def bulk_remove_tags(body: schemas.TagBulkUpdate, current_user: models.User = Depends(get_current_active_user), db: Session = Depends(database.get_db)):
+    if len(body.document_ids) > tagging.TAG_BULK_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {tagging.TAG_BULK_MAX} documents per request")
+    found = tagging.get_tags(db, current_user.id, tag_names_or_400(body.tags))
+    pairs, documents = tagging.remove_tags(db, current_user.id, body.document_ids, [tag.id for tag in found.values()])
     db.commit()
-    db.refresh(new_tag)
-    return new_tag
+    return schemas.TagBulkResult(tags=list(found.values()), pairs=pairs, documents=documents)
 
 @app.post("/documents/{doc_id}/tags/{tag_name}", response_model=schemas.DocumentResponse)
 def add_tag_to_document(doc_id: int, tag_name: str, current_user: models.User = Depends(get_current_active_user), db: Session = Depends(database.get_db)):
-    doc = db.query(models.Document).filter(models.Document.id == doc_id, models.Document.user_id == current_user.id).first()
-    if not doc:
-        raise HTTPException(status_code=404, detail="Document not found")
-    
-    # Find or create tag
-    tag = db.query(models.Tag).filter(models.Tag.name == tag_name).first()
-    if not tag:
-        tag = models.Tag(name=tag_name)
-        db.add(tag)
-        db.commit()
-        db.refresh(tag)
-        
-    if tag not in doc.tags:
-        doc.tags.append(tag)
-        db.commit()
-        db.refresh(doc)
-        
-    return doc
+    name = tag_names_or_400([tag_name])[0]
+    for attempt in range(2):
+        get_owned_document(db, doc_id, current_user.id)
+        try:
+            tag = tagging.get_or_create_tags(db, current_user.id, [name])[name]
+            tagging.add_tags(db, current_user.id, [doc_id], [tag.id])
+            db.commit()
+            break
+        except IntegrityError:
+            db.rollback()
+    else:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Tags are being changed, retry")
+    # The commit expired the document; this reloads it with its tags
+    return get_owned_document(db, doc_id, current_user.id)
 
 @app.delete("/documents/{doc_id}/tags/{tag_id}", response_model=schemas.DocumentResponse)
 def remove_tag_from_document(doc_id: int, tag_id: int, current_user: models.User = Depends(get_current_active_user), db: Session = Depends(database.get_db)):
-    doc = db.query(models.Document).filter(models.Document.id == doc_id, models.Document.user_id == current_user.id).first()
-    if not doc:
-        raise HTTPException(status_code=404, detail="Document not found")
-    
-    tag = db.query(models.Tag).filter(models.Tag.id == tag_id).first()
-    if tag and tag in doc.tags:
-        doc.tags.remove(tag)
+    get_owned_document(db, doc_id, current_user.id)
+    # Only pairs on the user's own documents are removed, and those only ever carry the user's tags
+    if tagging.remove_tags(db, current_user.id, [doc_id], [tag_id])[0]:
         db.commit()
-        db.refresh(doc)
-        
-    return doc
+    return get_owned_document(db, doc_id, current_user.id)
 
 
 # Frontend Static Files
@@ -269,72 +1190,135 @@ async def read_editor():
 async def read_settings():
     return FileResponse(os.path.join(frontend_path, "settings.html"))
 
-# Mount uploads to serve files
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+# Originals are served by GET /documents/{doc_id}/original; this unauthenticated
+# mount is only kept for N8N workflows that build the URL from original_path
+if originals.UPLOADS_PUBLIC:
+    app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 
 @app.get("/export/{doc_id}/pdf")
-def export_pdf(doc_id: int, current_user: models.User = Depends(get_current_active_user), db: Session = Depends(database.get_db)):
+def export_pdf(doc_id: int, request: Request, current_user: models.User = Depends(get_current_active_user), db: Session = Depends(database.get_db)):
+    not_modified = check_document_not_modified(request, doc_id, current_user.id, db, variant="-pdf")
+    if not_modified:
+        return not_modified
+
     doc = db.query(models.Document).filter(models.Document.id == doc_id, models.Document.user_id == current_user.id).first()
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    html_content = doc.corrected_html or doc.raw_text or ""
-    # Wrap in basic HTML structure if missing
-    if "<html>" not in html_content:
-        html_content = f"<html><body>{html_content}</body></html>"
-        
-    pdf_buffer = io.BytesIO()
-    pisa_status = pisa.CreatePDF(html_content, dest=pdf_buffer)
-    
-    if pisa_status.err:
+    try:
+        pdf_bytes = exports.get_or_render(doc.id, exports.export_source(doc), doc.filename or "Document", "pdf")
+    except exports.ExportError:
         raise HTTPException(status_code=500, detail="Error generating PDF")
         
-    pdf_buffer.seek(0)
     filename = (doc.filename or "document").replace(".pdf", "") + ".pdf"
     
-    return StreamingResponse(
-        pdf_buffer, 
+    return Response(
+        pdf_bytes, 
         media_type="application/pdf", 
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
+        headers={"Content-Disposition": f"attachment; filename={filename}", **document_cache_headers(doc.id, doc.revision, doc.updated_at, "-pdf")}
     )
 
 @app.get("/export/{doc_id}/docx")
-def export_docx(doc_id: int, current_user: models.User = Depends(get_current_active_user), db: Session = Depends(database.get_db)):
+def export_docx(doc_id: int, request: Request, current_user: models.User = Depends(get_current_active_user), db: Session = Depends(database.get_db)):
+    not_modified = check_document_not_modified(request, doc_id, current_user.id, db, variant="-docx")
+    if not_modified:
+        return not_modified
+
     doc = db.query(models.Document).filter(models.Document.id == doc_id, models.Document.user_id == current_user.id).first()
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
         
-    html_content = doc.corrected_html or doc.raw_text or ""
-    soup = BeautifulSoup(html_content, "html.parser")
-    
-    docx = DocxDocument()
-    docx.add_heading(doc.filename or "Document", 0)
-    
-    # Very basic HTML interpretation
-    for element in soup.descendants:
-        if element.name in ['p', 'div', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li']:
-             text = element.get_text(strip=True)
-             if text:
-                 if element.name.startswith('h'):
-                     try:
-                        level = int(element.name[1])
-                        docx.add_heading(text, level=level)
-                     except:
-                        docx.add_paragraph(text)
-                 elif element.name == 'li':
-                     docx.add_paragraph(text, style='List Bullet')
-                 else:
-                     docx.add_paragraph(text)
-                     
-    docx_buffer = io.BytesIO()
-    docx.save(docx_buffer)
-    docx_buffer.seek(0)
+    try:
+        docx_bytes = exports.get_or_render(doc.id, exports.export_source(doc), doc.filename or "Document", "docx")
+    except exports.ExportError:
+        raise HTTPException(status_code=500, detail="Error generating DOCX")
     
     filename = (doc.filename or "document").replace(".docx", "") + ".docx"
     
-    return StreamingResponse(
-        docx_buffer,
+    return Response(
+        docx_bytes,
         media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+        headers={"Content-Disposition": f"attachment; filename={filename}", **document_cache_headers(doc.id, doc.revision, doc.updated_at, "-docx")}
+    )
+
+EXPORT_MEDIA_TYPES = {
+    "pdf": "application/pdf",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+}
+
+@app.get("/auth/cache/stats")
+def auth_cache_stats(current_user: models.User = Depends(get_current_active_user)):
+    return {**auth.token_cache.stats(), "password_hasher": auth.password_hasher.stats()}
+
+@app.get("/database/stats")
+def database_stats(current_user: models.User = Depends(get_current_active_user)):
+    return database.pool_stats()
+
+@app.get("/export/jobs/stats")
+def export_job_stats(current_user: models.User = Depends(get_current_active_user)):
+    return exports.jobs.stats()
+
+# Scraped by Prometheus, which has no user account: protected by METRICS_TOKEN instead
+def check_metrics_token(token: Optional[str] = Depends(optional_oauth2_scheme)):
+    if not metrics.METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Metrics need METRICS_TOKEN")
+    if not (token and hmac.compare_digest(token, metrics.METRICS_TOKEN)):
+        raise HTTPException(status_code=401, detail="Invalid metrics token", headers={"WWW-Authenticate": "Bearer"})
+
+@app.get("/metrics", dependencies=[Depends(check_metrics_token)])
+def get_metrics():
+    if not metrics.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/metrics/profile", dependencies=[Depends(check_metrics_token)])
+def get_profile(seconds: float = 10, interval_ms: float = profiler.PROFILER_INTERVAL_MS, include_idle: bool = False):
+    # Collapsed stacks of every thread, for flamegraph.pl / speedscope
+    if not profiler.PROFILER_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiler is disabled (PROFILER_ENABLED)")
+    try:
+        return PlainTextResponse(profiler.profiler.profile(seconds, interval_ms, include_idle))
+    except profiler.ProfilerBusy:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+
+@app.post("/export/{doc_id}/{fmt}/jobs", status_code=status.HTTP_202_ACCEPTED)
+def create_export_job(doc_id: int, fmt: str, current_user: models.User = Depends(get_current_active_user), db: Session = Depends(database.get_db)):
+    if fmt not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=404, detail="Unsupported export format")
+    doc = db.query(models.Document).filter(models.Document.id == doc_id, models.Document.user_id == current_user.id).first()
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    try:
+        job = exports.jobs.submit(current_user.id, doc.id, exports.export_source(doc), doc.filename or "Document", fmt)
+    except exports.TooManyExportJobs:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too many exports in progress")
+    return job.to_dict()
+
+@app.get("/export/jobs/{job_id}")
+def get_export_job(job_id: str, current_user: models.User = Depends(get_current_active_user)):
+    job = exports.jobs.get(job_id, current_user.id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    return job.to_dict()
+
+@app.get("/export/jobs/{job_id}/result")
+def get_export_job_result(job_id: str, current_user: models.User = Depends(get_current_active_user)):
+    job = exports.jobs.get(job_id, current_user.id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    if job.status == "error":
+        raise HTTPException(status_code=500, detail=job.error)
+    if job.status != "done":
+        return JSONResponse(job.to_dict(), status_code=status.HTTP_202_ACCEPTED)
+    data = job.data()
+    if data is None:
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail="Export expired, start it again")
+
+    filename = os.path.splitext(job.filename)[0] + "." + job.format
+    return Response(
+        data,
+        media_type=EXPORT_MEDIA_TYPES[job.format],
         headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
 
@@ -344,12 +1328,7 @@ class N8NCallback(BaseModel):
     corrected_html: Optional[str] = None
     status: str = "Ready"
 
-@app.post("/n8n/callback")
-def n8n_callback(data: N8NCallback, db: Session = Depends(database.get_db)):
-    doc = db.query(models.Document).filter(models.Document.id == data.doc_id).first()
-    if not doc:
-        raise HTTPException(status_code=404, detail="Document not found")
-        
+def apply_extraction(doc: models.Document, data: N8NCallback):
     doc.raw_text = data.raw_text
     # If html is provided, use it. If not, generate basic wrapper.
     if data.corrected_html:
@@ -358,8 +1337,135 @@ def n8n_callback(data: N8NCallback, db: Session = Depends(database.get_db)):
         # Simple fallback conversion
         safe_text = data.raw_text.replace("<", "&lt;").replace(">", "&gt;").replace("\n", "<br>")
         doc.corrected_html = f"<div>{safe_text}</div>"
+    doc.page_count = None # Pages are split again from the new content
         
     doc.status = data.status
+    doc.touch(content=True)
+
+def store_extraction(db: Session, data: N8NCallback) -> models.Document:
+    doc = db.query(models.Document).filter(models.Document.id == data.doc_id).first()
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+    apply_extraction(doc, data)
+    search.index_document(db, doc)
+    versions.record(db, doc, source="extraction")
     db.commit()
+    return doc
+
+def n8n_callback(data: N8NCallback, db: Session = Depends(database.get_db)):
+    doc = store_extraction(db, data)
+    exports.cache.invalidate(doc.id)
+    events.publish_status(doc)
     return {"status": "success"}
 
+async def n8n_callback_async(data: N8NCallback, db: AsyncSession = Depends(database.get_async_db)):
+    doc = await database.run_write(db, store_extraction, data)
+    exports.cache.invalidate(doc.id)
+    events.publish_status(doc)
+    return {"status": "success"}
+
+app.post("/n8n/callback")(db_endpoint(n8n_callback, n8n_callback_async))
+
+# Bulk callback: a JSON array of N8NCallback objects, or one object per line
+# with Content-Type: application/x-ndjson. Everything is applied in one
+# transaction; each item gets its own result, so one bad item doesn't reject
+# the others.
+
+CALLBACK_CHUNK_SIZE = 500 # Documents per IN (...) lookup, well under SQLite's bound parameter limit
+
+INVALID_JSON = object()
+
+def too_many_callback_items() -> HTTPException:
+    return HTTPException(status_code=413, detail=f"At most {tasks.N8N_CALLBACK_BATCH_MAX_ITEMS} results per request")
+
+async def read_callback_items(request: Request) -> list:
+    """The request's items as parsed JSON values, INVALID_JSON for unparsable NDJSON lines."""
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type in ("application/x-ndjson", "application/jsonl"):
+        items, buffer = [], b""
+
+        def parse(lines):
+            for line in lines:
+                if line.strip():
+                    try:
+                        items.append(json.loads(line))
+                    except ValueError:
+                        items.append(INVALID_JSON)
+            if len(items) > tasks.N8N_CALLBACK_BATCH_MAX_ITEMS:
+                raise too_many_callback_items()
+
+        # Parsed as lines arrive, so an oversized stream is refused without buffering all of it
+        async for chunk in request.stream():
+            *lines, buffer = (buffer + chunk).split(b"\n")
+            parse(lines)
+        parse([buffer])
+        return items
+    try:
+        items = json.loads(await request.body())
+    except ValueError:
+        items = None
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+    if len(items) > tasks.N8N_CALLBACK_BATCH_MAX_ITEMS:
+        raise too_many_callback_items()
+    return items
+
+def store_extractions(db: Session, items: List[N8NCallback]) -> tuple:
+    """Apply many callbacks in one transaction. Returns (stored documents, doc ids not found)."""
+    stored, missing = [], set()
+    for start in range(0, len(items), CALLBACK_CHUNK_SIZE):
+        chunk = items[start:start + CALLBACK_CHUNK_SIZE]
+        docs = {doc.id: doc for doc in db.query(models.Document).filter(models.Document.id.in_({data.doc_id for data in chunk}))}
+        applied = []
+        for data in chunk:
+            doc = docs.get(data.doc_id)
+            if doc is None:
+                missing.add(data.doc_id)
+                continue
+            apply_extraction(doc, data)
+            applied.append(doc)
+        search.index_documents(db, applied)
+        versions.record_many(db, applied, source="extraction")
+        db.flush()
+        stored += applied
+    db.commit()
+    # Reload the columns status events need, one SELECT per chunk instead of a refresh per document
+    ids = [doc.id for doc in stored]
+    for start in range(0, len(ids), CALLBACK_CHUNK_SIZE):
+        db.query(models.Document).options(load_only(models.Document.id, models.Document.user_id, models.Document.status)) \
+            .filter(models.Document.id.in_(ids[start:start + CALLBACK_CHUNK_SIZE])).all()
+    return stored, missing
+
+@app.post("/n8n/callback/batch", response_model=schemas.CallbackBatchResponse)
+async def n8n_callback_batch(request: Request, db: Session = Depends(database.get_db)):
+    raw_items = await read_callback_items(request)
+
+    results = []
+    valid = {} # doc_id -> item; a later result for the same document replaces an earlier one
+    for index, raw in enumerate(raw_items):
+        doc_id = raw.get("doc_id") if isinstance(raw, dict) else None
+        results.append({"index": index, "doc_id": doc_id if isinstance(doc_id, int) else None})
+        if raw is INVALID_JSON:
+            results[-1]["error"] = "Invalid JSON"
+            continue
+        try:
+            data = N8NCallback.model_validate(raw)
+        except ValidationError as e:
+            results[-1]["error"] = "; ".join(f"{'.'.join(map(str, err['loc'])) or 'item'}: {err['msg']}" for err in e.errors())
+            continue
+        if data.doc_id in valid:
+            results[valid[data.doc_id][0]]["error"] = "Superseded by a later result for the same document"
+        valid[data.doc_id] = (index, data)
+
+    docs, missing = await run_in_threadpool(store_extractions, db, [data for _, data in valid.values()])
+    for index, data in valid.values():
+        if data.doc_id in missing:
+            results[index]["error"] = "Document not found"
+        else:
+            results[index]["status"] = "success"
+
+    exports.cache.invalidate_many(doc.id for doc in docs)
+    for doc in docs:
+        events.publish_status(doc)
+    return {"applied": len(docs), "failed": len(results) - len(docs), "results": results}
+
@@ -0,0 +1,263 @@
+import bisect
+import os
+import threading
+import time
+from typing import Callable, Optional, Sequence
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# In-process metrics in the Prometheus text format, served on GET /metrics.
+#
+# Recording is a dict lookup and a few additions under a per-metric lock, so
+# the hot paths (every request, every SQL statement) can afford it; the text
+# is only built when Prometheus scrapes. Each uvicorn worker process keeps its
+# own numbers: scrape every worker, or run one worker per container.
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+# GET /metrics (and the profiler) need "Authorization: Bearer <token>"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+if METRICS_ENABLED and not METRICS_TOKEN:
+    # GET /metrics is refused without a token (it shows routes, traffic and queue sizes), so nothing is recorded
+    if "METRICS_ENABLED" in os.environ:
+        print("METRICS_ENABLED needs METRICS_TOKEN, metrics disabled")
+    METRICS_ENABLED = False
+
+# Seconds; request and SQL latencies are spread over very different ranges
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+RENDER_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}  # label values -> value (a list of bucket counts for histograms)
+
+    def header(self) -> list:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def samples(self) -> list:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, labels)} {_format_value(value)}" for labels, value in items]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    """A value that goes up and down, or is read from `collect` at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), collect: Optional[Callable[[], dict]] = None):
+        super().__init__(name, documentation, labelnames)
+        # collect() returns {label values tuple: value}
+        self.collect = collect
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value: float):
+        with self._lock:
+            self._values[labels] = value
+
+    def samples(self) -> list:
+        if self.collect is not None:
+            try:
+                values = self.collect()
+            except Exception as e:
+                print(f"Collecting {self.name} failed: {e}")
+                return []
+            with self._lock:
+                self._values = dict(values)
+        return super().samples()
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels):
+        # One count per bucket (not cumulative) plus sum and count; made cumulative when rendered
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            entry[index] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def samples(self) -> list:
+        with self._lock:
+            items = sorted((labels, list(entry)) for labels, entry in self._values.items())
+        lines = []
+        for labels, entry in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), entry):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_format_value(entry[-2])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {entry[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return registry.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name: str, documentation: str, labelnames: Sequence[str] = (), collect: Optional[Callable[[], dict]] = None) -> Gauge:
+    return registry.register(Gauge(name, documentation, labelnames, collect))
+
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+    return registry.register(Histogram(name, documentation, labelnames, buckets))
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# --- HTTP ---
+
+http_requests = counter("http_requests_total", "Requests by route template, method and status.", ("method", "route", "status"))
+http_request_seconds = histogram("http_request_duration_seconds", "Time until the response finished sending, by route template.", ("method", "route"))
+http_in_progress = gauge("http_requests_in_progress", "Requests being handled.")
+
+
+class MetricsMiddleware:
+    """Counts and times every HTTP request under its route template (/documents/{doc_id}), not its path."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_in_progress.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_in_progress.dec()
+            # The router leaves the matched route in the scope; anything unmatched shares one label
+            route = scope.get("route")
+            template = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            http_request_seconds.observe(time.perf_counter() - start, method, template)
+            http_requests.inc(method, template, str(status_code))
+
+
+# --- Database ---
+
+db_query_seconds = histogram("db_query_duration_seconds", "SQL statement execution time, by engine and statement type.", ("engine", "statement"), QUERY_BUCKETS)
+
+STATEMENT_TYPES = {"SELECT", "INSERT", "UPDATE", "DELETE"}
+
+
+def statement_type(statement: str) -> str:
+    word = statement.lstrip()[:6].upper()
+    return word if word in STATEMENT_TYPES else "OTHER"
+
+
+def instrument_engine(engine, label: str):
+    """Time every statement run on a (sync) engine; for an async engine pass its sync_engine."""
+    from sqlalchemy import event
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("query_start")
+        if starts:
+            db_query_seconds.observe(time.perf_counter() - starts.pop(), label, statement_type(statement))
+
+    def handle_error(exception_context):
+        # A failed statement never reaches after_cursor_execute
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_start"):
+            conn.info["query_start"].pop()
+
+    if METRICS_ENABLED:
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", after_cursor_execute)
+        event.listen(engine, "handle_error", handle_error)
+
+
+# --- Exports and dispatch (recorded in backend/exports.py and backend/dispatch.py / tasks.py) ---
+
+export_render_seconds = histogram("export_render_duration_seconds", "Time to render an export in the worker process, by format.", ("format",), RENDER_BUCKETS)
+export_cache = counter("export_cache_requests_total", "Export lookups by format and result (hit, miss).", ("format", "result"))
+
+dispatch_jobs = counter("dispatch_jobs_total", "Dispatch attempts by outcome (extracted, sent, retry, failed).", ("outcome",))
+dispatch_wait_seconds = histogram("dispatch_wait_seconds", "Time a job waited after it was due until a worker claimed it.", (), LATENCY_BUCKETS + (30, 60, 300))
+dispatch_seconds = histogram("dispatch_duration_seconds", "Time to process a claimed job, by outcome.", ("outcome",))
+n8n_webhook_seconds = histogram("n8n_webhook_duration_seconds", "N8N webhook round trip, by result (ok, http_error, connection_error).", ("result",))
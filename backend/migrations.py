@@ -0,0 +1,221 @@
+import os
+import sys
+from datetime import datetime
+from sqlalchemy import Table, Column, String, MetaData, inspect, text, select, update, bindparam
+from sqlalchemy.types import LargeBinary
+from . import models
+from .compression import is_compressed
+
+# Ordered schema migrations, applied once each and recorded in schema_migrations
+# (the same idea as Alembic revisions, without the extra dependency).
+# create_all() still creates missing tables; migrations bring existing
+# databases up to date with the models. Every step checks the live schema
+# first, so databases patched by the old ad-hoc ALTER TABLE code upgrade cleanly.
+#
+#   python -m backend.migrations            # upgrade
+#   python -m backend.migrations current    # list applied revisions
+
+BATCH_SIZE = 500
+
+migration_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations", migration_metadata,
+    Column("revision", String(64), primary_key=True),
+    Column("applied_at", String(50)),
+)
+
+
+def _column_ddl(column, dialect) -> str:
+    ddl = f"{column.name} {column.type.compile(dialect=dialect)}"
+    if column.default is not None and column.default.is_scalar:
+        ddl += f" DEFAULT {column.default.arg!r}"
+    return ddl
+
+
+def _add_missing_columns(conn, table: Table):
+    existing = {c["name"] for c in inspect(conn).get_columns(table.name)}
+    for column in table.columns:
+        if column.name not in existing:
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {_column_ddl(column, conn.dialect)}"))
+
+
+def add_document_columns(conn):
+    """revision/updated_at/content_hash/file_size/filename on documents, storage columns on document_versions."""
+    had_filename = "filename" in {c["name"] for c in inspect(conn).get_columns("documents")}
+    _add_missing_columns(conn, models.Document.__table__)
+    _add_missing_columns(conn, models.DocumentVersion.__table__)
+    if not had_filename:
+        # Older rows only had the upload path
+        rows = conn.execute(text("SELECT id, original_path FROM documents WHERE filename IS NULL")).all()
+        for doc_id, original_path in rows:
+            conn.execute(text("UPDATE documents SET filename = :filename WHERE id = :id"), {"filename": os.path.basename(original_path or ""), "id": doc_id})
+
+
+def _columns(conn, table: str) -> set:
+    return {c["name"] for c in inspect(conn).get_columns(table)}
+
+
+def add_missing_indexes(conn):
+    # The unique tag indexes only fit once 0006 has split the tags per user and dropped duplicate pairs
+    tags_scoped = "user_id" in _columns(conn, "tags") if inspect(conn).has_table("tags") else True
+    for table in models.Base.metadata.sorted_tables:
+        if not inspect(conn).has_table(table.name):
+            continue
+        if table.name in ("tags", "document_tags") and not tags_scoped:
+            continue
+        existing = {index["name"] for index in inspect(conn).get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(conn)
+
+
+def _to_binary(conn, table: str, column: str):
+    current = next(c["type"] for c in inspect(conn).get_columns(table) if c["name"] == column)
+    if isinstance(current, LargeBinary):
+        return
+    if conn.dialect.name == "mysql":
+        conn.execute(text(f"ALTER TABLE {table} MODIFY {column} LONGBLOB"))
+    elif conn.dialect.name == "postgresql":
+        conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN {column} TYPE BYTEA USING convert_to({column}, 'UTF8')"))
+    # SQLite stores any value in any column; the rows are rewritten below
+
+
+def _compress_rows(conn, table: Table, column: str):
+    # Read the stored values untouched, write them back through CompressedText
+    statement = update(table).where(table.c.id == bindparam("row_id")).values({column: bindparam("value")})
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            text(f"SELECT id, {column} FROM {table.name} WHERE id > :last_id ORDER BY id LIMIT :limit"),
+            {"last_id": last_id, "limit": BATCH_SIZE},
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        batch = []
+        for row_id, value in rows:
+            if value is None or is_compressed(value):
+                continue
+            if not isinstance(value, str):
+                value = bytes(value).decode("utf-8")
+            batch.append({"row_id": row_id, "value": value})
+        if batch:
+            conn.execute(statement, batch)
+
+
+def compress_text_columns(conn):
+    """raw_text / corrected_html: String(5000) -> compressed LOBs."""
+    for table, column in (
+        (models.Document.__table__, "raw_text"),
+        (models.Document.__table__, "corrected_html"),
+        (models.DocumentVersion.__table__, "corrected_html"),
+    ):
+        _to_binary(conn, table.name, column)
+        _compress_rows(conn, table, column)
+
+
+def add_upload_batches(conn):
+    """documents.batch_id and its index."""
+    _add_missing_columns(conn, models.Document.__table__)
+    add_missing_indexes(conn)
+
+
+def add_document_pages(conn):
+    """documents.page_count (document_pages itself is created by create_all)."""
+    _add_missing_columns(conn, models.Document.__table__)
+
+
+def _drop_index(conn, table: str, name: str):
+    if name not in {index["name"] for index in inspect(conn).get_indexes(table)}:
+        return
+    if conn.dialect.name == "mysql":
+        conn.execute(text(f"DROP INDEX {name} ON {table}"))
+    else:
+        conn.execute(text(f"DROP INDEX {name}"))
+
+
+def scope_tags_to_users(conn):
+    """tags.user_id: each shared tag is copied for every user whose documents carry it; pairs made unique."""
+    _add_missing_columns(conn, models.Tag.__table__)
+    _drop_index(conn, "tags", "ix_tags_name") # Names are unique per user now
+    tags = models.Tag.__table__
+
+    # Tags were global: the first user keeps the row, the others get a copy and their documents move to it
+    owners = {}
+    for tag_id, user_id in conn.execute(text(
+        "SELECT DISTINCT dt.tag_id, d.user_id FROM document_tags dt"
+        " JOIN documents d ON d.id = dt.document_id JOIN tags t ON t.id = dt.tag_id"
+        " WHERE t.user_id IS NULL ORDER BY dt.tag_id, d.user_id"
+    )):
+        owners.setdefault(tag_id, []).append(user_id)
+    for tag_id, user_ids in owners.items():
+        name, color = conn.execute(select(tags.c.name, tags.c.color).where(tags.c.id == tag_id)).one()
+        conn.execute(update(tags).where(tags.c.id == tag_id).values(user_id=user_ids[0]))
+        for user_id in user_ids[1:]:
+            new_id = conn.execute(tags.insert().values(user_id=user_id, name=name, color=color)).inserted_primary_key[0]
+            conn.execute(text(
+                "UPDATE document_tags SET tag_id = :new_id WHERE tag_id = :tag_id"
+                " AND document_id IN (SELECT id FROM documents WHERE user_id = :user_id)"
+            ), {"new_id": new_id, "tag_id": tag_id, "user_id": user_id})
+    # Unused tags had no owner; rows of deleted documents or tags were never cleaned up
+    conn.execute(text("DELETE FROM tags WHERE user_id IS NULL"))
+    conn.execute(text("DELETE FROM document_tags WHERE document_id NOT IN (SELECT id FROM documents) OR tag_id NOT IN (SELECT id FROM tags)"))
+
+    duplicates = conn.execute(text("SELECT document_id, tag_id FROM document_tags GROUP BY document_id, tag_id HAVING COUNT(*) > 1")).all()
+    for document_id, tag_id in duplicates:
+        pair = {"document_id": document_id, "tag_id": tag_id}
+        conn.execute(text("DELETE FROM document_tags WHERE document_id = :document_id AND tag_id = :tag_id"), pair)
+        conn.execute(text("INSERT INTO document_tags (document_id, tag_id) VALUES (:document_id, :tag_id)"), pair)
+
+    add_missing_indexes(conn)
+    # Both are prefixes of the new composite indexes
+    _drop_index(conn, "document_tags", "ix_document_tags_document_id")
+    _drop_index(conn, "document_tags", "ix_document_tags_tag_id")
+
+
+def add_content_revision(conn):
+    """documents.content_revision, starting from revision so page revisions (taken from revision until now) stay below it."""
+    _add_missing_columns(conn, models.Document.__table__)
+    conn.execute(text("UPDATE documents SET content_revision = revision"))
+
+
+MIGRATIONS = [
+    ("0001_document_columns", add_document_columns),
+    ("0002_indexes", add_missing_indexes),
+    ("0003_compress_text_columns", compress_text_columns),
+    ("0004_upload_batches", add_upload_batches),
+    ("0005_document_pages", add_document_pages),
+    ("0006_user_tags", scope_tags_to_users),
+    ("0007_content_revision", add_content_revision),
+]
+
+
+def applied_revisions(engine) -> list:
+    schema_migrations.create(bind=engine, checkfirst=True)
+    with engine.connect() as conn:
+        return [row[0] for row in conn.execute(select(schema_migrations.c.revision).order_by(schema_migrations.c.revision))]
+
+
+def upgrade(engine):
+    applied = set(applied_revisions(engine))
+    for revision, migrate in MIGRATIONS:
+        if revision in applied:
+            continue
+        print(f"Applying migration {revision}")
+        with engine.begin() as conn:
+            migrate(conn)
+            conn.execute(schema_migrations.insert().values(revision=revision, applied_at=str(datetime.utcnow())))
+
+
+if __name__ == "__main__":
+    from .database import engine
+    command = sys.argv[1] if len(sys.argv) > 1 else "upgrade"
+    if command == "upgrade":
+        models.Base.metadata.create_all(bind=engine)
+        upgrade(engine)
+    elif command == "current":
+        for revision in applied_revisions(engine):
+            print(revision)
+    else:
+        print("Usage: python -m backend.migrations [upgrade|current]")
+        sys.exit(1)
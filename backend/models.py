@@ -1,5 +1,10 @@
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, Integer, String, Float, Text, Index, LargeBinary, func
+from sqlalchemy.orm import deferred
+from datetime import datetime
 from .database import Base
+from .compression import CompressedText
+
+LOB_LENGTH = 2**32 - 1 # LONGBLOB on MySQL
 
 class User(Base):
     __tablename__ = "users"
@@ -18,11 +23,29 @@ class Document(Base):
     # keeping simple for now, but adding relationship back ref is good practice
     
     upload_date = Column(String(50)) # Using string for simplicity, or DateTime
-    original_path = Column(String(255))
+    original_path = Column(String(255), index=True) # Shared by documents with identical uploads
     filename = Column(String(255)) # Display name of the file
-    raw_text = Column(String(5000)) # Large text field (TEXT in mysql)
-    corrected_html = Column(String(5000)) # Large text field
+    # Large text fields: compressed LOBs, only loaded when accessed (or with undefer_group("content"))
+    raw_text = deferred(Column(CompressedText(length=LOB_LENGTH)), group="content")
+    corrected_html = deferred(Column(CompressedText(length=LOB_LENGTH)), group="content")
     status = Column(String(20), default="Processing") # Processing, Ready, Error
+    revision = Column(Integer, default=1) # Bumped on every change, used for ETags
+    content_revision = Column(Integer, default=1) # Bumped when corrected_html or filename is written; PATCH checks against it
+    content_hash = Column(String(64), index=True) # SHA-256 of the original upload
+    file_size = Column(Integer)
+    updated_at = Column(String(50)) # Same format as upload_date
+    batch_id = Column(String(32), index=True) # Set for documents uploaded through POST /upload_batches
+    page_count = Column(Integer) # Rows in document_pages; NULL until they are (re)split from corrected_html
+
+    def touch(self, content: bool = False):
+        # content=False for changes the editor doesn't care about (status, tags).
+        # Incremented in SQL, so concurrent writers can't store the same revision;
+        # the attributes read back the stored values after the next flush.
+        cls = type(self)
+        self.revision = func.coalesce(cls.revision, 0) + 1
+        if content:
+            self.content_revision = func.coalesce(cls.content_revision, 0) + 1
+        self.updated_at = str(datetime.utcnow())
 
 class DocumentVersion(Base):
     __tablename__ = "document_versions"
@@ -30,8 +53,56 @@ class DocumentVersion(Base):
     id = Column(Integer, primary_key=True, index=True)
     document_id = Column(Integer, index=True) # FK to documents.id
     version_number = Column(Integer)
-    corrected_html = Column(String(5000))
-    timestamp = Column(String(50))
+    corrected_html = deferred(Column(CompressedText(length=LOB_LENGTH))) # Unused since versions are stored in `data`
+    timestamp = Column(String(50)) # Last save folded into this version
+    # See backend/versions.py
+    kind = Column(String(10)) # full, delta
+    data = deferred(Column(LargeBinary(length=LOB_LENGTH))) # zlib: the HTML (full) or delta ops as JSON (delta)
+    depth = Column(Integer, default=0) # Deltas since the last full version
+    size = Column(Integer) # Length of the HTML
+    revision = Column(Integer) # Document revision it matches
+    source = Column(String(20), default="edit") # edit, extraction, restore
+    created_at = Column(Float) # Epoch seconds, for coalescing
+
+    __table_args__ = (Index("ix_document_versions_doc_number", "document_id", "version_number"),)
+
+class DocumentPage(Base):
+    # corrected_html split into pages for the editor, see backend/pages.py
+    __tablename__ = "document_pages"
+
+    id = Column(Integer, primary_key=True, index=True)
+    document_id = Column(Integer) # FK to documents.id
+    page_number = Column(Integer) # From 1
+    html = Column(CompressedText(length=LOB_LENGTH))
+    size = Column(Integer) # Length of the HTML
+    revision = Column(Integer) # Document content_revision the page last changed in
+
+    __table_args__ = (Index("ix_document_pages_doc_number", "document_id", "page_number", unique=True),)
+
+class DispatchJob(Base):
+    __tablename__ = "dispatch_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    document_id = Column(Integer, index=True) # FK to documents.id
+    status = Column(String(20), default="pending", index=True) # pending, in_flight, done, failed
+    attempts = Column(Integer, default=0)
+    # Epoch seconds (not strings like upload_date) because the dispatcher does arithmetic on them
+    next_attempt_at = Column(Float, default=0, index=True)
+    claimed_at = Column(Float)
+    last_error = Column(Text)
+    created_at = Column(String(50))
+
+class SearchTerm(Base):
+    # Inverted index used by backend/search.py when SQLite FTS5 isn't available
+    __tablename__ = "search_terms"
+
+    id = Column(Integer, primary_key=True)
+    term = Column(String(64))
+    document_id = Column(Integer, index=True) # FK to documents.id
+    user_id = Column(Integer)
+    weight = Column(Float) # Term frequency, filename hits weighted higher
+
+    __table_args__ = (Index("ix_search_terms_user_term", "user_id", "term"),)
 
 # Association Table for Many-to-Many
 from sqlalchemy import Table, ForeignKey
@@ -39,15 +110,21 @@ from sqlalchemy.orm import relationship
 
 document_tags = Table('document_tags', Base.metadata,
     Column('document_id', Integer, ForeignKey('documents.id', ondelete="CASCADE")),
-    Column('tag_id', Integer, ForeignKey('tags.id', ondelete="CASCADE"))
+    Column('tag_id', Integer, ForeignKey('tags.id', ondelete="CASCADE")),
+    # A pair at most once; (tag_id, document_id) lists a tag's documents in id order without touching the table
+    Index("ix_document_tags_doc_tag", "document_id", "tag_id", unique=True),
+    Index("ix_document_tags_tag_doc", "tag_id", "document_id"),
 )
 
 class Tag(Base):
     __tablename__ = "tags"
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String(50), unique=True, index=True)
+    user_id = Column(Integer) # Each user has their own tags, see backend/tags.py
+    name = Column(String(50))
     color = Column(String(20), default="blue") # e.g., 'blue', 'red', 'green'
 
+    __table_args__ = (Index("ix_tags_user_name", "user_id", "name", unique=True),)
+
     # Relationship
     documents = relationship("Document", secondary=document_tags, back_populates="tags")
 
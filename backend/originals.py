@@ -0,0 +1,217 @@
+import base64
+import hashlib
+import hmac
+import io
+import os
+import threading
+import time
+import uuid
+from typing import Optional
+from dotenv import load_dotenv
+from . import auth, extractors
+
+load_dotenv()
+
+# Serving the original uploads (GET /documents/{id}/original) and their
+# thumbnails (GET /documents/{id}/thumbnail).
+#
+# <img>, <iframe> and N8N can't send an Authorization header, so the file
+# endpoints also accept a signed "file key" in the query string: an HMAC over a
+# scope (u<user_id> for all of a user's documents, d<doc_id> for one) and an
+# expiry. Expiries are rounded to FILE_KEY_TTL_SECONDS so the URLs stay the
+# same for a while and the browser cache (immutable, uploads never change)
+# keeps hitting. A key stays valid for one to two TTLs.
+
+FILE_KEY_TTL_SECONDS = int(os.getenv("FILE_KEY_TTL_SECONDS", "3600"))
+
+# Behind nginx/Apache, hand the transfer to the proxy (sendfile, ranges) instead
+# of streaming it through Python: "X-Accel-Redirect" or "X-Sendfile", empty to disable.
+# For nginx, FILE_SENDFILE_PREFIX is the internal location aliased to the uploads directory.
+FILE_SENDFILE_HEADER = os.getenv("FILE_SENDFILE_HEADER", "")
+FILE_SENDFILE_PREFIX = os.getenv("FILE_SENDFILE_PREFIX", "/protected/")
+
+# The old unauthenticated /uploads mount, for N8N workflows that build the URL themselves
+UPLOADS_PUBLIC = os.getenv("UPLOADS_PUBLIC", "false").lower() in ("1", "true", "yes")
+
+# Thumbnails are cached on disk by content hash and size, so duplicates share them
+THUMBNAIL_DIR = os.getenv("THUMBNAIL_DIR", "thumbnails")
+# Requested sizes are rounded up to one of these (longest edge, pixels) to bound the cache
+THUMBNAIL_SIZES = sorted(int(s) for s in os.getenv("THUMBNAIL_SIZES", "96,192,384,768").split(",") if s.strip())
+THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY", "80"))
+# Decoding a large scan takes a lot of memory, so only this many are generated at once
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", "2"))
+
+IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+if FILE_SENDFILE_HEADER not in ("", "X-Accel-Redirect", "X-Sendfile"):
+    print(f"Unknown FILE_SENDFILE_HEADER={FILE_SENDFILE_HEADER}, streaming files from the app")
+    FILE_SENDFILE_HEADER = ""
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".webp", ".gif", ".tif", ".tiff"}
+
+
+def _signature(scope: str, expires: int) -> str:
+    digest = hmac.new(auth.SECRET_KEY.encode(), f"file:{scope}:{expires}".encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).decode().rstrip("=")
+
+
+def file_key(scope: str, now: Optional[float] = None) -> tuple:
+    """(key, expires) for a scope; the same key is handed out for FILE_KEY_TTL_SECONDS at a time."""
+    now = time.time() if now is None else now
+    expires = (int(now) // FILE_KEY_TTL_SECONDS + 2) * FILE_KEY_TTL_SECONDS
+    return f"{scope}.{expires}.{_signature(scope, expires)}", expires
+
+
+def user_file_key(user_id: int) -> tuple:
+    return file_key(f"u{user_id}")
+
+
+def document_file_key(doc_id: int) -> str:
+    return file_key(f"d{doc_id}")[0]
+
+
+def key_scope(key: str) -> Optional[str]:
+    """The scope of a valid, unexpired key, else None."""
+    try:
+        scope, expires, signature = key.split(".")
+        expires = int(expires)
+    except ValueError:
+        return None
+    if expires < time.time() or not hmac.compare_digest(signature, _signature(scope, expires)):
+        return None
+    return scope
+
+
+def key_allows(key: str, doc_id: int, user_id: int) -> bool:
+    scope = key_scope(key)
+    return scope is not None and scope in (f"d{doc_id}", f"u{user_id}")
+
+
+def file_id(doc) -> str:
+    # Uploads are content-addressed (older ones have uuid names), so a path never changes content
+    return doc.content_hash or os.path.splitext(os.path.basename(doc.original_path))[0]
+
+
+def file_etag(doc, variant: str = "") -> str:
+    return f'"{file_id(doc)}{variant}"'
+
+
+def sendfile_headers(path: str) -> dict:
+    if FILE_SENDFILE_HEADER == "X-Accel-Redirect":
+        return {"X-Accel-Redirect": FILE_SENDFILE_PREFIX.rstrip("/") + "/" + os.path.basename(path)}
+    return {"X-Sendfile": os.path.abspath(path)}
+
+
+# --- Thumbnails ---
+
+class NoThumbnail(Exception):
+    pass
+
+
+def thumbnail_size(requested: int) -> int:
+    for size in THUMBNAIL_SIZES:
+        if size >= requested:
+            return size
+    return THUMBNAIL_SIZES[-1]
+
+
+def thumbnail_path(name: str, size: int) -> str:
+    return os.path.join(THUMBNAIL_DIR, f"{name}-{size}.jpg")
+
+
+def open_scan(path: str):
+    """The image to thumbnail: the file itself, or the scan on the first page of an image-only PDF."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in IMAGE_EXTENSIONS:
+        return Image.open(path)
+    if extension == ".pdf" and extractors.pypdf is not None:
+        page = extractors.pypdf.PdfReader(path).pages[0]
+        # A PDF with a text layer would only yield its logo
+        if len((page.extract_text() or "").strip()) < extractors.EXTRACT_MIN_CHARS_PER_PAGE:
+            images = list(page.images)
+            if images:
+                return Image.open(io.BytesIO(max(images, key=lambda i: len(i.data)).data))
+    raise NoThumbnail()
+
+
+def _undecodable_errors() -> tuple:
+    # The file itself can't be made into a thumbnail; anything else (I/O, memory) may pass
+    errors = [NoThumbnail]
+    if Image is not None:
+        errors += [Image.UnidentifiedImageError, Image.DecompressionBombError]
+    if extractors.pypdf is not None:
+        errors.append(extractors.pypdf.errors.PdfReadError)
+    return tuple(errors)
+
+
+UNDECODABLE_ERRORS = _undecodable_errors()
+
+
+def render_thumbnail(path: str, size: int, dest: str):
+    image = open_scan(path)
+    # JPEG decodes straight to a smaller scale, so big scans are never decoded in full
+    image.draft("RGB", (size, size))
+    image.thumbnail((size, size))
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    tmp = f"{dest}.{uuid.uuid4().hex}.tmp"
+    image.save(tmp, "JPEG", quality=THUMBNAIL_QUALITY, optimize=True)
+    os.replace(tmp, dest)
+
+
+_slots = threading.BoundedSemaphore(max(THUMBNAIL_WORKERS, 1))
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def get_thumbnail(doc, size: int) -> str:
+    """Path of the cached thumbnail, rendering it on first use. Raises NoThumbnail."""
+    dest = thumbnail_path(file_id(doc), size)
+    if os.path.exists(dest):
+        return dest
+    if Image is None or os.path.exists(dest + ".none"):
+        raise NoThumbnail()
+
+    # A dashboard load asks for many thumbnails at once; each is rendered only once
+    with _locks_guard:
+        lock = _locks.setdefault(dest, threading.Lock())
+    try:
+        with lock:
+            if os.path.exists(dest):
+                return dest
+            if os.path.exists(dest + ".none"):
+                raise NoThumbnail()
+            os.makedirs(THUMBNAIL_DIR, exist_ok=True)
+            with _slots:
+                try:
+                    render_thumbnail(doc.original_path, size, dest)
+                except UNDECODABLE_ERRORS as e:
+                    if not isinstance(e, NoThumbnail):
+                        print(f"Thumbnail for {doc.original_path} failed: {e}")
+                    # Uploads never change, so neither will the outcome: don't retry on every load
+                    open(dest + ".none", "w").close()
+                    raise NoThumbnail()
+                except Exception as e:
+                    # Not cached: the next request tries again
+                    print(f"Thumbnail for {doc.original_path} failed: {e}")
+                    raise
+            return dest
+    finally:
+        with _locks_guard:
+            _locks.pop(dest, None)
+
+
+def remove_thumbnails(name: str):
+    """Drop the cached thumbnails of a file (by file_id) once its last document is deleted."""
+    for size in THUMBNAIL_SIZES:
+        path = thumbnail_path(name, size)
+        for p in (path, path + ".none"):
+            try:
+                os.remove(p)
+            except OSError:
+                pass
@@ -0,0 +1,147 @@
+import os
+import re
+from html.parser import HTMLParser
+from typing import List, Optional
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+from . import models
+from .extractors import paragraphs_html
+
+load_dotenv()
+
+# corrected_html split into pages, so the editor can load and save a few pages
+# at a time instead of the whole document.
+#
+# document_pages holds the pages; joined in order they are exactly
+# corrected_html (a page save rebuilds it, so exports, search and versions keep
+# working on the whole document). Anything else that replaces corrected_html
+# sets documents.page_count to NULL, and the pages are split again on their
+# next read. Pages whose content didn't change keep their revision, which is
+# what page saves are checked against.
+
+# Pages break at top-level elements once they reach this size, or at each
+# <div class="page"> (one per PDF page from the local extractor)
+DOCUMENT_PAGE_CHARS = int(os.getenv("DOCUMENT_PAGE_CHARS", "4000"))
+# Most pages one GET /documents/{id}/pages returns
+DOCUMENT_PAGES_MAX_FETCH = int(os.getenv("DOCUMENT_PAGES_MAX_FETCH", "50"))
+
+VOID_TAGS = {"br", "img", "hr", "meta", "link", "input", "col", "wbr", "source", "area", "base", "embed", "param", "track"}
+# A new block closes an open <p>, as in the browser
+BLOCK_TAGS = {"p", "div", "h1", "h2", "h3", "h4", "h5", "h6", "ul", "ol", "table", "blockquote", "pre", "section", "article", "header", "footer"}
+PAGE_CLASS = re.compile(r"(^|\s)page(\s|$)")
+
+
+class _TopLevelStarts(HTMLParser):
+    """Offsets of the top-level start tags, and whether each is a page <div>."""
+
+    def __init__(self, html: str):
+        super().__init__(convert_charrefs=False)
+        # getpos() is (line, column); lines are counted at "\n" only
+        self.line_offsets = [0] + [match.end() for match in re.finditer("\n", html)]
+        self.open = []
+        self.starts = []
+
+    def handle_starttag(self, tag, attrs):
+        if self.open and self.open[-1] == "p" and tag in BLOCK_TAGS:
+            self.open.pop()
+        if not self.open:
+            line, column = self.getpos()
+            is_page = tag == "div" and any(name == "class" and PAGE_CLASS.search(value or "") for name, value in attrs)
+            self.starts.append((self.line_offsets[line - 1] + column, is_page))
+        if tag not in VOID_TAGS:
+            self.open.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        if not self.open:
+            line, column = self.getpos()
+            self.starts.append((self.line_offsets[line - 1] + column, False))
+
+    def handle_endtag(self, tag):
+        # Close up to the matching tag; stray end tags are ignored
+        if tag in self.open:
+            while self.open.pop() != tag:
+                pass
+
+
+def split_html(html: Optional[str]) -> List[str]:
+    """Pages of html, at least one (empty for an empty document). "".join() of them is html."""
+    html = html or ""
+    parser = _TopLevelStarts(html)
+    parser.feed(html)
+    parser.close()
+
+    pages = []
+    page_start = 0
+    for offset, is_page in parser.starts:
+        if offset > page_start and (is_page or offset - page_start >= DOCUMENT_PAGE_CHARS):
+            pages.append(html[page_start:offset])
+            page_start = offset
+    pages.append(html[page_start:])
+    return pages
+
+
+def page_source(doc: models.Document) -> str:
+    # Documents N8N only returned text for are edited as one paragraph per line, like the editor shows them
+    if doc.corrected_html:
+        return doc.corrected_html
+    return paragraphs_html((doc.raw_text or "").splitlines())
+
+
+def split_pages(db: Session, doc: models.Document) -> List[models.DocumentPage]:
+    """(Re)split the pages from the document's content; returns them all, in order."""
+    existing = {page.page_number: page for page in db.query(models.DocumentPage).filter(models.DocumentPage.document_id == doc.id)}
+    pages = []
+    for number, html in enumerate(split_html(page_source(doc)), 1):
+        page = existing.pop(number, None)
+        if page is None:
+            page = models.DocumentPage(document_id=doc.id, page_number=number, html=html, size=len(html), revision=doc.content_revision)
+            db.add(page)
+        elif page.html != html:
+            page.html = html
+            page.size = len(html)
+            page.revision = doc.content_revision
+        pages.append(page)
+    for page in existing.values():
+        db.delete(page)
+    doc.page_count = len(pages)
+    db.flush()
+    return pages
+
+
+def page_range(db: Session, doc: models.Document, start: int, count: int) -> List[models.DocumentPage]:
+    if doc.page_count is None:
+        return split_pages(db, doc)[start - 1:start - 1 + count]
+    return db.query(models.DocumentPage).filter(
+        models.DocumentPage.document_id == doc.id,
+        models.DocumentPage.page_number >= start,
+        models.DocumentPage.page_number < start + count,
+    ).order_by(models.DocumentPage.page_number).all()
+
+
+def pages_by_number(db: Session, doc: models.Document, numbers) -> dict:
+    if doc.page_count is None:
+        split_pages(db, doc)
+    return {page.page_number: page for page in db.query(models.DocumentPage).filter(
+        models.DocumentPage.document_id == doc.id,
+        models.DocumentPage.page_number.in_(list(numbers)),
+    )}
+
+
+def replace_pages(db: Session, doc: models.Document, new_html: dict) -> str:
+    """The document's html with some pages ({page_number: html}) replaced.
+
+    The other pages are cut out of the current html by their stored sizes
+    rather than read back. Call it before the page rows are updated.
+    """
+    source = page_source(doc)
+    parts, offset = [], 0
+    sizes = db.query(models.DocumentPage.page_number, models.DocumentPage.size) \
+        .filter(models.DocumentPage.document_id == doc.id).order_by(models.DocumentPage.page_number)
+    for number, size in sizes:
+        parts.append(new_html[number] if number in new_html else source[offset:offset + size])
+        offset += size
+    return "".join(parts)
+
+
+def delete_pages(db: Session, doc_id: int):
+    db.query(models.DocumentPage).filter(models.DocumentPage.document_id == doc_id).delete(synchronize_session=False)
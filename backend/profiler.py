@@ -0,0 +1,88 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from dotenv import load_dotenv
+from . import metrics
+
+load_dotenv()
+
+# Opt-in sampling profiler for production (GET /metrics/profile).
+#
+# While a profile runs, a thread snapshots every other thread's Python stack
+# each PROFILER_INTERVAL_MS, and the result is returned as collapsed stacks
+# ("thread;outer;inner count" per line), which flamegraph.pl, speedscope or
+# inferno turn into a flame graph. Nothing runs between profiles. Work done in
+# the export/extraction worker processes isn't seen, only the time spent
+# waiting for them.
+
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "false").lower() in ("1", "true", "yes")
+PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", "5"))
+PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", "60"))
+
+if PROFILER_ENABLED and not metrics.METRICS_TOKEN:
+    # Stacks show file paths and code structure, so they are never served without a token
+    print("PROFILER_ENABLED needs METRICS_TOKEN, profiler disabled")
+    PROFILER_ENABLED = False
+
+# Leaf frames of threads parked with nothing to do (pool workers, the event loop's select)
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _stack(frame) -> list:
+    names = []
+    while frame is not None:
+        names.append(frame)
+        frame = frame.f_back
+    names.reverse()
+    return names
+
+
+def _is_idle(frame) -> bool:
+    code = frame.f_code
+    return (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES
+
+
+class SamplingProfiler:
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def profile(self, seconds: float, interval_ms: float = PROFILER_INTERVAL_MS, include_idle: bool = False) -> str:
+        """Sample all threads for `seconds`; returns collapsed stacks. Raises ProfilerBusy."""
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy()
+        try:
+            seconds = min(max(seconds, 0.1), PROFILER_MAX_SECONDS)
+            interval = max(interval_ms, 1) / 1000
+            me = threading.get_ident()
+            samples = Counter()
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == me or (not include_idle and _is_idle(frame)):
+                        continue
+                    stack = ";".join(_frame_name(f) for f in _stack(frame))
+                    samples[f"{names.get(ident, ident)};{stack}"] += 1
+                time.sleep(interval)
+            return "".join(f"{stack} {count}\n" for stack, count in samples.most_common())
+        finally:
+            self._lock.release()
+
+
+profiler = SamplingProfiler()
@@ -1,4 +1,4 @@
-from typing import Optional, List
+from typing import Optional, List, Dict
 from pydantic import BaseModel, EmailStr
 
 class UserCreate(BaseModel):
@@ -27,6 +27,49 @@ class Token(BaseModel):
 class DocumentCreate(BaseModel):
     pass # Upload is handled via Form data (UploadFile)
 
+class UploadSessionCreate(BaseModel):
+    filename: str
+    size: Optional[int] = None # Total bytes, if known up front
+
+class UploadSessionResponse(BaseModel):
+    upload_id: str
+    filename: str
+    size: Optional[int] = None
+    received: int
+
+class UploadBatchFile(BaseModel):
+    filename: Optional[str] = None
+    document_id: Optional[int] = None
+    status: Optional[str] = None # Document status, "Ready" when an earlier extraction was reused
+    sha256: Optional[str] = None
+    error: Optional[str] = None # Set instead of document_id when the file was rejected
+
+class UploadBatchResponse(BaseModel):
+    batch_id: str
+    accepted: int
+    rejected: int
+    files: List[UploadBatchFile]
+
+class UploadBatchStatus(BaseModel):
+    batch_id: str
+    total: int
+    ready: int
+    processing: int
+    failed: int
+    statuses: Dict[str, int] # Document count per status
+    complete: bool
+
+class CallbackResult(BaseModel):
+    index: int # Position of the item in the request
+    doc_id: Optional[int] = None
+    status: Optional[str] = None # "success" when applied
+    error: Optional[str] = None
+
+class CallbackBatchResponse(BaseModel):
+    applied: int
+    failed: int
+    results: List[CallbackResult]
+
 class DocumentResponse(BaseModel):
     id: int
     user_id: int
@@ -36,6 +79,9 @@ class DocumentResponse(BaseModel):
     filename: Optional[str] = None
     raw_text: Optional[str] = None
     corrected_html: Optional[str] = None
+    revision: Optional[int] = None # Changes with every update, like the ETag
+    content_revision: Optional[int] = None # Send back as base_revision when patching
+    updated_at: Optional[str] = None
     
     # New: Tags
     tags: List["TagResponse"] = []
@@ -43,6 +89,93 @@ class DocumentResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class DeltaOp(BaseModel):
+    # Exactly one of these, see backend/deltas.py
+    insert: Optional[str] = None
+    retain: Optional[int] = None
+    delete: Optional[int] = None
+
+class DocumentPatch(BaseModel):
+    base_revision: int
+    ops: List[DeltaOp] = [] # Applied to corrected_html
+    filename: Optional[str] = None
+
+class DocumentPatchResponse(BaseModel):
+    id: int
+    revision: int
+    content_revision: int
+    updated_at: Optional[str] = None
+    changed: bool # False when the patch was a no-op and nothing was written
+
+class DocumentPageResponse(BaseModel):
+    number: int
+    html: str
+    revision: Optional[int] = None # Send back as base_revision when saving the page
+
+class DocumentPagesResponse(BaseModel):
+    id: int
+    filename: Optional[str] = None
+    original_path: Optional[str] = None
+    revision: Optional[int] = None
+    content_revision: Optional[int] = None # Pages changed since have a higher revision
+    page_count: int
+    pages: List[DocumentPageResponse] = []
+
+class PageUpdate(BaseModel):
+    number: int
+    base_revision: int
+    ops: Optional[List[DeltaOp]] = None # Applied to the page's html
+    html: Optional[str] = None # Or the whole page
+
+class DocumentPagesUpdate(BaseModel):
+    pages: List[PageUpdate] = []
+    filename: Optional[str] = None
+
+class PageRevision(BaseModel):
+    number: int
+    revision: int
+
+class DocumentPagesSaveResponse(BaseModel):
+    id: int
+    revision: int
+    content_revision: int
+    updated_at: Optional[str] = None
+    changed: bool
+    pages: List[PageRevision] = [] # New revisions of the pages that changed
+
+class DocumentSummary(BaseModel):
+    # Lightweight projection for list views (no raw_text / corrected_html)
+    id: int
+    filename: Optional[str] = None
+    status: str
+    upload_date: str
+    original_path: Optional[str] = None # Tells the dashboard which documents can have a thumbnail
+    tags: List["TagResponse"] = []
+
+    class Config:
+        from_attributes = True
+
+class FileKeyResponse(BaseModel):
+    key: str # Pass as ?key= to /documents/{id}/original and /documents/{id}/thumbnail
+    expires: int # Epoch seconds
+
+class SearchResultResponse(DocumentSummary):
+    score: float = 0.0
+    snippet: Optional[str] = None # Matching excerpt as escaped HTML with <mark> highlights (FTS5 backend only)
+
+class DocumentVersionResponse(BaseModel):
+    version_number: int
+    revision: Optional[int] = None
+    source: Optional[str] = None # edit, extraction, restore
+    size: Optional[int] = None
+    timestamp: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+class DocumentVersionContent(DocumentVersionResponse):
+    corrected_html: str
+
 class TagBase(BaseModel):
     name: str
     color: str = "blue"
@@ -55,3 +188,16 @@ class TagResponse(TagBase):
     
     class Config:
         from_attributes = True
+
+class TagWithCount(TagResponse):
+    document_count: int = 0
+
+class TagBulkUpdate(BaseModel):
+    document_ids: List[int]
+    tags: List[str] # Names; POST /tags/bulk creates the missing ones with `color`
+    color: str = "blue"
+
+class TagBulkResult(BaseModel):
+    tags: List[TagResponse] = []
+    pairs: int = 0 # (document, tag) pairs added or removed
+    documents: int = 0 # Documents whose tags changed
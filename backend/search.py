@@ -0,0 +1,310 @@
+import html
+import math
+import os
+import re
+import sys
+from collections import Counter
+from typing import List, Optional
+from sqlalchemy import text, func, delete, insert, bindparam
+from sqlalchemy.orm import Session, load_only
+from dotenv import load_dotenv
+from . import models
+
+load_dotenv()
+
+# Full-text search over Document.filename and Document.raw_text.
+# On SQLite this uses an FTS5 virtual table; on other databases (or SQLite
+# builds without FTS5) it falls back to a plain inverted index table,
+# search_terms(term, document_id, user_id, weight), which works anywhere.
+# The index is updated inside the same transaction as the document change.
+
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "auto") # auto, fts5, builtin
+FILENAME_WEIGHT = 5.0
+MAX_TERM_LENGTH = 64
+
+TOKEN = re.compile(r"\w+", re.UNICODE)
+QUERY_TOKEN = re.compile(r"(\w+)(\*?)", re.UNICODE)
+# snippet() wraps matches in these; the excerpt is escaped before they become <mark>
+# tags. They are stripped from the indexed text so only snippet() can produce them.
+MARK_START = "\x02"
+MARK_END = "\x03"
+UNMARK = {ord(MARK_START): None, ord(MARK_END): None}
+
+
+class SearchResult:
+    def __init__(self, document_id: int, score: float, snippet: Optional[str] = None):
+        self.document_id = document_id
+        self.score = score
+        self.snippet = snippet
+
+
+def highlight(snippet: Optional[str]) -> Optional[str]:
+    """An FTS5 snippet as HTML: the document text escaped, the matches in <mark>."""
+    if snippet is None:
+        return None
+    return html.escape(snippet).replace(MARK_START, "<mark>").replace(MARK_END, "</mark>")
+
+
+def tokenize(value: Optional[str]) -> List[str]:
+    return [t[:MAX_TERM_LENGTH] for t in TOKEN.findall((value or "").lower())]
+
+
+def parse_query(query: str) -> List[tuple]:
+    """'invoice 2023 acme*' -> [("invoice", False), ("2023", False), ("acme", True)]"""
+    return [(term.lower()[:MAX_TERM_LENGTH], bool(star)) for term, star in QUERY_TOKEN.findall(query or "")]
+
+
+def tagged_document_ids(db: Session, user_id: int, tags: List[str], match_all: bool) -> set:
+    """Ids of documents carrying all (or any) of the user's tags with these names."""
+    query = (
+        db.query(models.document_tags.c.document_id)
+        .join(models.Tag, models.Tag.id == models.document_tags.c.tag_id)
+        .filter(models.Tag.user_id == user_id, models.Tag.name.in_(tags))
+        .group_by(models.document_tags.c.document_id)
+    )
+    if match_all:
+        query = query.having(func.count(func.distinct(models.Tag.id)) == len(set(tags)))
+    return {row[0] for row in query.all()}
+
+
+class FTS5Backend:
+    name = "fts5"
+
+    def ensure(self, engine):
+        with engine.connect() as conn:
+            conn.execute(text(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5("
+                "filename, body, user_id UNINDEXED, tokenize='unicode61 remove_diacritics 2')"
+            ))
+            conn.commit()
+
+    def index(self, db: Session, doc):
+        self.remove(db, doc.id)
+        self.add(db, [doc])
+
+    def add(self, db: Session, docs):
+        db.execute(
+            text("INSERT INTO documents_fts (rowid, filename, body, user_id) VALUES (:id, :filename, :body, :user_id)"),
+            [{"id": doc.id, "filename": doc.filename or "", "body": (doc.raw_text or "").translate(UNMARK), "user_id": doc.user_id} for doc in docs],
+        )
+
+    def remove(self, db: Session, doc_id: int):
+        db.execute(text("DELETE FROM documents_fts WHERE rowid = :id"), {"id": doc_id})
+
+    def remove_many(self, db: Session, doc_ids: List[int]):
+        statement = text("DELETE FROM documents_fts WHERE rowid IN :ids").bindparams(bindparam("ids", expanding=True))
+        db.execute(statement, {"ids": list(doc_ids)})
+
+    def clear(self, db: Session):
+        db.execute(text("DELETE FROM documents_fts"))
+
+    def is_empty(self, db: Session) -> bool:
+        return db.execute(text("SELECT 1 FROM documents_fts LIMIT 1")).first() is None
+
+    def search(self, db: Session, user_id: int, terms: List[tuple], tags: Optional[List[str]], match_all_tags: bool, limit: int, offset: int) -> List[SearchResult]:
+        match = " AND ".join('"{}"{}'.format(term, "*" if prefix else "") for term, prefix in terms)
+        sql = (
+            "SELECT rowid, bm25(documents_fts, :filename_weight, 1.0) AS score, "
+            "snippet(documents_fts, 1, :mark_start, :mark_end, '…', 12) AS snippet "
+            "FROM documents_fts WHERE documents_fts MATCH :match AND user_id = :user_id"
+        )
+        params = {
+            "match": match, "user_id": user_id, "filename_weight": FILENAME_WEIGHT,
+            "mark_start": MARK_START, "mark_end": MARK_END, "limit": limit, "offset": offset,
+        }
+        if tags:
+            # The unary + keeps SQLite from driving the FTS scan off this rowid list
+            sql += (
+                " AND +rowid IN (SELECT dt.document_id FROM document_tags dt JOIN tags t ON t.id = dt.tag_id"
+                " WHERE t.user_id = :user_id AND t.name IN :tags GROUP BY dt.document_id HAVING COUNT(DISTINCT t.id) >= :tag_count)"
+            )
+            params["tags"] = list(tags)
+            params["tag_count"] = len(set(tags)) if match_all_tags else 1
+        sql += " ORDER BY score LIMIT :limit OFFSET :offset"
+        statement = text(sql)
+        if tags:
+            statement = statement.bindparams(bindparam("tags", expanding=True))
+        rows = db.execute(statement, params).all()
+        # bm25() is lower-is-better; flip it so higher scores rank first for clients
+        return [SearchResult(row.rowid, -row.score, highlight(row.snippet)) for row in rows]
+
+
+class BuiltinBackend:
+    name = "builtin"
+
+    def ensure(self, engine):
+        models.SearchTerm.__table__.create(bind=engine, checkfirst=True)
+
+    def index(self, db: Session, doc):
+        self.remove(db, doc.id)
+        self.add(db, [doc])
+
+    def add(self, db: Session, docs):
+        rows = []
+        for doc in docs:
+            weights = Counter()
+            for term in tokenize(doc.filename):
+                weights[term] += FILENAME_WEIGHT
+            for term in tokenize(doc.raw_text):
+                weights[term] += 1.0
+            rows.extend(
+                {"term": term, "document_id": doc.id, "user_id": doc.user_id, "weight": weight}
+                for term, weight in weights.items()
+            )
+        if rows:
+            # Core insert on the table: one executemany, no ORM bookkeeping per row
+            db.execute(insert(models.SearchTerm.__table__), rows)
+
+    def remove(self, db: Session, doc_id: int):
+        db.execute(delete(models.SearchTerm.__table__).where(models.SearchTerm.document_id == doc_id))
+
+    def remove_many(self, db: Session, doc_ids: List[int]):
+        db.execute(delete(models.SearchTerm.__table__).where(models.SearchTerm.document_id.in_(list(doc_ids))))
+
+    def clear(self, db: Session):
+        db.execute(delete(models.SearchTerm.__table__))
+
+    def is_empty(self, db: Session) -> bool:
+        return db.query(models.SearchTerm.document_id).limit(1).first() is None
+
+    def search(self, db: Session, user_id: int, terms: List[tuple], tags: Optional[List[str]], match_all_tags: bool, limit: int, offset: int) -> List[SearchResult]:
+        SearchTerm = models.SearchTerm
+        total_docs = db.query(func.count(models.Document.id)).filter(models.Document.user_id == user_id).scalar() or 1
+
+        scores = None
+        for term, prefix in terms:
+            if prefix:
+                # A range instead of LIKE so the (user_id, term) index is used
+                condition = (SearchTerm.term >= term) & (SearchTerm.term < term[:-1] + chr(ord(term[-1]) + 1))
+            else:
+                condition = SearchTerm.term == term
+            rows = (
+                db.query(SearchTerm.document_id, func.sum(SearchTerm.weight))
+                .filter(SearchTerm.user_id == user_id, condition)
+                .group_by(SearchTerm.document_id)
+                .all()
+            )
+            if not rows:
+                return []
+            # tf-idf: rarer terms count for more
+            idf = math.log(1 + total_docs / len(rows))
+            term_scores = {doc_id: (1 + math.log(weight)) * idf for doc_id, weight in rows}
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {doc_id: score + term_scores[doc_id] for doc_id, score in scores.items() if doc_id in term_scores}
+            if not scores:
+                return []
+
+        if tags:
+            allowed = tagged_document_ids(db, user_id, tags, match_all_tags)
+            scores = {doc_id: score for doc_id, score in scores.items() if doc_id in allowed}
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[offset:offset + limit]
+        return [SearchResult(doc_id, score) for doc_id, score in ranked]
+
+
+def _select_backend(engine):
+    choice = SEARCH_BACKEND
+    if choice == "auto":
+        choice = "fts5" if engine.dialect.name == "sqlite" else "builtin"
+    if choice == "fts5":
+        try:
+            backend = FTS5Backend()
+            backend.ensure(engine)
+            return backend
+        except Exception as e:
+            print(f"FTS5 unavailable ({e}), using the built-in search index")
+    backend = BuiltinBackend()
+    backend.ensure(engine)
+    return backend
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        from .database import engine
+        _backend = _select_backend(engine)
+    return _backend
+
+
+def index_document(db: Session, doc):
+    get_backend().index(db, doc)
+
+
+def index_documents(db: Session, docs: list):
+    """index_document for many documents: one delete and one multi-row insert."""
+    if docs:
+        backend = get_backend()
+        backend.remove_many(db, [doc.id for doc in docs])
+        backend.add(db, docs)
+
+
+def remove_document(db: Session, doc_id: int):
+    get_backend().remove(db, doc_id)
+
+
+def search(db: Session, user_id: int, query: str, tags: Optional[List[str]] = None, match_all_tags: bool = True, limit: int = 20, offset: int = 0) -> List[SearchResult]:
+    terms = parse_query(query)
+    if not terms:
+        return []
+    return get_backend().search(db, user_id, terms, tags, match_all_tags, limit, offset)
+
+
+def rebuild(db: Session, batch_size: int = 1000) -> int:
+    backend = get_backend()
+    backend.clear(db)
+    count = 0
+    last_id = 0
+    while True:
+        docs = (
+            db.query(models.Document)
+            .options(load_only(models.Document.id, models.Document.user_id, models.Document.filename, models.Document.raw_text))
+            .filter(models.Document.id > last_id)
+            .order_by(models.Document.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not docs:
+            break
+        backend.add(db, docs)
+        count += len(docs)
+        last_id = docs[-1].id
+        db.commit()
+        db.expunge_all()
+    db.commit()
+    return count
+
+
+def ensure_index() -> int:
+    """Index every document if the index is empty but documents exist.
+
+    That is the state of a database from before search was added, or after
+    switching SEARCH_BACKEND, where only documents changed since would be found.
+    Returns the number of documents indexed.
+    """
+    from .database import SessionLocal
+    with SessionLocal() as db:
+        if not get_backend().is_empty(db) or db.query(models.Document.id).limit(1).first() is None:
+            return 0
+        count = rebuild(db)
+    print(f"Indexed {count} existing document(s) with the {get_backend().name} backend")
+    return count
+
+
+if __name__ == "__main__":
+    # python -m backend.search rebuild
+    if sys.argv[1:] != ["rebuild"]:
+        print("Usage: python -m backend.search rebuild")
+        sys.exit(1)
+    from .database import SessionLocal, engine
+    models.Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        total = rebuild(session)
+        print(f"Indexed {total} document(s) with the {get_backend().name} backend")
+    finally:
+        session.close()
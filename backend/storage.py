@@ -0,0 +1,476 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+import zipfile
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Iterable, Optional
+from starlette.concurrency import run_in_threadpool
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = "uploads"
+# Kept outside UPLOAD_DIR so unfinished uploads are never served by the /uploads mount
+PARTIAL_DIR = os.getenv("UPLOAD_PARTIAL_DIR", "uploads_partial")
+
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_MB", "50")) * 1024 * 1024
+# Incoming data is buffered to this size before each (thread-offloaded) disk write
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_KB", "1024")) * 1024
+# Unfinished chunked uploads are discarded after this long
+UPLOAD_SESSION_TTL_SECONDS = int(os.getenv("UPLOAD_SESSION_TTL_SECONDS", str(24 * 3600)))
+# Batch uploads: files per request (zip entries included) and total bytes (zip entries uncompressed)
+UPLOAD_BATCH_MAX_FILES = int(os.getenv("UPLOAD_BATCH_MAX_FILES", "200"))
+UPLOAD_BATCH_MAX_BYTES = int(os.getenv("UPLOAD_BATCH_MAX_MB", "500")) * 1024 * 1024
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UploadOffsetMismatch(Exception):
+    def __init__(self, expected: int):
+        super().__init__(f"Expected offset {expected}")
+        self.expected = expected
+
+
+def new_temp_path() -> str:
+    os.makedirs(PARTIAL_DIR, exist_ok=True)
+    return os.path.join(PARTIAL_DIR, f"{uuid.uuid4().hex}.upload")
+
+
+def blob_path(digest: str, filename: str) -> str:
+    # Content-addressed: identical uploads share one file (the extension is kept for previews)
+    extension = os.path.splitext(filename or "")[1].lower()
+    return f"{UPLOAD_DIR}/{digest}{extension}"
+
+
+# A blob is shared by every document with the same content, so deleting one
+# has to be atomic with an upload reusing it. Both happen under _blob_lock:
+# store_blob() pins the blob until the upload's document is committed
+# (release_blobs), and remove_unused_blob() only deletes a blob that is
+# neither pinned nor referenced by any document. The lock is per process,
+# which covers the one uvicorn worker the Dockerfile and Procfile run.
+_blob_lock = threading.Lock()
+_pinned_blobs = Counter()
+
+
+def store_blob(temp_path: str, digest: str, filename: str) -> str:
+    """Move a finished upload to its content-addressed path, dropping it if the blob already exists.
+
+    The blob stays pinned until release_blobs() is called with its path.
+    """
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    path = blob_path(digest, filename)
+    with _blob_lock:
+        if os.path.exists(path):
+            remove_quietly(temp_path)
+        else:
+            os.replace(temp_path, path)
+        _pinned_blobs[path] += 1
+    return path
+
+
+def release_blobs(paths: Iterable[str]):
+    """Unpin blobs once the documents using them are committed (or failed to be)."""
+    with _blob_lock:
+        for path in paths:
+            _pinned_blobs[path] -= 1
+            if _pinned_blobs[path] <= 0:
+                del _pinned_blobs[path]
+
+
+def release_stored(entries: Iterable[dict]):
+    """release_blobs() for the stored entries of a batch result list."""
+    release_blobs(entry["path"] for entry in entries if "path" in entry)
+
+
+def remove_unused_blob(path: str, count_references: Callable[[], int]) -> bool:
+    """Delete the blob unless an upload has it pinned or count_references() finds documents using it."""
+    with _blob_lock:
+        if _pinned_blobs.get(path) or count_references():
+            return False
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning("Could not remove blob %s: %s", path, e)
+            return False
+    return True
+
+
+async def iter_upload_file(file) -> AsyncIterator[bytes]:
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            break
+        yield chunk
+
+
+async def write_stream(chunks: AsyncIterator[bytes], path: str, hasher, offset: int = 0, limit: int = UPLOAD_MAX_BYTES) -> int:
+    """Append the stream to `path`, feeding `hasher` on the way. Returns the new file size.
+
+    Raises UploadTooLarge as soon as the total would pass `limit`, before the
+    extra data reaches the disk.
+    """
+    size = offset
+    buffer = bytearray()
+    f = await run_in_threadpool(open, path, "ab" if offset else "wb")
+    try:
+        async for chunk in chunks:
+            size += len(chunk)
+            if size > limit:
+                raise UploadTooLarge()
+            hasher.update(chunk)
+            buffer += chunk
+            if len(buffer) >= UPLOAD_CHUNK_BYTES:
+                await run_in_threadpool(f.write, bytes(buffer))
+                buffer.clear()
+        if buffer:
+            await run_in_threadpool(f.write, bytes(buffer))
+    finally:
+        await run_in_threadpool(f.close)
+    return size
+
+
+async def save_upload(file, limit: int = UPLOAD_MAX_BYTES) -> tuple:
+    """Stream an UploadFile into blob storage. Returns (path, size, sha256 hex)."""
+    temp_path = new_temp_path()
+    hasher = hashlib.sha256()
+    try:
+        size = await write_stream(iter_upload_file(file), temp_path, hasher, limit=limit)
+    except BaseException:
+        remove_quietly(temp_path)
+        raise
+    digest = hasher.hexdigest()
+    path = await run_in_threadpool(store_blob, temp_path, digest, file.filename)
+    return path, size, digest
+
+
+def copy_to_blob(src, filename: str, limit: int = UPLOAD_MAX_BYTES) -> tuple:
+    """Blocking counterpart of save_upload for a file object, e.g. a zip entry."""
+    temp_path = new_temp_path()
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        with open(temp_path, "wb") as f:
+            for chunk in iter(lambda: src.read(UPLOAD_CHUNK_BYTES), b""):
+                size += len(chunk)
+                if size > limit:
+                    raise UploadTooLarge()
+                hasher.update(chunk)
+                f.write(chunk)
+    except BaseException:
+        remove_quietly(temp_path)
+        raise
+    digest = hasher.hexdigest()
+    return store_blob(temp_path, digest, filename), size, digest
+
+
+# --- Batch uploads ---
+# Every file of a batch (or of a zip archive in it) is stored like a single
+# upload. A file that can't be stored is reported on its own and doesn't fail
+# the rest of the batch. Results are dicts: {"filename", "path", "size",
+# "sha256"} for stored files, {"filename", "error"} otherwise.
+
+def is_archive(file) -> bool:
+    return (file.filename or "").lower().endswith(".zip") or file.content_type in ("application/zip", "application/x-zip-compressed")
+
+
+def archive_members(archive: zipfile.ZipFile) -> list:
+    """Entries worth extracting: no directories, macOS resource forks or hidden files."""
+    members = []
+    for info in archive.infolist():
+        parts = info.filename.split("/")
+        if info.is_dir() or parts[0] == "__MACOSX" or any(part.startswith(".") for part in parts):
+            continue
+        members.append(info)
+    return members
+
+
+def batch_entry_limit(remaining_bytes: int) -> tuple:
+    # (limit, error reported when a file goes past it)
+    if remaining_bytes < UPLOAD_MAX_BYTES:
+        return max(remaining_bytes, 0), "Batch too large"
+    return UPLOAD_MAX_BYTES, "Upload too large"
+
+
+def save_archive(fileobj, max_files: int, max_bytes: int) -> list:
+    """Store each entry of a zip archive. Raises zipfile.BadZipFile if it isn't one."""
+    results = []
+    stored_bytes = 0
+    with zipfile.ZipFile(fileobj) as archive:
+        try:
+            for n, info in enumerate(archive_members(archive)):
+                filename = os.path.basename(info.filename)
+                if n >= max_files:
+                    results.append({"filename": filename, "error": "Too many files in one batch"})
+                    continue
+                # Checked while extracting: the sizes in the archive's directory can't be trusted
+                limit, too_large = batch_entry_limit(max_bytes - stored_bytes)
+                try:
+                    with archive.open(info) as src:
+                        path, size, digest = copy_to_blob(src, filename, limit)
+                except UploadTooLarge:
+                    results.append({"filename": filename, "error": too_large})
+                    continue
+                except (zipfile.BadZipFile, NotImplementedError, RuntimeError):
+                    # Corrupt, encrypted or an unsupported compression method
+                    results.append({"filename": filename, "error": "Unreadable archive entry"})
+                    continue
+                stored_bytes += size
+                results.append({"filename": filename, "path": path, "size": size, "sha256": digest})
+        except BaseException:
+            release_stored(results) # No document will be created for the entries stored so far
+            raise
+    return results
+
+
+async def save_batch(files: list) -> list:
+    """Store every uploaded file, expanding zip archives in a worker thread.
+
+    The stored files stay pinned until create_uploaded_documents() runs; if
+    storing fails partway, the ones stored so far are released here.
+    """
+    results = []
+    stored_bytes = 0
+    try:
+        for file in files:
+            remaining_files = UPLOAD_BATCH_MAX_FILES - len(results)
+            if is_archive(file):
+                try:
+                    entries = await run_in_threadpool(save_archive, file.file, remaining_files, UPLOAD_BATCH_MAX_BYTES - stored_bytes)
+                except zipfile.BadZipFile:
+                    entries = [{"filename": file.filename, "error": "Not a valid zip archive"}]
+            elif remaining_files <= 0:
+                entries = [{"filename": file.filename, "error": "Too many files in one batch"}]
+            else:
+                limit, too_large = batch_entry_limit(UPLOAD_BATCH_MAX_BYTES - stored_bytes)
+                try:
+                    path, size, digest = await save_upload(file, limit=limit)
+                    entries = [{"filename": file.filename, "path": path, "size": size, "sha256": digest}]
+                except UploadTooLarge:
+                    entries = [{"filename": file.filename, "error": too_large}]
+            stored_bytes += sum(entry.get("size", 0) for entry in entries)
+            results += entries
+    except BaseException:
+        release_stored(results)
+        raise
+    return results
+
+
+def remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def hash_file(path: str) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK_BYTES), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+class UploadSizeLimitMiddleware:
+    """Rejects requests whose body is larger than any allowed upload.
+
+    Multipart bodies are spooled to disk before the endpoint runs, so the limit
+    has to be enforced here to protect the disk: up front from Content-Length,
+    and while the body arrives for chunked requests, which don't declare one.
+    `path_limits` raises (or lowers) the limit for specific paths, e.g. batch uploads.
+    """
+
+    def __init__(self, app, max_body_bytes: int, path_limits: Optional[dict] = None):
+        self.app = app
+        self.max_body_bytes = max_body_bytes
+        self.path_limits = path_limits or {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        max_body_bytes = self.path_limits.get(scope["path"], self.max_body_bytes)
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                if value.isdigit() and int(value) > max_body_bytes:
+                    await self._reject(send)
+                    return
+                break
+
+        received = 0
+        exceeded = False
+        started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            if exceeded:
+                raise BodyTooLarge()
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_body_bytes:
+                    exceeded = True
+                    raise BodyTooLarge()
+            return message
+
+        async def guarded_send(message):
+            nonlocal started
+            if exceeded:
+                return # The 413 below replaces whatever the app made of the error
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            # The body parser may re-raise BodyTooLarge as something else (FastAPI: a 400)
+            if not exceeded:
+                raise
+        if exceeded and not started:
+            # The rest of the body is never read; the server closes the connection after this
+            await self._reject(send)
+
+    async def _reject(self, send):
+        body = json.dumps({"detail": "Upload too large"}).encode()
+        await send({"type": "http.response.start", "status": 413, "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()), (b"connection", b"close")]})
+        await send({"type": "http.response.body", "body": body})
+
+
+# --- Resumable chunked uploads ---
+# Each session is a partial data file plus a small JSON metadata file, so an
+# upload can be resumed after a dropped connection or a server restart.
+
+class UploadSessions:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._hashers = {}  # upload_id -> (offset, sha256) for uploads appended in this process
+        self._locks = {}
+
+    def _paths(self, upload_id: str):
+        base = os.path.join(self.directory, upload_id)
+        return base + ".part", base + ".json"
+
+    def _write_meta(self, upload_id: str, meta: dict):
+        _, meta_path = self._paths(upload_id)
+        tmp_path = meta_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, meta_path)
+
+    def create(self, user_id: int, filename: str, size: Optional[int]) -> dict:
+        if size is not None and size > UPLOAD_MAX_BYTES:
+            raise UploadTooLarge()
+        os.makedirs(self.directory, exist_ok=True)
+        self.expire()
+        upload_id = uuid.uuid4().hex
+        meta = {"upload_id": upload_id, "user_id": user_id, "filename": filename, "size": size, "received": 0, "created": time.time()}
+        open(self._paths(upload_id)[0], "wb").close()
+        self._write_meta(upload_id, meta)
+        self._hashers[upload_id] = (0, hashlib.sha256())
+        return meta
+
+    def get(self, upload_id: str, user_id: int) -> Optional[dict]:
+        if not upload_id.isalnum():
+            return None
+        try:
+            with open(self._paths(upload_id)[1]) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return meta if meta["user_id"] == user_id else None
+
+    @asynccontextmanager
+    async def locked(self, upload_id: str, user_id: int):
+        """Hold the session's lock; yields its metadata, or None when the user has no such session.
+
+        Locks only exist for sessions that do, so made-up ids don't pile up;
+        complete() and abort() (also run by expire()) drop them.
+        """
+        if self.get(upload_id, user_id) is None:
+            yield None
+            return
+        lock = self._locks.setdefault(upload_id, asyncio.Lock())
+        async with lock:
+            # Read again: the request we waited for may have completed or aborted the session
+            meta = self.get(upload_id, user_id)
+            try:
+                yield meta
+            finally:
+                if meta is None and self._locks.get(upload_id) is lock:
+                    del self._locks[upload_id]
+
+    async def append(self, meta: dict, offset: int, chunks: AsyncIterator[bytes]) -> dict:
+        upload_id = meta["upload_id"]
+        if offset != meta["received"]:
+            raise UploadOffsetMismatch(meta["received"])
+        data_path, _ = self._paths(upload_id)
+
+        hashed_offset, hasher = self._hashers.get(upload_id, (None, None))
+        if hashed_offset != offset:
+            hasher = None  # Resumed in another process; the hash is recomputed on completion
+        limit = min(meta["size"], UPLOAD_MAX_BYTES) if meta["size"] is not None else UPLOAD_MAX_BYTES
+
+        # Truncate anything a dropped request left after the acknowledged offset
+        await run_in_threadpool(os.truncate, data_path, offset)
+        try:
+            received = await write_stream(chunks, data_path, hasher or hashlib.sha256(), offset=offset, limit=limit)
+        except BaseException:
+            self._hashers.pop(upload_id, None)
+            raise
+        meta["received"] = received
+        await run_in_threadpool(self._write_meta, upload_id, meta)
+        if hasher is not None:
+            self._hashers[upload_id] = (received, hasher)
+        return meta
+
+    def complete(self, meta: dict) -> tuple:
+        """Move the finished upload into place. Returns (path, size, sha256 hex)."""
+        upload_id = meta["upload_id"]
+        data_path, meta_path = self._paths(upload_id)
+        if meta["size"] is not None and meta["received"] != meta["size"]:
+            raise UploadOffsetMismatch(meta["received"])
+
+        hashed_offset, hasher = self._hashers.pop(upload_id, (None, None))
+        digest = hasher.hexdigest() if hashed_offset == meta["received"] else hash_file(data_path)
+
+        path = store_blob(data_path, digest, meta["filename"])
+        remove_quietly(meta_path)
+        self._locks.pop(upload_id, None)
+        return path, meta["received"], digest
+
+    def abort(self, meta: dict):
+        data_path, meta_path = self._paths(meta["upload_id"])
+        remove_quietly(data_path)
+        remove_quietly(meta_path)
+        self._hashers.pop(meta["upload_id"], None)
+        self._locks.pop(meta["upload_id"], None)
+
+    def expire(self):
+        cutoff = time.time() - UPLOAD_SESSION_TTL_SECONDS
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError:
+            return
+        for entry in entries:
+            if entry.name.endswith(".json") and entry.stat().st_mtime < cutoff:
+                upload_id = entry.name[:-len(".json")]
+                self.abort({"upload_id": upload_id})
+
+
+upload_sessions = UploadSessions(PARTIAL_DIR)
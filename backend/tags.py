@@ -0,0 +1,168 @@
+import os
+from datetime import datetime
+from typing import Dict, Iterable, List
+from sqlalchemy import and_, delete, exists, func, insert, select, update
+from sqlalchemy.orm import Session, aliased
+from dotenv import load_dotenv
+from . import models
+
+load_dotenv()
+
+# Per-user tags.
+#
+# Every user has their own tags, unique by (user_id, name). document_tags has a
+# unique (document_id, tag_id) index, which also answers "tags of these
+# documents", and a (tag_id, document_id) one, which lists a tag's documents
+# in id order (keyset pages, counts) without reading the table. Adding and
+# removing work on sets: one statement for all the (document, tag) pairs, and
+# one UPDATE bumping the revision of the documents that changed (per
+# TAG_BULK_CHUNK_SIZE documents, to stay under the bound parameter limit).
+#
+# None of these commit; the caller does, once.
+
+# Most documents one bulk request may tag or untag
+TAG_BULK_MAX = int(os.getenv("TAG_BULK_MAX", "5000"))
+# Most tag names in one request or filter
+TAG_FILTER_MAX = int(os.getenv("TAG_FILTER_MAX", "20"))
+# Document ids per statement: with TAG_FILTER_MAX tag ids beside them this stays
+# under the 999 bound parameters SQLite before 3.32 allows
+TAG_BULK_CHUNK_SIZE = 500
+TAG_NAME_MAX = models.Tag.__table__.c.name.type.length
+
+document_tags = models.document_tags
+
+
+def normalize_names(names: Iterable[str]) -> List[str]:
+    """Stripped, non-empty, each once, in the given order. Raises ValueError for names that are too long."""
+    result = []
+    for name in names:
+        name = (name or "").strip()
+        if not name or name in result:
+            continue
+        if len(name) > TAG_NAME_MAX:
+            raise ValueError(f"Tag names are at most {TAG_NAME_MAX} characters")
+        result.append(name)
+    return result
+
+
+def get_tags(db: Session, user_id: int, names: List[str]) -> Dict[str, models.Tag]:
+    if not names:
+        return {}
+    rows = db.execute(select(models.Tag).where(models.Tag.user_id == user_id, models.Tag.name.in_(names))).scalars()
+    return {tag.name: tag for tag in rows}
+
+
+def get_or_create_tags(db: Session, user_id: int, names: List[str], color: str = "blue") -> Dict[str, models.Tag]:
+    """The user's tags by name, inserting the missing ones in one statement.
+
+    A concurrent request creating the same name fails the unique index with
+    IntegrityError; roll back and retry.
+    """
+    tags = get_tags(db, user_id, names)
+    missing = [name for name in names if name not in tags]
+    if missing:
+        db.execute(insert(models.Tag), [{"user_id": user_id, "name": name, "color": color} for name in missing])
+        tags = get_tags(db, user_id, names)
+    return tags
+
+
+def _chunks(doc_ids: List[int]):
+    for start in range(0, len(doc_ids), TAG_BULK_CHUNK_SIZE):
+        yield doc_ids[start:start + TAG_BULK_CHUNK_SIZE]
+
+
+def _owned(user_id: int, doc_ids: List[int]):
+    return select(models.Document.id).where(models.Document.user_id == user_id, models.Document.id.in_(doc_ids))
+
+
+def _touch(db: Session, doc_ids: List[int]):
+    # Tags are part of the document response, so its ETag has to change
+    for chunk in _chunks(doc_ids):
+        db.execute(
+            update(models.Document)
+            .where(models.Document.id.in_(chunk))
+            .values(revision=func.coalesce(models.Document.revision, 0) + 1, updated_at=str(datetime.utcnow()))
+            .execution_options(synchronize_session=False)
+        )
+
+
+def add_tags(db: Session, user_id: int, doc_ids: List[int], tag_ids: List[int]) -> tuple:
+    """Tag the user's documents among doc_ids. Returns (pairs added, documents changed)."""
+    if not doc_ids or not tag_ids:
+        return 0, 0
+    tag = aliased(models.Tag)
+    pairs = []
+    for chunk in _chunks(doc_ids):
+        pairs += db.execute(
+            select(models.Document.id, tag.id)
+            .where(models.Document.user_id == user_id, models.Document.id.in_(chunk))
+            .join(tag, and_(tag.user_id == user_id, tag.id.in_(tag_ids)))
+            .where(~exists().where(document_tags.c.document_id == models.Document.id, document_tags.c.tag_id == tag.id))
+        ).all()
+    if not pairs:
+        return 0, 0
+    db.execute(insert(document_tags), [{"document_id": doc_id, "tag_id": tag_id} for doc_id, tag_id in pairs])
+    changed = sorted({doc_id for doc_id, _ in pairs})
+    _touch(db, changed)
+    return len(pairs), len(changed)
+
+
+def remove_tags(db: Session, user_id: int, doc_ids: List[int], tag_ids: List[int]) -> tuple:
+    """Untag the user's documents among doc_ids. Returns (pairs removed, documents changed)."""
+    if not doc_ids or not tag_ids:
+        return 0, 0
+    pairs = []
+    for chunk in _chunks(doc_ids):
+        pairs += db.execute(
+            select(document_tags.c.document_id, document_tags.c.tag_id)
+            .where(document_tags.c.document_id.in_(_owned(user_id, chunk)), document_tags.c.tag_id.in_(tag_ids))
+        ).all()
+    if not pairs:
+        return 0, 0
+    changed = sorted({doc_id for doc_id, _ in pairs})
+    for chunk in _chunks(changed):
+        db.execute(delete(document_tags).where(document_tags.c.document_id.in_(chunk), document_tags.c.tag_id.in_(tag_ids)))
+    _touch(db, changed)
+    return len(pairs), len(changed)
+
+
+def tag_counts(db: Session, user_id: int) -> list:
+    """[(tag, number of documents)] for all the user's tags, by name."""
+    counts = (
+        select(document_tags.c.tag_id, func.count().label("document_count"))
+        .join(models.Tag, models.Tag.id == document_tags.c.tag_id)
+        .where(models.Tag.user_id == user_id)
+        .group_by(document_tags.c.tag_id)
+        .subquery()
+    )
+    rows = db.execute(
+        select(models.Tag, func.coalesce(counts.c.document_count, 0))
+        .outerjoin(counts, counts.c.tag_id == models.Tag.id)
+        .where(models.Tag.user_id == user_id)
+        .order_by(models.Tag.name)
+    ).all()
+    return [(tag, count) for tag, count in rows]
+
+
+def filter_documents(query, user_id: int, names: List[str], match_all: bool):
+    """Restrict a select of Document to those with all (or any) of the user's tags with these names.
+
+    Returns (query, key): order and page by key, which equals Document.id.
+    """
+    if not match_all:
+        tag_ids = select(models.Tag.id).where(models.Tag.user_id == user_id, models.Tag.name.in_(names))
+        query = query.where(models.Document.id.in_(select(document_tags.c.document_id).where(document_tags.c.tag_id.in_(tag_ids))))
+        return query, models.Document.id
+    # One join per name. Ordering by the first tag's document_id lets its
+    # (tag_id, document_id) range drive the query in order, so a page reads
+    # that tag's entries from the cursor on instead of every document of the user.
+    key = None
+    for name in names:
+        tag = aliased(models.Tag)
+        link = document_tags.alias()
+        query = query.join(link, link.c.document_id == models.Document.id).join(
+            tag, and_(tag.id == link.c.tag_id, tag.user_id == user_id, tag.name == name)
+        )
+        if key is None:
+            key = link.c.document_id
+    return query, key
@@ -1,31 +1,110 @@
 # from .celery_app import celery_app
 from .database import SessionLocal
 from .models import Document
+from .events import publish_status
+from . import extractors, search, versions, exports, originals, metrics
 import time
 import os
+from datetime import datetime
 import requests
+from sqlalchemy import func
+from requests.adapters import HTTPAdapter
 
 # CONFIGURATION: N8N Webhook URL
 # Replace this with your actual N8N Webhook URL (POST)
 N8N_WEBHOOK_URL = os.getenv("N8N_WEBHOOK_URL", "http://localhost:5678/webhook/process-document")
+N8N_TIMEOUT_SECONDS = float(os.getenv("N8N_TIMEOUT_SECONDS", "5"))
+
+# Max simultaneous webhook calls (also the number of dispatch workers)
+N8N_CONCURRENCY = int(os.getenv("N8N_CONCURRENCY", "4"))
+
+# Bulk callbacks (POST /n8n/callback/batch): results per request and request body size
+N8N_CALLBACK_BATCH_MAX_ITEMS = int(os.getenv("N8N_CALLBACK_BATCH_MAX_ITEMS", "10000"))
+N8N_CALLBACK_BATCH_MAX_BYTES = int(os.getenv("N8N_CALLBACK_BATCH_MAX_MB", "256")) * 1024 * 1024
 
 # APP_BASE_URL is required for N8N to download the file from this server
 # In Hugging Face, it should be: https://hmurtaza720-text-extractor.hf.space
 APP_BASE_URL = os.getenv("APP_BASE_URL", "http://localhost:7860")
 
+# One pooled session for all webhook calls (keeps connections to N8N alive)
+http = requests.Session()
+http.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=N8N_CONCURRENCY))
+http.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=N8N_CONCURRENCY))
+
+
+# Statuses of a document still waiting for its text; anything else (Ready, Error) is final
+IN_FLIGHT_STATUSES = ("Processing", "Sending to N8N...")
+
+
+class DispatchError(Exception):
+    def __init__(self, status: str, message: str):
+        super().__init__(message)
+        self.status = status # Document status to show if no retry is left
+
+
+def extract_document_task(doc_id: int) -> bool:
+    """Extract the document's text locally (EXTRACTOR_BACKEND=local).
+
+    Returns False when the file has to go to N8N instead: another backend is
+    configured, the file type has no local extractor or it needs OCR.
+    """
+    db = SessionLocal()
+    try:
+        doc = db.query(Document).filter(Document.id == doc_id).first()
+        if not doc:
+            return True # Deleted meanwhile, nothing to send either
+        result = extractors.extract(doc.original_path)
+        if result is None:
+            return False
+
+        print(f"Extracted Doc ID: {doc_id} locally")
+        doc.raw_text, doc.corrected_html = result
+        doc.page_count = None # Pages are split again from the new content
+        doc.status = "Ready"
+        doc.touch(content=True)
+        search.index_document(db, doc)
+        versions.record(db, doc, source="extraction")
+        db.commit()
+        exports.cache.invalidate(doc.id)
+        publish_status(doc)
+        return True
+    finally:
+        db.close()
+
+
+def set_status(db, doc, status: str, from_statuses=IN_FLIGHT_STATUSES) -> bool:
+    """Move the document to `status` and commit, unless it already left `from_statuses`.
+
+    Checked and written in one UPDATE, so a callback that made the document
+    Ready meanwhile is neither overwritten nor given a lower revision.
+    """
+    updated = db.query(Document).filter(Document.id == doc.id, Document.status.in_(from_statuses)).update(
+        {"status": status, "revision": func.coalesce(Document.revision, 0) + 1, "updated_at": str(datetime.utcnow())},
+        synchronize_session=False,
+    )
+    db.commit()
+    if updated:
+        publish_status(doc)
+    return bool(updated)
+
+
 # @celery_app.task(bind=True)
-def process_document_task(doc_id: int):
-    # self argument removed since it's no longer a bound task
+def process_document_task(doc_id: int, final_attempt: bool = True):
+    """Send one document to the N8N webhook.
+
+    Raises DispatchError when the webhook could not be reached or rejected the
+    request, so the dispatcher can retry. The failure is only written to the
+    document status on the final attempt.
+    """
     db = SessionLocal()
+    doc = None
     try:
         doc = db.query(Document).filter(Document.id == doc_id).first()
         if not doc:
             return "Document not found"
         
-        # Construct the file URL so N8N can download it
-        # Assuming filename is stored or derived from path
-        filename = os.path.basename(doc.original_path)
-        file_download_url = f"{APP_BASE_URL}/{doc.original_path.replace(os.sep, '/')}"
+        # Signed for this document only, so N8N can download it without a login
+        file_download_url = f"{APP_BASE_URL}/documents/{doc.id}/original?key={originals.document_file_key(doc.id)}"
         
         print(f"Triggering N8N for Doc ID: {doc_id} | URL: {file_download_url}")
 
@@ -36,29 +115,33 @@ def process_document_task(doc_id: int):
             "original_path": doc.original_path
         }
 
+        start = time.perf_counter()
         try:
             # Send Webhook to N8N
-            response = requests.post(N8N_WEBHOOK_URL, json=payload, timeout=5)
-            
-            if response.status_code >= 200 and response.status_code < 300:
-                doc.status = "Sending to N8N..."
-                print(f"N8N Triggered Successfully: {response.text}")
-            else:
-                 doc.status = f"N8N Error: {response.status_code}"
-                 print(f"N8N Webhook Failed: {response.status_code} - {response.text}")
-
-        except Exception as we:
+            response = http.post(N8N_WEBHOOK_URL, json=payload, timeout=N8N_TIMEOUT_SECONDS)
+        except requests.RequestException as we:
+            metrics.n8n_webhook_seconds.observe(time.perf_counter() - start, "connection_error")
             print(f"Failed to connect to N8N: {we}")
-            doc.status = "N8N Connection Failed"
-            
-            # Fallback/Debug note: If N8N is not running, we just leave it.
-            # You can retry later or process manually.
+            error = DispatchError("N8N Connection Failed", str(we))
+        else:
+            ok = response.status_code >= 200 and response.status_code < 300
+            metrics.n8n_webhook_seconds.observe(time.perf_counter() - start, "ok" if ok else "http_error")
+            if ok:
+                print(f"N8N Triggered Successfully: {response.text}")
+                set_status(db, doc, "Sending to N8N...")
+                return "Sent"
+            print(f"N8N Webhook Failed: {response.status_code} - {response.text}")
+            error = DispatchError(f"N8N Error: {response.status_code}", response.text[:500])
 
-        db.commit()
+        if final_attempt:
+            set_status(db, doc, error.status)
+        raise error
+    except DispatchError:
+        raise
     except Exception as e:
         if doc:
-            doc.status = "Error"
-            db.commit()
+            db.rollback()
+            set_status(db, doc, "Error")
         print(f"Error processing document {doc_id}: {e}")
     finally:
         db.close()
@@ -0,0 +1,325 @@
+import difflib
+import json
+import os
+import re
+import sys
+import time
+import zlib
+from datetime import datetime, timedelta
+from typing import List, Optional
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session, load_only, undefer
+from dotenv import load_dotenv
+from . import models, deltas
+
+load_dotenv()
+
+# Version history for corrected_html.
+# Saves within VERSION_INTERVAL_SECONDS of the latest version are folded into
+# it, so a typing session produces one version rather than one per autosave.
+# Every VERSION_KEYFRAME_INTERVAL-th version is a full zlib-compressed copy
+# ("full"); the ones in between are compressed delta ops against the previous
+# version ("delta", same format as backend/deltas.py). Rebuilding any version
+# therefore applies at most VERSION_KEYFRAME_INTERVAL - 1 deltas.
+
+VERSION_INTERVAL_SECONDS = float(os.getenv("VERSION_INTERVAL_SECONDS", "300"))
+VERSION_KEYFRAME_INTERVAL = max(int(os.getenv("VERSION_KEYFRAME_INTERVAL", "20")), 1)
+# Retention: everything is kept for VERSION_KEEP_ALL_DAYS, then one version per
+# day until VERSION_RETENTION_DAYS (0 keeps them forever)
+VERSION_KEEP_ALL_DAYS = float(os.getenv("VERSION_KEEP_ALL_DAYS", "7"))
+VERSION_RETENTION_DAYS = float(os.getenv("VERSION_RETENTION_DAYS", "90"))
+VERSION_MAX_PER_DOCUMENT = int(os.getenv("VERSION_MAX_PER_DOCUMENT", "200"))
+VERSION_COMPACT_INTERVAL_SECONDS = float(os.getenv("VERSION_COMPACT_INTERVAL_SECONDS", str(6 * 3600)))
+
+# Diff granularity: a piece of text or markup ends after every tag and newline
+CHUNK_BOUNDARY = re.compile(r"(?<=[>\n])")
+
+
+class VersionNotFound(Exception):
+    pass
+
+
+def utf16_length(value: str) -> int:
+    return len(value.encode("utf-16-le", "surrogatepass")) // 2
+
+
+def diff(old: str, new: str) -> List[dict]:
+    """Delta ops turning `old` into `new` (see backend/deltas.py)."""
+    old_chunks = CHUNK_BOUNDARY.split(old)
+    new_chunks = CHUNK_BOUNDARY.split(new)
+    ops = []
+
+    def add(kind, value):
+        if not value:
+            return
+        if ops and kind in ops[-1] and kind != "insert":
+            ops[-1][kind] += value
+        elif ops and kind == "insert" and "insert" in ops[-1]:
+            ops[-1]["insert"] += value
+        else:
+            ops.append({kind: value})
+
+    matcher = difflib.SequenceMatcher(None, old_chunks, new_chunks)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            add("retain", utf16_length("".join(old_chunks[i1:i2])))
+        else:
+            add("delete", utf16_length("".join(old_chunks[i1:i2])))
+            add("insert", "".join(new_chunks[j1:j2]))
+    if ops and "retain" in ops[-1]:
+        ops.pop()  # Trailing text is kept implicitly
+    return ops
+
+
+def encode_full(html: str) -> bytes:
+    return zlib.compress(html.encode("utf-8"))
+
+
+def encode_delta(ops: List[dict]) -> bytes:
+    return zlib.compress(json.dumps(ops, separators=(",", ":"), ensure_ascii=False).encode("utf-8"))
+
+
+def _apply(content: Optional[str], version: models.DocumentVersion) -> str:
+    if version.data is None:
+        return version.corrected_html or ""  # Written before versions were compressed
+    payload = zlib.decompress(version.data).decode("utf-8")
+    if version.kind == "delta":
+        return deltas.apply_delta(content, json.loads(payload))
+    return payload
+
+
+def _chain(db: Session, doc_id: int, version_number: int) -> List[models.DocumentVersion]:
+    # The nearest keyframe at or before the version, then the deltas up to it
+    keyframe = db.query(func.max(models.DocumentVersion.version_number)).filter(
+        models.DocumentVersion.document_id == doc_id,
+        models.DocumentVersion.version_number <= version_number,
+        or_(models.DocumentVersion.kind.is_(None), models.DocumentVersion.kind != "delta"),
+    ).scalar()
+    if keyframe is None:
+        return []
+    return db.query(models.DocumentVersion).options(undefer(models.DocumentVersion.data)).filter(
+        models.DocumentVersion.document_id == doc_id,
+        models.DocumentVersion.version_number >= keyframe,
+        models.DocumentVersion.version_number <= version_number,
+    ).order_by(models.DocumentVersion.version_number).all()
+
+
+def content_at(db: Session, doc_id: int, version_number: int) -> str:
+    chain = _chain(db, doc_id, version_number)
+    if not chain or chain[-1].version_number != version_number:
+        raise VersionNotFound()
+    content = None
+    for version in chain:
+        content = _apply(content, version)
+    return content
+
+
+def _store(version: models.DocumentVersion, html: str, previous: Optional[models.DocumentVersion], base: Optional[str]):
+    """Encode `html` into `version`: a delta against `previous` (whose content is `base`) unless a keyframe is due."""
+    version.size = len(html)
+    version.corrected_html = None
+    full = encode_full(html)
+    if previous is not None and (previous.depth or 0) + 1 < VERSION_KEYFRAME_INTERVAL:
+        data = encode_delta(diff(base, html))
+        if len(data) < len(full):
+            version.kind, version.data, version.depth = "delta", data, (previous.depth or 0) + 1
+            return
+    version.kind, version.data, version.depth = "full", full, 0
+
+
+def _encode(db: Session, version: models.DocumentVersion, html: str, previous: Optional[models.DocumentVersion]):
+    base = content_at(db, previous.document_id, previous.version_number) if previous is not None else None
+    _store(version, html, previous, base)
+
+
+def record(db: Session, doc: models.Document, source: str = "edit") -> models.DocumentVersion:
+    """Snapshot doc.corrected_html as part of the caller's transaction.
+
+    source is "edit", "extraction" or "restore". Edits coalesce into the latest
+    edit version while it is younger than VERSION_INTERVAL_SECONDS; the other
+    sources always start a new version so they stay visible in the history.
+    """
+    db.flush() # doc.touch() increments the revision in SQL; read back the stored value
+    html = doc.corrected_html or ""
+    now = time.time()
+    versions = db.query(models.DocumentVersion).filter(models.DocumentVersion.document_id == doc.id)
+    latest = versions.order_by(models.DocumentVersion.version_number.desc()).first()
+
+    if latest is not None and source == "edit" and latest.source == "edit" \
+            and latest.created_at and now - latest.created_at < VERSION_INTERVAL_SECONDS:
+        previous = versions.filter(models.DocumentVersion.version_number < latest.version_number) \
+            .order_by(models.DocumentVersion.version_number.desc()).first()
+        # Later versions never depend on the latest one, so it can be re-encoded in place
+        _encode(db, latest, html, previous)
+        latest.revision = doc.revision
+        latest.timestamp = str(datetime.utcnow())
+        return latest
+
+    version = models.DocumentVersion(
+        document_id=doc.id,
+        version_number=(latest.version_number if latest else 0) + 1,
+        revision=doc.revision,
+        source=source,
+        created_at=now,
+        timestamp=str(datetime.utcnow()),
+    )
+    _encode(db, version, html, latest)
+    db.add(version)
+    return version
+
+
+def record_many(db: Session, docs: List[models.Document], source: str = "extraction") -> List[models.DocumentVersion]:
+    """record() for many documents in one go, for sources that never coalesce.
+
+    The latest version of every document is fetched with one query; a delta
+    still needs the previous content, so documents that already have history
+    rebuild it one by one.
+    """
+    if source == "edit":
+        raise ValueError("Edits coalesce per document, use record()")
+    DocumentVersion = models.DocumentVersion
+    # doc.touch() increments the revisions in SQL; read them back with one query
+    db.flush()
+    db.query(models.Document).options(load_only(models.Document.revision)).filter(models.Document.id.in_([doc.id for doc in docs])).all()
+    latest_numbers = (
+        db.query(DocumentVersion.document_id, func.max(DocumentVersion.version_number).label("version_number"))
+        .filter(DocumentVersion.document_id.in_([doc.id for doc in docs]))
+        .group_by(DocumentVersion.document_id)
+        .subquery()
+    )
+    latest = {
+        version.document_id: version
+        for version in db.query(DocumentVersion).join(
+            latest_numbers,
+            (DocumentVersion.document_id == latest_numbers.c.document_id)
+            & (DocumentVersion.version_number == latest_numbers.c.version_number),
+        )
+    }
+
+    now = time.time()
+    timestamp = str(datetime.utcnow())
+    new_versions = []
+    for doc in docs:
+        previous = latest.get(doc.id)
+        version = DocumentVersion(
+            document_id=doc.id,
+            version_number=(previous.version_number if previous else 0) + 1,
+            revision=doc.revision,
+            source=source,
+            created_at=now,
+            timestamp=timestamp,
+        )
+        _encode(db, version, doc.corrected_html or "", previous)
+        new_versions.append(version)
+    db.add_all(new_versions)
+    return new_versions
+
+
+def list_versions(db: Session, doc_id: int) -> List[models.DocumentVersion]:
+    return db.query(models.DocumentVersion).options(load_only(
+        models.DocumentVersion.version_number,
+        models.DocumentVersion.revision,
+        models.DocumentVersion.source,
+        models.DocumentVersion.size,
+        models.DocumentVersion.kind,
+        models.DocumentVersion.timestamp,
+    )).filter(models.DocumentVersion.document_id == doc_id).order_by(models.DocumentVersion.version_number.desc()).all()
+
+
+def delete_versions(db: Session, doc_id: int):
+    db.query(models.DocumentVersion).filter(models.DocumentVersion.document_id == doc_id).delete(synchronize_session=False)
+
+
+# --- Retention / compaction ---
+
+def _keep(versions: List[models.DocumentVersion], now: datetime) -> set:
+    keep_all_after = now - timedelta(days=VERSION_KEEP_ALL_DAYS)
+    drop_before = now - timedelta(days=VERSION_RETENTION_DAYS) if VERSION_RETENTION_DAYS > 0 else None
+
+    kept, seen_days = [], set()
+    # Newest first, so thinning keeps the last version of each day
+    for version in sorted(versions, key=lambda v: v.version_number, reverse=True):
+        try:
+            saved = datetime.fromisoformat(version.timestamp)
+        except (TypeError, ValueError):
+            saved = now
+        if version.source != "edit" or saved >= keep_all_after:
+            kept.append(version)
+        elif drop_before is None or saved >= drop_before:
+            if saved.date() not in seen_days:
+                seen_days.add(saved.date())
+                kept.append(version)
+    # Always keep the newest version and the extraction, which restores need most
+    kept = kept[:VERSION_MAX_PER_DOCUMENT] if VERSION_MAX_PER_DOCUMENT > 0 else kept
+    numbers = {v.version_number for v in kept}
+    numbers.add(max(v.version_number for v in versions))
+    numbers.update(v.version_number for v in versions if v.source == "extraction")
+    return numbers
+
+
+def compact_document(db: Session, doc_id: int, now: Optional[datetime] = None) -> int:
+    """Apply the retention policy to one document and re-encode the surviving chain. Returns versions removed."""
+    versions = db.query(models.DocumentVersion).options(undefer(models.DocumentVersion.data)) \
+        .filter(models.DocumentVersion.document_id == doc_id).order_by(models.DocumentVersion.version_number).all()
+    if not versions:
+        return 0
+    keep = _keep(versions, now or datetime.utcnow())
+    if len(keep) == len(versions):
+        return 0
+
+    # Rebuild every version in order (one pass), then re-encode the kept ones as a fresh chain
+    contents, content = {}, None
+    for version in versions:
+        content = _apply(content, version)
+        if version.version_number in keep:
+            contents[version.version_number] = content
+
+    removed = 0
+    previous = None
+    for version in versions:
+        if version.version_number not in keep:
+            db.delete(version)
+            removed += 1
+            continue
+        base = contents[previous.version_number] if previous is not None else None
+        _store(version, contents[version.version_number], previous, base)
+        previous = version
+    db.flush()
+    return removed
+
+
+def compact_all(db: Session) -> int:
+    removed = 0
+    doc_ids = [row[0] for row in db.query(models.DocumentVersion.document_id).distinct().all()]
+    for doc_id in doc_ids:
+        removed += compact_document(db, doc_id)
+        db.commit()
+    return removed
+
+
+def run_compaction():
+    from .database import SessionLocal
+    db = SessionLocal()
+    try:
+        removed = compact_all(db)
+        if removed:
+            print(f"Version compaction removed {removed} old version(s)")
+    except Exception as e:
+        db.rollback()
+        print(f"Version compaction failed: {e}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    # python -m backend.versions compact
+    if sys.argv[1:] != ["compact"]:
+        print("Usage: python -m backend.versions compact")
+        sys.exit(1)
+    from .database import SessionLocal, engine
+    models.Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        print(f"Removed {compact_all(session)} version(s)")
+    finally:
+        session.close()
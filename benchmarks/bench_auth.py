@@ -0,0 +1,83 @@
+"""Cost of the auth dependency per authenticated request.
+
+Calls get_current_user() directly against a temporary SQLite database with a
+few hundred users, once with the token cache disabled (JWT decode + users
+query every time, the old behaviour) and once with it enabled, then times a
+full GET /users/me round trip through the ASGI app both ways.
+
+Usage: python benchmarks/bench_auth.py [--users 500] [--calls 20000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup(users: int):
+    workdir = tempfile.mkdtemp(prefix="bench-auth-")
+    os.chdir(workdir)
+    os.makedirs("uploads", exist_ok=True)
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{workdir}/bench.db")
+    sys.path.insert(0, ROOT)
+
+    from backend import main, models, database, auth
+    db = database.SessionLocal()
+    # Hashing isn't what's measured here
+    hashed = auth.get_password_hash("bench")
+    db.add_all(models.User(username=f"user{n}", email=f"user{n}@example.com", hashed_password=hashed) for n in range(users))
+    db.commit()
+    tokens = [auth.create_access_token({"sub": str(user_id)}, auth.timedelta(hours=1)) for (user_id,) in db.query(models.User.id)]
+    db.close()
+    return main, database, auth, tokens
+
+
+def bench_dependency(main, database, tokens, calls: int, rng: random.Random) -> float:
+    db = database.SessionLocal()
+    try:
+        start = time.perf_counter()
+        for _ in range(calls):
+            main.get_current_user(rng.choice(tokens), db)
+            db.expunge_all()  # Each request gets a fresh session
+        return (time.perf_counter() - start) / calls * 1e6
+    finally:
+        db.close()
+
+
+def bench_endpoint(main, tokens, calls: int, rng: random.Random) -> float:
+    from fastapi.testclient import TestClient
+    client = TestClient(main.app)
+    start = time.perf_counter()
+    for _ in range(calls):
+        r = client.get("/users/me", headers={"Authorization": f"Bearer {rng.choice(tokens)}"})
+        r.raise_for_status()
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--calls", type=int, default=20000)
+    args = parser.parse_args()
+
+    app_main, database, auth, tokens = setup(args.users)
+    print(f"{args.users} users, {args.calls} lookups over random tokens")
+
+    for label, cache in (("no cache", auth.TokenCache(0, 0)), ("cached", auth.TokenCache(auth.AUTH_CACHE_SIZE, auth.AUTH_CACHE_TTL_SECONDS))):
+        auth.token_cache = cache
+        per_call = bench_dependency(app_main, database, tokens, args.calls, random.Random(1))
+        stats = cache.stats()
+        print(f"  get_current_user  {label:<9} {per_call:8.1f} us/call   hits {stats['hits']}  misses {stats['misses']}")
+
+    endpoint_calls = max(args.calls // 10, 1)
+    for label, cache in (("no cache", auth.TokenCache(0, 0)), ("cached", auth.TokenCache(auth.AUTH_CACHE_SIZE, auth.AUTH_CACHE_TTL_SECONDS))):
+        auth.token_cache = cache
+        per_call = bench_endpoint(app_main, tokens, endpoint_calls, random.Random(2))
+        print(f"  GET /users/me     {label:<9} {per_call:8.1f} us/request")
+
+
+if __name__ == "__main__":
+    main()
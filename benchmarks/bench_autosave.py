@@ -0,0 +1,162 @@
+"""Editor autosave under many concurrent editors.
+
+Boots the app with uvicorn against a temporary SQLite database. Each simulated
+editor owns a large document and makes small edits, saving each one either
+with a full PUT (the old autosave) or a delta PATCH against its last revision.
+Reports saves/s, latency and request bytes for both modes, then lets several
+editors fight over one document to check that stale saves get 409 and none
+are lost.
+
+Usage: python benchmarks/bench_autosave.py [--editors 16] [--saves 20] [--doc-kb 300]
+"""
+import argparse
+import json
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import start_server
+
+
+def auth_headers(base: str, requests) -> dict:
+    from backend import auth
+    email = "bench@example.com"
+    requests.post(f"{base}/signup", json={"username": "bench", "email": email, "password": "bench", "security_code": auth.INTERNAL_SIGNUP_CODE})
+    token = requests.post(f"{base}/token", data={"username": email, "password": "bench"}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def make_html(size: int, rng: random.Random) -> str:
+    words = ["invoice", "total", "amount", "customer", "shipping", "address", "date", "order", "tax", "item"]
+    paragraphs = []
+    length = 0
+    while length < size:
+        paragraph = "<p>" + " ".join(rng.choice(words) for _ in range(40)) + "</p>"
+        paragraphs.append(paragraph)
+        length += len(paragraph)
+    return "".join(paragraphs)
+
+
+def create_document(session, base, headers, html, n) -> int:
+    r = session.post(f"{base}/upload_and_convert", headers=headers, files={"file": (f"doc{n}.pdf", f"bench {n}".encode())})
+    r.raise_for_status()
+    doc_id = r.json()["document_id"]
+    # Let the (failing) dispatch finish first so it can't bump the revision mid-run
+    while session.get(f"{base}/documents/{doc_id}", headers=headers).json()["status"] == "Processing":
+        time.sleep(0.05)
+    session.post(f"{base}/n8n/callback", json={"doc_id": doc_id, "raw_text": "bench", "corrected_html": html}).raise_for_status()
+    return doc_id
+
+
+def edit(html: str, rng: random.Random) -> tuple:
+    """A short typing burst somewhere in the document. Returns (new html, delta ops).
+
+    The ops are what editor.html's computeDelta() produces for this edit; they're
+    built directly so diffing 300 KB strings in Python doesn't steal the server's GIL.
+    """
+    position = rng.randrange(len(html))
+    position = html.rfind(">", 0, position) + 1  # Keep the markup valid
+    typed = "typed words "
+    ops = ([{"retain": position}] if position else []) + [{"insert": typed}]
+    return html[:position] + typed + html[position:], ops
+
+
+def run_editor(base, headers, doc_id, html, saves, mode, seed):
+    import requests
+    rng = random.Random(seed)
+    session = requests.Session()
+    revision = session.get(f"{base}/documents/{doc_id}", headers=headers).json()["content_revision"]
+    latencies, sent = [], 0
+    for _ in range(saves):
+        new_html, ops = edit(html, rng)
+        if mode == "put":
+            body = json.dumps({"corrected_html": new_html})
+            method = session.put
+        else:
+            body = json.dumps({"base_revision": revision, "ops": ops})
+            method = session.patch
+        start = time.perf_counter()
+        r = method(f"{base}/documents/{doc_id}", headers={**headers, "Content-Type": "application/json"}, data=body)
+        latencies.append((time.perf_counter() - start) * 1000)
+        r.raise_for_status()
+        revision = r.json()["content_revision"]
+        sent += len(body)
+        html = new_html
+    return latencies, sent
+
+
+def scenario(base, headers, docs, saves, mode):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(docs)) as pool:
+        results = list(pool.map(lambda item: run_editor(base, headers, item[1][0], item[1][1], saves, mode, item[0]), enumerate(docs)))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(l for result in results for l in result[0])
+    sent = sum(result[1] for result in results)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"  {mode:<5} {len(latencies) / elapsed:8.1f} saves/s   median {statistics.median(latencies):7.1f} ms   p95 {p95:7.1f} ms   sent {sent / 1024 / 1024:8.2f} MB")
+
+
+def contention(base, headers, doc_id, editors, saves):
+    # Editors share one document; each retries from the latest revision after a 409
+    import requests
+    accepted, conflicts = [], [0]
+    lock = threading.Lock()
+
+    def editor(n):
+        session = requests.Session()
+        for i in range(saves):
+            marker = f"[e{n}-{i}]"
+            while True:
+                doc = session.get(f"{base}/documents/{doc_id}", headers=headers).json()
+                html = doc["corrected_html"]
+                ops = [{"retain": len(html)}, {"insert": marker}]
+                r = session.patch(f"{base}/documents/{doc_id}", headers=headers, json={"base_revision": doc["content_revision"], "ops": ops})
+                if r.status_code == 409:
+                    with lock:
+                        conflicts[0] += 1
+                    continue
+                r.raise_for_status()
+                with lock:
+                    accepted.append(marker)
+                break
+
+    with ThreadPoolExecutor(max_workers=editors) as pool:
+        list(pool.map(editor, range(editors)))
+
+    final = requests.get(f"{base}/documents/{doc_id}", headers=headers).json()["corrected_html"]
+    lost = [marker for marker in accepted if marker not in final]
+    print(f"  {editors} editors x {saves} saves on one document: {len(accepted)} accepted, {conflicts[0]} conflicts (409), {len(lost)} lost")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--editors", type=int, default=16)
+    parser.add_argument("--saves", type=int, default=20)
+    parser.add_argument("--doc-kb", type=int, default=300)
+    parser.add_argument("--port", type=int, default=8767)
+    args = parser.parse_args()
+
+    import requests
+    start_server(args.port, "autosave", log_level="warning")
+    base = f"http://127.0.0.1:{args.port}"
+    headers = auth_headers(base, requests)
+    rng = random.Random(1)
+    session = requests.Session()
+
+    print(f"{args.editors} editors, {args.saves} saves each, ~{args.doc_kb} KB documents")
+    for mode in ("put", "patch"):
+        docs = []
+        for n in range(args.editors):
+            html = make_html(args.doc_kb * 1024, rng)
+            docs.append((create_document(session, base, headers, html, f"{mode}{n}"), html))
+        scenario(base, headers, docs, args.saves, mode)
+
+    print("\nConflicting editors")
+    shared = create_document(session, base, headers, "<p>shared</p>", "shared")
+    contention(base, headers, shared, min(args.editors, 8), 5)
+
+
+if __name__ == "__main__":
+    main()
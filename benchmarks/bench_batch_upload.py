@@ -0,0 +1,109 @@
+"""Ingesting a folder of scans: one request per file vs one batch request.
+
+Boots the app with uvicorn against a temporary SQLite database and uploads
+the same number of distinct files three ways, each as a fresh user:
+
+  single  one POST /upload_and_convert per file (what the dashboard used to do)
+  batch   every file in one POST /upload_batches
+  zip     one zip archive of the files to POST /upload_batches
+
+Reports the upload wall time, the time until every document has been handed
+to the dispatcher (left "Processing"), and the SQL statements the server ran
+while the uploads were in flight (dispatch workers included). The webhook
+URL points at a closed port so each dispatch fails fast; what's measured is
+the ingest path, not N8N.
+
+Usage: python benchmarks/bench_batch_upload.py [--files 50] [--kb 200]
+"""
+import argparse
+import io
+import os
+import time
+import zipfile
+
+from common import start_server
+
+
+class StatementCounter:
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+def auth_headers(session, base: str, name: str) -> dict:
+    from backend import auth
+    email = f"{name}@example.com"
+    session.post(f"{base}/signup", json={"username": name, "email": email, "password": "bench", "security_code": auth.INTERNAL_SIGNUP_CODE}).raise_for_status()
+    token = session.post(f"{base}/token", data={"username": email, "password": "bench"}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def make_files(mode: str, count: int, kb: int) -> list:
+    # Distinct contents so no upload is served from an earlier extraction
+    return [(f"{mode}_{n}.pdf", os.urandom(kb * 1024)) for n in range(count)]
+
+
+def upload_single(session, base, headers, files):
+    for name, data in files:
+        session.post(f"{base}/upload_and_convert", headers=headers, files={"file": (name, data)}).raise_for_status()
+
+
+def upload_batch(session, base, headers, files):
+    r = session.post(f"{base}/upload_batches", headers=headers, files=[("files", f) for f in files])
+    r.raise_for_status()
+    assert r.json()["accepted"] == len(files), r.text
+
+
+def upload_zip(session, base, headers, files):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as archive:
+        for name, data in files:
+            archive.writestr(name, data)
+    r = session.post(f"{base}/upload_batches", headers=headers, files={"files": ("scans.zip", buffer.getvalue(), "application/zip")})
+    r.raise_for_status()
+    assert r.json()["accepted"] == len(files), r.text
+
+
+def wait_dispatched(session, base, headers, count: int):
+    while True:
+        docs = session.get(f"{base}/documents?summary=true&limit={count}", headers=headers).json()
+        if len(docs) == count and all(doc["status"] != "Processing" for doc in docs):
+            return
+        time.sleep(0.02)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=50)
+    parser.add_argument("--kb", type=int, default=200, help="Size of each file")
+    parser.add_argument("--port", type=int, default=8770)
+    args = parser.parse_args()
+
+    import requests
+    start_server(args.port, "batch")
+    base = f"http://127.0.0.1:{args.port}"
+    from backend import database
+    counter = StatementCounter(database.engine)
+    session = requests.Session()
+
+    print(f"{args.files} files of {args.kb} KB")
+    for mode, upload in (("single", upload_single), ("batch", upload_batch), ("zip", upload_zip)):
+        headers = auth_headers(session, base, mode)
+        files = make_files(mode, args.files, args.kb)
+        statements = counter.count
+        start = time.perf_counter()
+        upload(session, base, headers, files)
+        uploaded = time.perf_counter() - start
+        upload_statements = counter.count - statements
+        wait_dispatched(session, base, headers, args.files)
+        dispatched = time.perf_counter() - start
+        print(f"  {mode:<7} upload {uploaded * 1000:8.1f} ms   all dispatched {dispatched * 1000:8.1f} ms   "
+              f"{upload_statements / args.files:6.1f} SQL statements/file")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""N8N results ingest: one POST /n8n/callback per document vs the bulk callback.
+
+Boots the app with uvicorn against a temporary SQLite database, seeds
+documents waiting for their extraction ("Sending to N8N..."), then delivers
+an OCR-sized result for every one of them three ways, each on its own set of
+documents:
+
+  single  POST /n8n/callback per document, from --clients concurrent senders
+  batch   POST /n8n/callback/batch with JSON arrays of --batch results
+  ndjson  the same, streamed as application/x-ndjson
+
+Reports wall time, documents per second and the SQL statements the server ran.
+
+Usage: python benchmarks/bench_callback_batch.py [--docs 10000] [--batch 1000] [--clients 8]
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from common import start_server
+
+WORDS = ["invoice", "total", "amount", "customer", "shipping", "address", "date", "order", "tax", "item",
+         "payment", "due", "account", "number", "reference", "description", "quantity", "price", "subtotal"]
+
+
+class StatementCounter:
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+def seed(count: int) -> list:
+    """Documents N8N has accepted but not called back for yet; returns their ids."""
+    from sqlalchemy import insert
+    from backend import database, models
+    now = str(datetime.utcnow())
+    with database.engine.begin() as conn:
+        doc_ids = conn.execute(insert(models.Document).returning(models.Document.id), [{
+            "user_id": 1, "upload_date": now, "updated_at": now, "original_path": f"uploads/{n}.pdf",
+            "filename": f"scan_{n}.pdf", "status": "Sending to N8N...", "revision": 1,
+        } for n in range(count)]).scalars().all()
+    return list(doc_ids)
+
+
+def make_results(doc_ids: list, lines: int, rng: random.Random) -> list:
+    results = []
+    for doc_id in doc_ids:
+        text = "\n".join(" ".join(rng.choice(WORDS) for _ in range(10)) + f" {rng.randint(1, 99999)}" for _ in range(lines))
+        results.append({"doc_id": doc_id, "raw_text": text, "corrected_html": "".join(f"<p>{line}</p>" for line in text.split("\n"))})
+    return results
+
+
+def send_single(base, results, clients):
+    import requests
+    local = threading.local()
+
+    def send(result):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        local.session.post(f"{base}/n8n/callback", json=result).raise_for_status()
+
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(send, results))
+
+
+def send_batches(base, results, batch, ndjson: bool):
+    import requests
+    session = requests.Session()
+    for start in range(0, len(results), batch):
+        chunk = results[start:start + batch]
+        if ndjson:
+            body = "".join(json.dumps(result) + "\n" for result in chunk)
+            r = session.post(f"{base}/n8n/callback/batch", data=body.encode(), headers={"Content-Type": "application/x-ndjson"})
+        else:
+            r = session.post(f"{base}/n8n/callback/batch", json=chunk)
+        r.raise_for_status()
+        assert r.json()["applied"] == len(chunk), r.text
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=10000)
+    parser.add_argument("--batch", type=int, default=1000, help="Results per bulk request")
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent senders for single callbacks")
+    parser.add_argument("--lines", type=int, default=40, help="Lines of extracted text per document")
+    parser.add_argument("--port", type=int, default=8771)
+    args = parser.parse_args()
+
+    start_server(args.port, "callback")
+    base = f"http://127.0.0.1:{args.port}"
+    from backend import database
+    counter = StatementCounter(database.engine)
+    rng = random.Random(3)
+
+    print(f"{args.docs} documents, {args.lines} lines of text each")
+    for mode in ("single", "batch", "ndjson"):
+        results = make_results(seed(args.docs), args.lines, rng)
+        statements = counter.count
+        start = time.perf_counter()
+        if mode == "single":
+            send_single(base, results, args.clients)
+        else:
+            send_batches(base, results, args.batch, ndjson=mode == "ndjson")
+        elapsed = time.perf_counter() - start
+        print(f"  {mode:<7} {elapsed:8.2f} s   {args.docs / elapsed:8.1f} docs/s   "
+              f"{(counter.count - statements) / args.docs:6.2f} SQL statements/doc")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""Mixed read/write load against the database engine configuration.
+
+Boots the app with uvicorn against a temporary SQLite database, then runs
+dashboard readers (document list + single document) alongside writers
+(autosave PATCHes and n8n callbacks) for a fixed time. Each configuration
+runs in its own process since the engine is configured at import:
+
+  legacy  rollback journal, synchronous=FULL (SQLite's defaults)
+  tuned   WAL, synchronous=NORMAL
+  async   tuned, plus DATABASE_ASYNC (aiosqlite) for the hot endpoints
+
+Both use the configured pool sizing: with SQLAlchemy's default pool (5 + 10)
+this load starves the pool and requests time out after DB_POOL_TIMEOUT.
+Reports requests/s, latency and failed requests (500s from "database is
+locked", timeouts) per operation, and the pool metrics from GET /database/stats.
+
+Usage: python benchmarks/bench_db_concurrency.py [--readers 24] [--writers 8] [--seconds 10] [--config legacy|tuned|async]
+       python benchmarks/bench_db_concurrency.py --compare tuned,async --readers 64
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import start_server
+
+CONFIGS = {
+    "legacy": {"SQLITE_JOURNAL_MODE": "DELETE", "SQLITE_SYNCHRONOUS": "FULL"},
+    "tuned": {},
+    "async": {"DATABASE_ASYNC": "true"},
+}
+
+
+def auth_headers(base: str, requests) -> dict:
+    from backend import auth
+    email = "bench@example.com"
+    requests.post(f"{base}/signup", json={"username": "bench", "email": email, "password": "bench", "security_code": auth.INTERNAL_SIGNUP_CODE})
+    token = requests.post(f"{base}/token", data={"username": email, "password": "bench"}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def create_documents(session, base, headers, count: int) -> list:
+    doc_ids = []
+    for n in range(count):
+        r = session.post(f"{base}/upload_and_convert", headers=headers, files={"file": (f"doc{n}.pdf", f"bench {n}".encode())})
+        r.raise_for_status()
+        doc_ids.append(r.json()["document_id"])
+    for doc_id in doc_ids:
+        # Let the (failing) dispatch finish first so it can't bump revisions mid-run
+        while session.get(f"{base}/documents/{doc_id}", headers=headers).json()["status"] == "Processing":
+            time.sleep(0.05)
+        html = "".join(f"<p>paragraph {i} of document {doc_id}</p>" for i in range(200))
+        session.post(f"{base}/n8n/callback", json={"doc_id": doc_id, "raw_text": "bench", "corrected_html": html}).raise_for_status()
+    return doc_ids
+
+
+REQUEST_TIMEOUT = 60
+
+
+def timed_request(method, url, **kwargs):
+    import requests
+    start = time.perf_counter()
+    try:
+        r = method(url, timeout=REQUEST_TIMEOUT, **kwargs)
+    except requests.RequestException:
+        r = None
+    return r, (time.perf_counter() - start) * 1000
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.failures = {}
+
+    def add(self, operation: str, latency_ms: float, ok: bool):
+        with self._lock:
+            self.latencies.setdefault(operation, []).append(latency_ms)
+            if not ok:
+                self.failures[operation] = self.failures.get(operation, 0) + 1
+
+
+def reader(base, headers, doc_ids, deadline, recorder, seed):
+    import requests
+    rng = random.Random(seed)
+    session = requests.Session()
+    while time.time() < deadline:
+        if rng.random() < 0.5:
+            operation, url = "list", f"{base}/documents?summary=true&limit=50"
+        else:
+            operation, url = "get", f"{base}/documents/{rng.choice(doc_ids)}"
+        r, latency = timed_request(session.get, url, headers=headers)
+        recorder.add(operation, latency, r is not None and r.status_code == 200)
+
+
+def writer(base, headers, doc_id, deadline, recorder, seed):
+    import requests
+    rng = random.Random(seed)
+    session = requests.Session()
+    revision = session.get(f"{base}/documents/{doc_id}", headers=headers).json()["content_revision"]
+    n = 0
+    while time.time() < deadline:
+        n += 1
+        if rng.random() < 0.75:
+            operation = "patch"
+            r, latency = timed_request(session.patch, f"{base}/documents/{doc_id}", headers=headers,
+                                       json={"base_revision": revision, "ops": [{"insert": f"<p>edit {n}</p>"}]})
+        else:
+            operation = "callback"
+            r, latency = timed_request(session.post, f"{base}/n8n/callback",
+                                       json={"doc_id": doc_id, "raw_text": f"text {n}", "corrected_html": f"<p>extracted {n}</p>"})
+        ok = r is not None and r.status_code == 200
+        recorder.add(operation, latency, ok)
+        if operation == "patch" and ok:
+            revision = r.json()["content_revision"]
+        elif not ok or operation == "callback":
+            revision = session.get(f"{base}/documents/{doc_id}", headers=headers).json()["content_revision"]
+
+
+def run(args):
+    os.environ.update(CONFIGS[args.config])
+    import requests
+    start_server(args.port, "db")
+    base = f"http://127.0.0.1:{args.port}"
+    headers = auth_headers(base, requests)
+    session = requests.Session()
+    doc_ids = create_documents(session, base, headers, max(args.writers, 1) * 2)
+
+    recorder = Recorder()
+    deadline = time.time() + args.seconds
+    with ThreadPoolExecutor(max_workers=args.readers + args.writers) as pool:
+        futures = [pool.submit(reader, base, headers, doc_ids, deadline, recorder, n) for n in range(args.readers)]
+        futures += [pool.submit(writer, base, headers, doc_ids[n], deadline, recorder, n) for n in range(args.writers)]
+        for future in futures:
+            future.result()
+
+    print(f"{args.config}: {args.readers} readers, {args.writers} writers, {args.seconds}s")
+    for operation in ("list", "get", "patch", "callback"):
+        latencies = sorted(recorder.latencies.get(operation, []))
+        if not latencies:
+            continue
+        p95 = latencies[max(int(len(latencies) * 0.95) - 1, 0)]
+        print(f"  {operation:<9} {len(latencies) / args.seconds:8.1f} req/s   median {statistics.median(latencies):7.1f} ms   "
+              f"p95 {p95:7.1f} ms   failed {recorder.failures.get(operation, 0)}")
+    stats = session.get(f"{base}/database/stats", headers=headers).json()
+    print("  pool: " + json.dumps(stats))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--readers", type=int, default=24)
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--port", type=int, default=8768)
+    parser.add_argument("--config", choices=sorted(CONFIGS), help="Run one configuration in this process")
+    parser.add_argument("--compare", default="legacy,tuned,async", help="Configurations to run, comma-separated")
+    args = parser.parse_args()
+
+    if args.config:
+        run(args)
+        return
+    # Each configuration gets a fresh process, database and server
+    for config in args.compare.split(","):
+        subprocess.run([sys.executable, os.path.abspath(__file__), "--config", config,
+                        "--readers", str(args.readers), "--writers", str(args.writers),
+                        "--seconds", str(args.seconds), "--port", str(args.port)], check=True)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""Upload-to-Ready latency: the N8N webhook round trip vs local extraction.
+
+Boots the app with uvicorn against a temporary SQLite database, plus a stub
+N8N server in a separate process. On each webhook the stub answers right
+away, then does what the workflow does: downloads the file from
+APP_BASE_URL, extracts its text (with the same code as the local backend, so
+only the round trip differs) and posts it to /n8n/callback. Uploads a mix of text-layer PDFs, DOCX and plain
+text files and reports how long each took to become Ready. Each
+configuration runs in its own process since the backend is chosen at import:
+
+  n8n     EXTRACTOR_BACKEND=n8n, every document goes through the stub
+  local   EXTRACTOR_BACKEND=local, EXTRACT_WORKERS=2: PDF/DOCX parsed in a process pool
+  inline  EXTRACTOR_BACKEND=local with EXTRACT_WORKERS=0, parsed in the dispatcher thread
+
+--n8n-delay adds a fixed delay to each stub workflow run (queueing, workflow
+steps, LLM correction...), which the default of 0 leaves out.
+
+On a small host a short --interval saturates the CPU with parsing, and then
+every configuration mostly measures its queue.
+
+Usage: python benchmarks/bench_extraction.py [--docs 60] [--interval 250] [--n8n-delay 0]
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from common import start_server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONFIGS = {
+    "n8n": {"EXTRACTOR_BACKEND": "n8n"},
+    "local": {"EXTRACTOR_BACKEND": "local", "EXTRACT_WORKERS": "2"},
+    "inline": {"EXTRACTOR_BACKEND": "local", "EXTRACT_WORKERS": "0"},
+}
+
+
+def serve_stub_n8n(port: int, app_base: str, delay: float):
+    # Its own process, like the real N8N: its work doesn't compete for the app's GIL
+    import requests
+    sys.path.insert(0, ROOT)
+    from backend import extractors
+
+    def workflow(payload: dict):
+        time.sleep(delay)
+        data = requests.get(payload["file_url"]).content
+        suffix = os.path.splitext(payload["original_path"])[1]
+        with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as f:
+            f.write(data)
+        try:
+            raw_text, html = extractors.extract_file(f.name)
+        finally:
+            os.remove(f.name)
+        requests.post(f"{app_base}/n8n/callback", json={"doc_id": payload["doc_id"], "raw_text": raw_text, "corrected_html": html}).raise_for_status()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            body = b'{"message":"Workflow was started"}'
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            threading.Thread(target=workflow, args=(payload,), daemon=True).start()
+
+        def log_message(self, *args):
+            pass
+
+    ThreadingHTTPServer(("127.0.0.1", port), Handler).serve_forever()
+
+
+def start_stub_n8n(port: int, app_base: str, delay: float):
+    import requests
+    stub = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve-stub", "--stub-port", str(port),
+                             "--app-base", app_base, "--n8n-delay", str(delay * 1000)])
+    while True:
+        try:
+            requests.get(f"http://127.0.0.1:{port}/", timeout=1)
+            return stub
+        except requests.ConnectionError:
+            time.sleep(0.05)
+
+
+def make_pdf(n: int) -> bytes:
+    from reportlab.pdfgen import canvas
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer)
+    for page in range(3):
+        for line in range(40):
+            pdf.drawString(72, 760 - 16 * line, f"Document {n} page {page + 1} line {line + 1}: invoice total amount due")
+        pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+def make_docx(n: int) -> bytes:
+    import docx
+    document = docx.Document()
+    document.add_heading(f"Contract {n}", 1)
+    for line in range(60):
+        document.add_paragraph(f"Clause {line + 1}: the parties agree to the terms of document {n}.")
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def make_files(count: int) -> list:
+    makers = [("pdf", make_pdf), ("docx", make_docx), ("txt", lambda n: "\n".join(f"Note {n} line {i}" for i in range(200)).encode())]
+    return [(f"file_{n}.{makers[n % 3][0]}", makers[n % 3][1](n)) for n in range(count)]
+
+
+def percentile(values: list, p: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+def run(args):
+    os.environ.update(CONFIGS[args.config])
+    import requests
+    start_server(args.port, "extract", {
+        "N8N_WEBHOOK_URL": f"http://127.0.0.1:{args.stub_port}/webhook",
+        "APP_BASE_URL": f"http://127.0.0.1:{args.port}",
+    })
+    base = f"http://127.0.0.1:{args.port}"
+    stub = start_stub_n8n(args.stub_port, base, args.n8n_delay / 1000)
+    from backend import auth
+
+    email = "bench@example.com"
+    requests.post(f"{base}/signup", json={"username": "bench", "email": email, "password": "bench", "security_code": auth.INTERNAL_SIGNUP_CODE}).raise_for_status()
+    token = requests.post(f"{base}/token", data={"username": email, "password": "bench"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    session = requests.Session()
+    files = make_files(args.docs)
+
+    uploaded, ready = {}, {}
+    done = threading.Event()
+
+    def poll():
+        # Runs alongside the uploads so each document's finish time is seen as it happens
+        poller = requests.Session()
+        while not (done.is_set() and len(ready) >= len(uploaded)):
+            for doc in poller.get(f"{base}/documents?summary=true&limit={args.docs}", headers=headers).json():
+                if doc["id"] not in ready and doc["status"] not in ("Processing", "Sending to N8N..."):
+                    ready[doc["id"]] = (doc["status"], time.perf_counter())
+            time.sleep(0.01)
+
+    start = time.perf_counter()
+    polling = threading.Thread(target=poll)
+    polling.start()
+    for name, data in files:
+        sent = time.perf_counter()
+        r = session.post(f"{base}/upload_and_convert", headers=headers, files={"file": (name, data)})
+        r.raise_for_status()
+        uploaded[r.json()["document_id"]] = (name, sent)
+        time.sleep(args.interval / 1000)
+    done.set()
+    polling.join()
+    total = time.perf_counter() - start
+
+    failed = sum(1 for status, _ in ready.values() if status != "Ready")
+    print(f"{args.config}: {args.docs} documents (pdf/docx/txt), total {total:.2f}s, {failed} not Ready")
+    for kind in ("pdf", "docx", "txt", ""):
+        latencies = [(ready[doc_id][1] - sent) * 1000 for doc_id, (name, sent) in uploaded.items() if name.endswith(kind)]
+        print(f"  {kind or 'all':<5} upload -> Ready   median {statistics.median(latencies):7.1f} ms   p95 {percentile(latencies, 0.95):7.1f} ms")
+    stub.terminate()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=60)
+    parser.add_argument("--interval", type=float, default=250, help="Milliseconds between uploads")
+    parser.add_argument("--n8n-delay", type=float, default=0, help="Milliseconds each stub workflow run takes on top of its work")
+    parser.add_argument("--port", type=int, default=8772)
+    parser.add_argument("--stub-port", type=int, default=8773)
+    parser.add_argument("--config", choices=sorted(CONFIGS), help="Run one configuration in this process")
+    parser.add_argument("--serve-stub", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--app-base", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_stub:
+        serve_stub_n8n(args.stub_port, args.app_base, args.n8n_delay / 1000)
+        return
+    if args.config:
+        run(args)
+        return
+    # Each configuration gets a fresh process, database and server
+    for config in ("n8n", "local", "inline"):
+        subprocess.run([sys.executable, os.path.abspath(__file__), "--config", config,
+                        "--docs", str(args.docs), "--interval", str(args.interval), "--n8n-delay", str(args.n8n_delay),
+                        "--port", str(args.port), "--stub-port", str(args.stub_port)], check=True)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Compare the single-pass DOCX converter with the old BeautifulSoup walk.
+
+Usage: python benchmarks/bench_html_to_docx.py [--paragraphs 2000] [--depth 6]
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup
+from docx import Document as DocxDocument
+from backend import html_to_docx
+
+
+def legacy_render_docx(html_content: str, title: str) -> bytes:
+    # Implementation used by export_docx before backend/html_to_docx.py
+    soup = BeautifulSoup(html_content, "html.parser")
+    docx = DocxDocument()
+    docx.add_heading(title, 0)
+    for element in soup.descendants:
+        if element.name in ['p', 'div', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li']:
+            text = element.get_text(strip=True)
+            if text:
+                if element.name.startswith('h'):
+                    docx.add_heading(text, level=int(element.name[1]))
+                elif element.name == 'li':
+                    docx.add_paragraph(text, style='List Bullet')
+                else:
+                    docx.add_paragraph(text)
+    buffer = io.BytesIO()
+    docx.save(buffer)
+    return buffer.getvalue()
+
+
+def single_pass_render_docx(html_content: str, title: str) -> bytes:
+    buffer = io.BytesIO()
+    html_to_docx.convert([html_content], title, buffer)
+    return buffer.getvalue()
+
+
+def flat_document(paragraphs: int) -> str:
+    parts = []
+    for i in range(paragraphs):
+        if i % 50 == 0:
+            parts.append(f"<h2>Section {i // 50}</h2>")
+        parts.append(f"<p>Paragraph {i} with <strong>bold</strong> and <em>italic</em> OCR text. " + "lorem ipsum " * 20 + "</p>")
+    return "".join(parts)
+
+
+def nested_document(paragraphs: int, depth: int) -> str:
+    # Nested divs and lists: the legacy walk re-extracts text at every level
+    parts = []
+    per_block = max(paragraphs // 20, 1)
+    for block in range(20):
+        inner = "".join(f"<p>Nested paragraph {block}.{i} " + "text " * 20 + "</p>" for i in range(per_block))
+        items = "".join(f"<li>item {i}</li>" for i in range(10))
+        for level in range(depth):
+            inner = f"<div>{inner}<ul><li>level {level}<ul>{items}</ul></li></ul></div>"
+        parts.append(inner)
+    return "".join(parts)
+
+
+def bench(fn, html_content: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(html_content, "Benchmark")
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--paragraphs", type=int, default=2000)
+    parser.add_argument("--depth", type=int, default=6)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    cases = {
+        "flat": flat_document(args.paragraphs),
+        f"nested(depth={args.depth})": nested_document(args.paragraphs, args.depth),
+    }
+    print(f"{'case':<20}{'html KB':>10}{'legacy s':>12}{'single-pass s':>16}{'speedup':>10}")
+    for name, html_content in cases.items():
+        legacy = bench(legacy_render_docx, html_content, args.repeat)
+        single = bench(single_pass_render_docx, html_content, args.repeat)
+        print(f"{name:<20}{len(html_content) // 1024:>10}{legacy:>12.3f}{single:>16.3f}{legacy / single:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+"""The whole document lifecycle under a realistic mix, with results saved as JSON.
+
+Boots the app with uvicorn against a temporary SQLite database (or an empty
+database given with --database-url, e.g. MySQL) and a stub N8N webhook. The
+stub answers each webhook right away and, --n8n-delay later, posts the
+extracted text to /n8n/callback the way the workflow does. It runs in a
+thread of this process, so its callbacks are timed with everything else.
+
+Seeds --users users with --docs-per-user Ready documents each straight into
+the database, then --clients threads, each acting for one of --active-users
+users, run a weighted mix of operations for --duration seconds (after
+--warmup seconds that aren't recorded):
+
+  poll         GET /documents?summary=true, the dashboard's status polling
+  open         GET /documents/{id}/pages, opening a document in the editor
+  autosave     PUT /documents/{id}/pages, a one-word edit to the first page
+  tag          POST /documents/{id}/tags/{name}, or DELETE of a tag it has
+  upload       POST /upload_and_convert of a small text file
+  export_pdf   GET /export/{id}/pdf
+  export_docx  GET /export/{id}/docx
+  login        POST /token
+  callback     POST /n8n/callback from the stub, one per upload
+
+Reports throughput and p50/p95/p99 latency per operation. --output saves
+them with the configuration and git commit as JSON; --compare prints the
+change against an earlier result file. The operations, documents and edits
+each client picks come from --seed, so runs with the same settings do the
+same work (timing still decides how much of it fits in --duration).
+
+Usage: python benchmarks/bench_lifecycle.py [--users 1000] [--docs-per-user 5] [--clients 8] [--duration 30]
+       [--mix poll=30,open=15,...] [--output results.json] [--compare baseline.json]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from common import start_server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MIX = "poll=30,open=15,autosave=15,tag=10,upload=8,export_pdf=3,export_docx=2,login=1"
+TAGS = ["invoice", "contract", "receipt", "urgent", "archive", "2024", "finance", "legal"]
+PASSWORD = "bench"
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.recording = False
+        self.latencies = {}
+        self.errors = {} # op -> {status code or "exception": count}
+
+    def record(self, op: str, seconds: float, status):
+        if not self.recording:
+            return
+        with self._lock:
+            self.latencies.setdefault(op, []).append(seconds * 1000)
+            if status == "exception" or status >= 400:
+                errors = self.errors.setdefault(op, {})
+                errors[str(status)] = errors.get(str(status), 0) + 1
+
+
+def timed(recorder: Recorder, op: str, call):
+    start = time.perf_counter()
+    try:
+        r = call()
+    except Exception:
+        recorder.record(op, time.perf_counter() - start, "exception")
+        raise
+    recorder.record(op, time.perf_counter() - start, r.status_code)
+    return r
+
+
+def start_stub_n8n(port: int, app_base: str, delay: float, recorder: Recorder):
+    import requests
+    session = requests.Session()
+
+    def workflow(doc_id: int):
+        time.sleep(delay)
+        text = "\n".join(f"Extracted line {n} of document {doc_id}" for n in range(40))
+        html = "".join(f"<p>{line}</p>" for line in text.splitlines())
+        timed(recorder, "callback", lambda: session.post(f"{app_base}/n8n/callback", json={"doc_id": doc_id, "raw_text": text, "corrected_html": html}))
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            body = b'{"message":"Workflow was started"}'
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            threading.Thread(target=workflow, args=(payload["doc_id"],), daemon=True).start()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def seed(users: int, docs_per_user: int, rng: random.Random) -> dict:
+    """Insert users and Ready documents in bulk; returns {user_id: (email, [doc_id, ...])}."""
+    from sqlalchemy import insert, select
+    from backend import auth, database, models, search
+
+    hashed = auth.get_password_hash(PASSWORD) # One hash for everyone: seeding isn't what's measured
+    now = str(datetime.utcnow())
+    words = ["invoice", "total", "amount", "customer", "shipping", "address", "date", "order", "tax", "item"]
+    with database.SessionLocal() as db:
+        db.execute(insert(models.User), [
+            {"username": f"bench{n}", "email": f"bench{n}@example.com", "hashed_password": hashed} for n in range(users)
+        ])
+        emails = dict(db.execute(select(models.User.id, models.User.email)).all())
+        user_ids = sorted(emails)
+        rows = []
+        for user_id in user_ids:
+            for n in range(docs_per_user):
+                paragraphs = [" ".join(rng.choice(words) for _ in range(30)) for _ in range(20)]
+                rows.append({
+                    "user_id": user_id,
+                    "upload_date": now,
+                    "filename": f"seed-{user_id}-{n}.pdf",
+                    "original_path": f"uploads/seed-{user_id}-{n}.pdf", # Never read: the documents are Ready
+                    "raw_text": "\n".join(paragraphs),
+                    "corrected_html": "".join(f"<p>{p}</p>" for p in paragraphs),
+                    "status": "Ready",
+                    "revision": 1,
+                    "updated_at": now,
+                })
+        for start in range(0, len(rows), 5000):
+            db.execute(insert(models.Document), rows[start:start + 5000])
+        db.commit()
+        search.rebuild(db)
+        docs = {user_id: (emails[user_id], []) for user_id in user_ids}
+        for doc_id, user_id in db.execute(select(models.Document.id, models.Document.user_id).order_by(models.Document.id)):
+            docs[user_id][1].append(doc_id)
+    return docs
+
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for part in mix.split(","):
+        op, _, weight = part.partition("=")
+        weights[op.strip()] = float(weight)
+    unknown = set(weights) - set(OPERATIONS)
+    if unknown:
+        raise SystemExit(f"Unknown operations in --mix: {', '.join(sorted(unknown))}")
+    return weights
+
+
+class Client:
+    """One simulated user: a session, their documents and what the editor last saw of each."""
+
+    def __init__(self, base: str, user_id: int, email: str, doc_ids: list, recorder: Recorder, rng: random.Random):
+        import requests
+        from backend import auth
+        self.base = base
+        self.user_id = user_id
+        self.email = email
+        self.doc_ids = list(doc_ids)
+        self.recorder = recorder
+        self.rng = rng
+        self.session = requests.Session()
+        # Logging every client in through /token would only measure password hashing
+        self.headers = {"Authorization": f"Bearer {auth.create_access_token({'sub': str(user_id)})}"}
+        self.first_pages = {} # doc_id -> (html, revision) of page 1
+        self.tags = {} # doc_id -> {name: tag_id}
+        self.uploads = 0
+
+    def call(self, op: str, method: str, path: str, **kwargs):
+        return timed(self.recorder, op, lambda: self.session.request(method, f"{self.base}{path}", headers=self.headers, **kwargs))
+
+    def pick(self) -> int:
+        return self.rng.choice(self.doc_ids)
+
+    def poll(self):
+        self.call("poll", "GET", "/documents?summary=true&limit=50")
+
+    def open(self, doc_id: int = None):
+        doc_id = doc_id or self.pick()
+        r = self.call("open", "GET", f"/documents/{doc_id}/pages?start=1&count=5")
+        if r.ok and r.json()["pages"]:
+            page = r.json()["pages"][0]
+            self.first_pages[doc_id] = (page["html"], page["revision"])
+
+    def autosave(self):
+        doc_id = self.pick()
+        if doc_id not in self.first_pages:
+            self.open(doc_id) # The editor has the page before it saves it
+            if doc_id not in self.first_pages:
+                return
+        html, revision = self.first_pages[doc_id]
+        word = f"edit{self.rng.randrange(10 ** 6)} "
+        offset = html.find(">") + 1
+        body = {"pages": [{"number": 1, "base_revision": revision, "ops": [{"retain": offset}, {"insert": word}]}]}
+        r = self.call("autosave", "PUT", f"/documents/{doc_id}/pages", json=body)
+        if r.ok:
+            revisions = {p["number"]: p["revision"] for p in r.json()["pages"]}
+            self.first_pages[doc_id] = (html[:offset] + word + html[offset:], revisions.get(1, revision))
+        else:
+            self.first_pages.pop(doc_id, None)
+
+    def tag(self):
+        doc_id = self.pick()
+        tags = self.tags.setdefault(doc_id, {})
+        if tags and self.rng.random() < 0.5:
+            name = self.rng.choice(sorted(tags))
+            self.call("tag", "DELETE", f"/documents/{doc_id}/tags/{tags.pop(name)}")
+            return
+        name = self.rng.choice(TAGS)
+        r = self.call("tag", "POST", f"/documents/{doc_id}/tags/{name}")
+        if r.ok:
+            tags.update({t["name"]: t["id"] for t in r.json().get("tags", [])})
+
+    def upload(self):
+        self.uploads += 1
+        data = "\n".join(f"Client {self.user_id} upload {self.uploads} line {n} {self.rng.random()}" for n in range(50)).encode()
+        r = self.call("upload", "POST", "/upload_and_convert", files={"file": (f"upload-{self.uploads}.txt", data)})
+        if r.ok:
+            self.doc_ids.append(r.json()["document_id"])
+
+    def export_pdf(self):
+        self.call("export_pdf", "GET", f"/export/{self.pick()}/pdf")
+
+    def export_docx(self):
+        self.call("export_docx", "GET", f"/export/{self.pick()}/docx")
+
+    def login(self):
+        timed(self.recorder, "login", lambda: self.session.post(f"{self.base}/token", data={"username": self.email, "password": PASSWORD}))
+
+
+OPERATIONS = ["poll", "open", "autosave", "tag", "upload", "export_pdf", "export_docx", "login"]
+
+
+def run_client(client: Client, weights: dict, stop: threading.Event):
+    ops = sorted(weights)
+    op_weights = [weights[op] for op in ops]
+    while not stop.is_set():
+        op = client.rng.choices(ops, op_weights)[0]
+        try:
+            getattr(client, op)()
+        except Exception as e:
+            print(f"{op} failed: {e}")
+
+
+def percentile(values: list, p: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+def summarize(recorder: Recorder, duration: float) -> dict:
+    endpoints = {}
+    for op, values in sorted(recorder.latencies.items()):
+        endpoints[op] = {
+            "count": len(values),
+            "errors": sum(recorder.errors.get(op, {}).values()),
+            "error_statuses": recorder.errors.get(op, {}), # 409s from autosaves racing a callback are expected
+            "throughput": round(len(values) / duration, 2),
+            "p50_ms": round(percentile(values, 0.50), 2),
+            "p95_ms": round(percentile(values, 0.95), 2),
+            "p99_ms": round(percentile(values, 0.99), 2),
+            "mean_ms": round(sum(values) / len(values), 2),
+        }
+    total = sum(e["count"] for e in endpoints.values())
+    return {"throughput": round(total / duration, 2), "requests": total, "errors": sum(e["errors"] for e in endpoints.values()), "endpoints": endpoints}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def print_results(results: dict):
+    print(f"{results['requests']} requests in {results['config']['duration']}s, {results['throughput']} req/s, {results['errors']} errors")
+    print(f"  {'operation':<12} {'count':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for op, e in results["endpoints"].items():
+        print(f"  {op:<12} {e['count']:>7} {e['throughput']:>8.1f} {e['p50_ms']:>9.2f} {e['p95_ms']:>9.2f} {e['p99_ms']:>9.2f} {e['errors']:>7}")
+
+
+def print_comparison(results: dict, baseline: dict):
+    def change(new: float, old: float) -> str:
+        return f"{(new - old) / old * 100:+7.1f}%" if old else "      -"
+
+    print(f"Compared with {baseline.get('commit') or 'baseline'} ({baseline.get('timestamp', '')}): "
+          f"throughput {change(results['throughput'], baseline['throughput'])}")
+    print(f"  {'operation':<12} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for op, e in results["endpoints"].items():
+        old = baseline["endpoints"].get(op)
+        if old is None:
+            continue
+        print(f"  {op:<12} {change(e['throughput'], old['throughput'])} {change(e['p50_ms'], old['p50_ms'])} "
+              f"{change(e['p95_ms'], old['p95_ms'])} {change(e['p99_ms'], old['p99_ms'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000, help="Users to seed")
+    parser.add_argument("--docs-per-user", type=int, default=5, help="Ready documents seeded per user")
+    parser.add_argument("--active-users", type=int, default=50, help="Users the clients act for")
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent client threads")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds recorded")
+    parser.add_argument("--warmup", type=float, default=3, help="Seconds run before recording")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Operation weights, op=weight,...")
+    parser.add_argument("--n8n-delay", type=float, default=200, help="Milliseconds before the stub calls back")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--database-url", help="An empty database to use instead of a temporary SQLite file")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Print the change against this earlier results file")
+    parser.add_argument("--port", type=int, default=8777)
+    parser.add_argument("--stub-port", type=int, default=8778)
+    args = parser.parse_args()
+
+    weights = parse_mix(args.mix)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    output = os.path.abspath(args.output) if args.output else None # start_server changes directory
+
+    rng = random.Random(args.seed)
+    recorder = Recorder()
+    env = {"N8N_WEBHOOK_URL": f"http://127.0.0.1:{args.stub_port}/webhook", "APP_BASE_URL": f"http://127.0.0.1:{args.port}"}
+    if args.database_url:
+        env["DATABASE_URL"] = args.database_url
+    start_server(args.port, "lifecycle", env)
+    base = f"http://127.0.0.1:{args.port}"
+    start_stub_n8n(args.stub_port, base, args.n8n_delay / 1000, recorder)
+
+    started = time.perf_counter()
+    docs = seed(args.users, args.docs_per_user, rng)
+    print(f"Seeded {args.users} users and {args.users * args.docs_per_user} documents in {time.perf_counter() - started:.1f}s")
+
+    # The render pool forks its workers on first use; doing that while the clients'
+    # requests are in flight can leave a worker holding a lock forever
+    from backend import exports
+    exports.get_executor().submit(exports._render, "pdf", "<p>warm up</p>", "warm up").result()
+
+    active = sorted(docs)[:max(min(args.active_users, len(docs)), 1)]
+    clients = []
+    for n in range(args.clients):
+        user_id = active[n % len(active)]
+        email, doc_ids = docs[user_id]
+        clients.append(Client(base, user_id, email, doc_ids, recorder, random.Random(args.seed * 1000 + n)))
+    stop = threading.Event()
+    threads = [threading.Thread(target=run_client, args=(client, weights, stop), daemon=True) for client in clients]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.warmup)
+    recorder.recording = True
+    started = time.perf_counter()
+    time.sleep(args.duration)
+    recorder.recording = False
+    elapsed = time.perf_counter() - started
+    stop.set()
+    for thread in threads:
+        thread.join(60)
+
+    results = {
+        "benchmark": "lifecycle",
+        "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "database": os.environ["DATABASE_URL"].split(":", 1)[0],
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare", "database_url")},
+        **summarize(recorder, elapsed),
+    }
+    print_results(results)
+    if baseline is not None:
+        print_comparison(results, baseline)
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Latency of unrelated endpoints while a burst of logins is running.
+
+Boots the app with uvicorn against a temporary SQLite database. Login
+clients hammer POST /token while a probe client polls the dashboard
+endpoints (GET /documents?summary=true and GET /users/me) at a fixed rate;
+reports the probe's p50/p99 and the login rate. Each configuration runs in
+its own process since hashing is configured at import:
+
+  idle       no logins, the probe alone
+  unbounded  AUTH_HASH_WORKERS=40, hashing as wide as the old request threadpool
+  bounded    the default hashing pool (min(4, CPUs) workers)
+
+Usage: python benchmarks/bench_login_storm.py [--logins 32] [--seconds 10] [--rounds 29000]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import start_server
+
+CONFIGS = {
+    "idle": {},
+    "unbounded": {"AUTH_HASH_WORKERS": "40"},
+    "bounded": {},
+}
+
+
+def percentile(values: list, p: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+def run(args):
+    os.environ.update(CONFIGS[args.config])
+    os.environ["AUTH_HASH_ROUNDS"] = str(args.rounds)
+    import requests
+    start_server(args.port, "login")
+    base = f"http://127.0.0.1:{args.port}"
+    from backend import auth
+
+    for n in range(args.logins + 1):
+        requests.post(f"{base}/signup", json={"username": f"user{n}", "email": f"user{n}@example.com",
+                                              "password": "bench", "security_code": auth.INTERNAL_SIGNUP_CODE}).raise_for_status()
+    token = requests.post(f"{base}/token", data={"username": "user0@example.com", "password": "bench"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    deadline = time.time() + args.seconds
+    logins, rejected = [], [0]
+
+    def login(n):
+        session = requests.Session()
+        while time.time() < deadline:
+            start = time.perf_counter()
+            r = session.post(f"{base}/token", data={"username": f"user{n}@example.com", "password": "bench"})
+            if r.status_code == 503:
+                rejected[0] += 1
+                time.sleep(0.05)
+                continue
+            r.raise_for_status()
+            logins.append((time.perf_counter() - start) * 1000)
+
+    def probe():
+        session = requests.Session()
+        latencies = []
+        while time.time() < deadline:
+            for url in (f"{base}/documents?summary=true", f"{base}/users/me"):
+                start = time.perf_counter()
+                session.get(url, headers=headers).raise_for_status()
+                latencies.append((time.perf_counter() - start) * 1000)
+            time.sleep(0.05)
+        return latencies
+
+    clients = 0 if args.config == "idle" else args.logins
+    with ThreadPoolExecutor(max_workers=clients + 1) as pool:
+        login_futures = [pool.submit(login, n + 1) for n in range(clients)]
+        latencies = pool.submit(probe).result()
+        for future in login_futures:
+            future.result()
+
+    line = f"{args.config:<10} probe p50 {statistics.median(latencies):7.1f} ms   p99 {percentile(latencies, 0.99):7.1f} ms"
+    if logins:
+        line += f"   logins {len(logins) / args.seconds:6.1f}/s (p99 {percentile(logins, 0.99):7.1f} ms, {rejected[0]} rejected)"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=32, help="Concurrent login clients")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--rounds", type=int, default=29000, help="AUTH_HASH_ROUNDS")
+    parser.add_argument("--port", type=int, default=8769)
+    parser.add_argument("--config", choices=sorted(CONFIGS), help="Run one configuration in this process")
+    args = parser.parse_args()
+
+    if args.config:
+        run(args)
+        return
+    print(f"{args.logins} login clients, {args.rounds} PBKDF2 rounds, {args.seconds}s, {os.cpu_count()} CPUs")
+    # Each configuration gets a fresh process, database and server
+    for config in ("idle", "unbounded", "bounded"):
+        subprocess.run([sys.executable, os.path.abspath(__file__), "--config", config,
+                        "--logins", str(args.logins), "--seconds", str(args.seconds),
+                        "--rounds", str(args.rounds), "--port", str(args.port)], check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Cost of the built-in metrics on the hot paths.
+
+Boots the app with uvicorn against a temporary SQLite database and times a
+mix of cheap requests (document list summary, document GET, delta PATCH),
+where a fixed per-request cost shows most, once per configuration. Each
+configuration runs in its own process since the settings are read at import:
+
+  off         METRICS_ENABLED=false: no middleware work, no SQL event hooks
+  on          METRICS_ENABLED=true (the default)
+  profiling   METRICS_ENABLED=true with a sampling profile running throughout
+
+Also reports how long a scrape of /metrics takes once the run is over.
+
+Usage: python benchmarks/bench_metrics.py [--requests 2000]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+from common import start_server
+
+CONFIGS = {
+    "off": {"METRICS_ENABLED": "false"},
+    "on": {"METRICS_ENABLED": "true"},
+    "profiling": {"METRICS_ENABLED": "true", "PROFILER_ENABLED": "true"},
+}
+METRICS_TOKEN = "bench"
+
+
+def run(args):
+    os.environ.update(CONFIGS[args.config])
+    import requests
+    start_server(args.port, "metrics", {"METRICS_TOKEN": METRICS_TOKEN})
+    base = f"http://127.0.0.1:{args.port}"
+    from backend import auth
+
+    session = requests.Session()
+    email = "bench@example.com"
+    session.post(f"{base}/signup", json={"username": "bench", "email": email, "password": "bench", "security_code": auth.INTERNAL_SIGNUP_CODE}).raise_for_status()
+    token = session.post(f"{base}/token", data={"username": email, "password": "bench"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    metrics_headers = {"Authorization": f"Bearer {METRICS_TOKEN}"}
+
+    doc_ids = []
+    for n in range(20):
+        doc_id = session.post(f"{base}/upload_and_convert", headers=headers, files={"file": (f"doc{n}.bin", os.urandom(64))}).json()["document_id"]
+        session.put(f"{base}/documents/{doc_id}", headers=headers, json={"corrected_html": "<p>invoice total</p>" * 50, "filename": f"doc{n}"}).raise_for_status()
+        doc_ids.append(doc_id)
+
+    if args.config == "profiling":
+        threading.Thread(target=lambda: session.get(f"{base}/metrics/profile?seconds=600", headers=metrics_headers), daemon=True).start()
+
+    revisions = {}
+    latencies = {"list": [], "get": [], "patch": []}
+    start = time.perf_counter()
+    for n in range(args.requests):
+        doc_id = doc_ids[n % len(doc_ids)]
+        kind = ("list", "get", "patch")[n % 3]
+        sent = time.perf_counter()
+        if kind == "list":
+            r = session.get(f"{base}/documents?summary=true&limit=20", headers=headers)
+        elif kind == "get":
+            r = session.get(f"{base}/documents/{doc_id}", headers=headers)
+            revisions[doc_id] = r.json()["content_revision"]
+        else:
+            if doc_id not in revisions:
+                revisions[doc_id] = session.get(f"{base}/documents/{doc_id}", headers=headers).json()["content_revision"]
+            r = session.patch(f"{base}/documents/{doc_id}", headers=headers, json={"base_revision": revisions[doc_id], "ops": [{"retain": 3}, {"insert": "x"}]})
+            revisions[doc_id] = r.json()["content_revision"]
+        r.raise_for_status()
+        latencies[kind].append((time.perf_counter() - sent) * 1000)
+    total = time.perf_counter() - start
+
+    print(f"{args.config}: {args.requests} requests, {args.requests / total:.0f} req/s")
+    for kind, values in latencies.items():
+        print(f"  {kind:<6} median {statistics.median(values):6.2f} ms")
+    if args.config != "off":
+        sent = time.perf_counter()
+        r = session.get(f"{base}/metrics", headers=metrics_headers)
+        r.raise_for_status()
+        print(f"  scrape {(time.perf_counter() - sent) * 1000:6.2f} ms, {len(r.content):,} bytes")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--port", type=int, default=8776)
+    parser.add_argument("--config", choices=sorted(CONFIGS), help="Run one configuration in this process")
+    args = parser.parse_args()
+
+    if args.config:
+        run(args)
+        return
+    # Each configuration gets a fresh process, database and server
+    for config in ("off", "on", "profiling"):
+        subprocess.run([sys.executable, os.path.abspath(__file__), "--config", config,
+                        "--requests", str(args.requests), "--port", str(args.port)], check=True)
+
+
+if __name__ == "__main__":
+    main()
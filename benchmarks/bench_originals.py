@@ -0,0 +1,95 @@
+"""Showing an upload: the full original vs a byte range vs a cached thumbnail.
+
+Boots the app with uvicorn against a temporary SQLite database (with the old
+/uploads mount enabled for comparison), uploads a large photographed scan and
+a multi-page image-only PDF, then times, per file:
+
+  static      GET /uploads/<path>, the old unauthenticated mount
+  original    GET /documents/{id}/original?key=..., the whole file
+  range       the same with Range: bytes=0-65535 (what a PDF viewer asks first)
+  304         the same with If-None-Match (revalidating a cached copy)
+  thumb cold  GET /documents/{id}/thumbnail?size=192, first request (renders it)
+  thumb       the same once it is cached on disk
+
+Reports median latency and bytes on the wire.
+
+Usage: python benchmarks/bench_originals.py [--requests 30] [--megapixels 12]
+"""
+import argparse
+import io
+import os
+import statistics
+import time
+
+from common import start_server
+
+
+def make_scan(megapixels: float):
+    # Noise, so JPEG can't compress it far below a real photographed page
+    from PIL import Image
+    width = int((megapixels * 1e6 * 3 / 4) ** 0.5)
+    height = width * 4 // 3
+    return Image.frombytes("RGB", (width, height), os.urandom(width * height * 3)).reduce(4).resize((width, height))
+
+
+def make_files(megapixels: float) -> list:
+    scan = make_scan(megapixels)
+    jpg = io.BytesIO()
+    scan.save(jpg, "JPEG", quality=85)
+    pdf = io.BytesIO()
+    scan.save(pdf, "PDF", save_all=True, append_images=[scan.rotate(180)] * 4, resolution=300)
+    return [("scan.jpg", jpg.getvalue()), ("scan.pdf", pdf.getvalue())]
+
+
+def timed(session, url: str, headers: dict, expect: int) -> tuple:
+    start = time.perf_counter()
+    r = session.get(url, headers=headers)
+    elapsed = (time.perf_counter() - start) * 1000
+    assert r.status_code == expect, (url, r.status_code, r.text[:200])
+    return elapsed, len(r.content)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=30, help="Requests per measurement")
+    parser.add_argument("--megapixels", type=float, default=12, help="Size of the scan")
+    parser.add_argument("--port", type=int, default=8774)
+    args = parser.parse_args()
+
+    import requests
+    start_server(args.port, "originals", {"UPLOADS_PUBLIC": "true"})
+    base = f"http://127.0.0.1:{args.port}"
+    from backend import auth
+
+    session = requests.Session()
+    email = "bench@example.com"
+    session.post(f"{base}/signup", json={"username": "bench", "email": email, "password": "bench", "security_code": auth.INTERNAL_SIGNUP_CODE}).raise_for_status()
+    token = session.post(f"{base}/token", data={"username": email, "password": "bench"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    key = session.get(f"{base}/documents/file_key", headers=headers).json()["key"]
+
+    for name, data in make_files(args.megapixels):
+        doc_id = session.post(f"{base}/upload_and_convert", headers=headers, files={"file": (name, data)}).json()["document_id"]
+        doc = session.get(f"{base}/documents/{doc_id}", headers=headers).json()
+        original = f"{base}/documents/{doc_id}/original?key={key}"
+        thumbnail = f"{base}/documents/{doc_id}/thumbnail?size=192&key={key}"
+        etag = session.get(original).headers["ETag"]
+
+        print(f"{name}: {len(data) / 1024 / 1024:.1f} MB")
+        cold = timed(session, thumbnail, {}, 200)
+        measurements = [
+            ("static", f"{base}/{doc['original_path']}", {}, 200),
+            ("original", original, {}, 200),
+            ("range", original, {"Range": "bytes=0-65535"}, 206),
+            ("304", original, {"If-None-Match": etag}, 304),
+        ]
+        for label, url, extra, expect in measurements:
+            results = [timed(session, url, extra, expect) for _ in range(args.requests)]
+            print(f"  {label:<10} median {statistics.median(ms for ms, _ in results):8.2f} ms   {results[0][1]:>10,} bytes")
+        print(f"  {'thumb cold':<10} once   {cold[0]:8.2f} ms   {cold[1]:>10,} bytes")
+        results = [timed(session, thumbnail, {}, 200) for _ in range(args.requests)]
+        print(f"  {'thumb':<10} median {statistics.median(ms for ms, _ in results):8.2f} ms   {results[0][1]:>10,} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Opening and autosaving a long document: whole document vs pages.
+
+Boots the app with uvicorn against a temporary SQLite database, stores one
+long document (--pages pages of DOCUMENT_PAGE_CHARS each, as the local PDF
+extractor writes them) and times what the editor does with it, before and
+after:
+
+  open full     GET /documents/{id}, the whole document
+  open pages    GET /documents/{id}/pages?start=1&count=5, what the editor loads first
+  save full     PATCH /documents/{id} with a one-word delta against the whole html
+  save page     PUT /documents/{id}/pages with the same edit to one page
+
+Reports median latency and bytes on the wire. The full save leaves out the
+browser's side, where the old editor serialized and diffed the whole
+document on every autosave.
+
+Usage: python benchmarks/bench_pages.py [--pages 200] [--requests 30]
+"""
+import argparse
+import statistics
+import time
+
+from common import start_server
+
+
+def make_html(pages: int) -> str:
+    paragraph = "<p>Clause {}: the parties agree to the terms and conditions set out in this agreement.</p>"
+    per_page = 45 # About DOCUMENT_PAGE_CHARS of html
+    return "".join(
+        '<div class="page">' + "".join(paragraph.format(page * per_page + line) for line in range(per_page)) + "</div>"
+        for page in range(pages)
+    )
+
+
+def timed(call, expect: int = 200) -> tuple:
+    start = time.perf_counter()
+    r = call()
+    elapsed = (time.perf_counter() - start) * 1000
+    assert r.status_code == expect, (r.status_code, r.text[:200])
+    return elapsed, len(r.content), r
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=200, help="Pages in the document")
+    parser.add_argument("--requests", type=int, default=30, help="Requests per measurement")
+    parser.add_argument("--port", type=int, default=8775)
+    args = parser.parse_args()
+
+    import requests
+    start_server(args.port, "pages")
+    base = f"http://127.0.0.1:{args.port}"
+    from backend import auth
+
+    session = requests.Session()
+    email = "bench@example.com"
+    session.post(f"{base}/signup", json={"username": "bench", "email": email, "password": "bench", "security_code": auth.INTERNAL_SIGNUP_CODE}).raise_for_status()
+    token = session.post(f"{base}/token", data={"username": email, "password": "bench"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    html = make_html(args.pages)
+    doc_id = session.post(f"{base}/upload_and_convert", headers=headers, files={"file": ("long.bin", b"bench")}).json()["document_id"]
+    session.put(f"{base}/documents/{doc_id}", headers=headers, json={"corrected_html": html, "filename": "long"}).raise_for_status()
+    # The first read splits the pages; time the steady state
+    page_count = session.get(f"{base}/documents/{doc_id}/pages?start=1&count=1", headers=headers).json()["page_count"]
+    print(f"{len(html) / 1024:.0f} KB of html in {page_count} pages")
+
+    def report(label: str, results: list):
+        print(f"  {label:<11} median {statistics.median(ms for ms, _, _ in results):8.2f} ms   {results[0][1]:>10,} bytes")
+
+    report("open full", [timed(lambda: session.get(f"{base}/documents/{doc_id}", headers=headers)) for _ in range(args.requests)])
+    report("open pages", [timed(lambda: session.get(f"{base}/documents/{doc_id}/pages?start=1&count=5", headers=headers)) for _ in range(args.requests)])
+
+    # The same edit both ways, in the middle of the document: each save inserts a word into page `middle`
+    middle = page_count // 2
+    results = []
+    for n in range(args.requests):
+        doc = session.get(f"{base}/documents/{doc_id}", headers=headers).json()
+        offset = doc["corrected_html"].index("<p>", len(doc["corrected_html"]) // 2) + 3
+        ops = [{"retain": offset}, {"insert": f"edit{n} "}]
+        body = {"base_revision": doc["content_revision"], "ops": ops}
+        results.append(timed(lambda: session.patch(f"{base}/documents/{doc_id}", headers=headers, json=body)))
+    report("save full", results)
+
+    results = []
+    for n in range(args.requests):
+        page = session.get(f"{base}/documents/{doc_id}/pages?start={middle}&count=1", headers=headers).json()["pages"][0]
+        ops = [{"retain": page["html"].index("<p>") + 3}, {"insert": f"edit{n} "}]
+        body = {"pages": [{"number": page["number"], "base_revision": page["revision"], "ops": ops}]}
+        results.append(timed(lambda: session.put(f"{base}/documents/{doc_id}/pages", headers=headers, json=body)))
+    report("save page", results)
+
+
+if __name__ == "__main__":
+    main()
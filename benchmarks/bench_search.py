@@ -0,0 +1,165 @@
+"""Full-text search over a large synthetic corpus.
+
+Seeds a temporary SQLite database with synthetic extracted documents, builds
+the index with each search backend (FTS5 and the built-in inverted index) and
+times term, multi-term, prefix and tag-filtered queries against a naive
+scan of raw_text.
+
+Usage: python benchmarks/bench_search.py [--docs 100000] [--words 200] [--queries 50]
+"""
+import argparse
+import itertools
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+USERS = 10
+
+
+def setup_database():
+    workdir = tempfile.mkdtemp(prefix="bench-search-")
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{workdir}/bench.db")
+    sys.path.insert(0, ROOT)
+    from backend import models, database
+    models.Base.metadata.create_all(bind=database.engine)
+    return database
+
+
+def make_vocabulary(size: int, rng: random.Random) -> list:
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(letters) for _ in range(rng.randint(3, 10))))
+    return sorted(words)
+
+
+def seed(database, docs: int, words: int, vocabulary: list, rng: random.Random):
+    from sqlalchemy import insert
+    from backend import models
+
+    # Zipf-like word frequencies, as in real text
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    db = database.SessionLocal()
+    try:
+        tags = [models.Tag(name=name) for name in ("finance", "legal", "hr", "archive")]
+        db.add_all(tags)
+        db.flush()
+        tag_ids = [tag.id for tag in tags]
+
+        batch = 5000
+        for start in range(0, docs, batch):
+            rows = []
+            for i in range(start, min(start + batch, docs)):
+                text = " ".join(rng.choices(vocabulary, weights=weights, k=words))
+                rows.append({
+                    "id": i + 1,
+                    "user_id": i % USERS + 1,
+                    "filename": f"{rng.choice(vocabulary)}_{i}.pdf",
+                    "raw_text": text,
+                    "status": "Ready",
+                    "upload_date": "2024-01-01 00:00:00",
+                })
+            db.execute(insert(models.Document), rows)
+            links = [
+                {"document_id": row["id"], "tag_id": tag_id}
+                for row in rows for tag_id in tag_ids if rng.random() < 0.1
+            ]
+            if links:
+                db.execute(insert(models.document_tags), links)
+            db.commit()
+    finally:
+        db.close()
+
+
+def timed(fn, repeat: int) -> list:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(label: str, samples: list):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1] if len(samples) >= 20 else samples[-1]
+    print(f"  {label:<24} median {statistics.median(samples):8.2f} ms   p95 {p95:8.2f} ms")
+
+
+def scan(db, user_id: int, term: str):
+    # raw_text is stored compressed, so without an index every row has to be read and decompressed
+    from backend import models
+    found = []
+    rows = db.query(models.Document.id, models.Document.raw_text).filter(models.Document.user_id == user_id).yield_per(500)
+    for doc_id, raw_text in rows:
+        if term in (raw_text or ""):
+            found.append(doc_id)
+            if len(found) == 20:
+                break
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=100000)
+    parser.add_argument("--words", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    database = setup_database()
+    from backend import search
+
+    vocabulary = make_vocabulary(20000, rng)
+    start = time.perf_counter()
+    seed(database, args.docs, args.words, vocabulary, rng)
+    print(f"Seeded {args.docs} documents ({args.words} words each) in {time.perf_counter() - start:.1f}s")
+
+    # Mid-frequency words: common enough to match many documents, rare enough to rank
+    common = vocabulary[:1]
+    mid = vocabulary[50:2000]
+    queries = [rng.choice(mid) for _ in range(args.queries)]
+    pairs = [f"{rng.choice(mid)} {rng.choice(mid)}" for _ in range(args.queries)]
+    prefixes = [rng.choice(mid)[:3] + "*" for _ in range(args.queries)]
+
+    db = database.SessionLocal()
+    try:
+        print("\nBaseline (scan of raw_text, first 20 matches, unranked)")
+        it = itertools.cycle(queries)
+        report("single term", timed(lambda: scan(db, rng.randint(1, USERS), next(it)), args.queries))
+
+        backends = [search.FTS5Backend(), search.BuiltinBackend()]
+        for backend in backends:
+            try:
+                backend.ensure(database.engine)
+            except Exception as e:
+                print(f"\n{backend.name}: unavailable ({e})")
+                continue
+            search._backend = backend
+
+            start = time.perf_counter()
+            total = search.rebuild(db)
+            print(f"\n{backend.name}: indexed {total} documents in {time.perf_counter() - start:.1f}s")
+
+            def run(items, **kwargs):
+                it = itertools.cycle(items)
+                return lambda: search.search(db, rng.randint(1, USERS), next(it), limit=20, **kwargs)
+
+            report("single term", timed(run(queries), args.queries))
+            report("two terms (AND)", timed(run(pairs), args.queries))
+            report("prefix", timed(run(prefixes), args.queries))
+            report("term + tag filter", timed(run(queries, tags=["finance"]), args.queries))
+            report("term + 2 tags (any)", timed(run(queries, tags=["finance", "legal"], match_all_tags=False), args.queries))
+            report("page 5", timed(run(queries, offset=80), args.queries))
+            report("most common word", timed(run(common), 5))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
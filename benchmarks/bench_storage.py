@@ -0,0 +1,176 @@
+"""Document storage size and query latency, before and after compressed LOB columns.
+
+Builds a database with the old schema (raw_text / corrected_html as plain
+String columns, always loaded with the row), seeds it with OCR-sized
+documents and times the list, tag and single-document queries. It then runs
+backend/migrations.py on a copy, VACUUMs it and repeats the same queries
+against the current models (compressed, deferred columns).
+
+Usage: python benchmarks/bench_storage.py [--docs 2000] [--kb 40] [--repeat 20]
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+USERS = 10
+WORDS = ["invoice", "total", "amount", "customer", "shipping", "address", "date", "order", "tax", "item",
+         "payment", "due", "account", "number", "reference", "description", "quantity", "price", "subtotal"]
+
+
+def legacy_models():
+    # The schema before the storage change, as it was declared in backend/models.py
+    from sqlalchemy import Column, Integer, String, Table, ForeignKey
+    from sqlalchemy.orm import declarative_base, relationship
+
+    Base = declarative_base()
+    document_tags = Table("document_tags", Base.metadata,
+        Column("document_id", Integer, ForeignKey("documents.id")),
+        Column("tag_id", Integer, ForeignKey("tags.id")))
+
+    class Document(Base):
+        __tablename__ = "documents"
+        id = Column(Integer, primary_key=True, index=True)
+        user_id = Column(Integer, index=True)
+        upload_date = Column(String(50))
+        original_path = Column(String(255))
+        filename = Column(String(255))
+        raw_text = Column(String(5000))
+        corrected_html = Column(String(5000))
+        status = Column(String(20))
+        tags = relationship("Tag", secondary=document_tags)
+
+    class Tag(Base):
+        __tablename__ = "tags"
+        id = Column(Integer, primary_key=True, index=True)
+        name = Column(String(50), unique=True, index=True)
+        color = Column(String(20), default="blue")
+
+    class DocumentVersion(Base):
+        __tablename__ = "document_versions"
+        id = Column(Integer, primary_key=True, index=True)
+        document_id = Column(Integer, index=True)
+        version_number = Column(Integer)
+        corrected_html = Column(String(5000))
+        timestamp = Column(String(50))
+
+    return Base, Document, Tag, document_tags
+
+
+def make_text(size: int, rng: random.Random) -> str:
+    lines, length = [], 0
+    while length < size:
+        line = " ".join(rng.choice(WORDS) for _ in range(12)) + f" {rng.randint(1, 99999)}.{rng.randint(0, 99):02d}"
+        lines.append(line)
+        length += len(line) + 1
+    return "\n".join(lines)
+
+
+def seed(path: str, docs: int, kb: int, rng: random.Random):
+    from sqlalchemy import create_engine, insert
+    Base, Document, Tag, document_tags = legacy_models()
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(Tag), [{"id": i + 1, "name": name} for i, name in enumerate(("finance", "legal", "hr"))])
+        for start in range(0, docs, 200):
+            rows, links = [], []
+            for i in range(start, min(start + 200, docs)):
+                raw = make_text(kb * 1024 // 2, rng)
+                html = "".join(f"<p>{line}</p>" for line in raw.split("\n"))
+                rows.append({"id": i + 1, "user_id": i % USERS + 1, "upload_date": "2024-01-01 00:00:00",
+                             "original_path": f"uploads/{i}.pdf", "filename": f"scan_{i}.pdf",
+                             "raw_text": raw, "corrected_html": html, "status": "Ready"})
+                if i % 3 == 0:
+                    links.append({"document_id": i + 1, "tag_id": 1})
+            conn.execute(insert(Document), rows)
+            if links:
+                conn.execute(insert(document_tags), links)
+    engine.dispose()
+
+
+def timed(fn, repeat: int) -> str:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return f"median {statistics.median(samples):8.2f} ms   max {max(samples):8.2f} ms"
+
+
+def run_queries(Session, Document, Tag, repeat: int, full_loader=None):
+    from sqlalchemy.orm import selectinload
+    session = Session()
+    try:
+        def list_documents():
+            session.expunge_all()
+            session.query(Document).options(selectinload(Document.tags)).filter(Document.user_id == 1).all()
+
+        def tagged_documents():
+            session.expunge_all()
+            session.query(Document).join(Document.tags).filter(Tag.name == "finance", Document.user_id == 1).all()
+
+        def get_document():
+            session.expunge_all()
+            query = session.query(Document)
+            if full_loader is not None:
+                query = query.options(full_loader)
+            doc = query.filter(Document.id == 42).first()
+            len(doc.corrected_html) + len(doc.raw_text)
+
+        print(f"  list (user's documents)  {timed(list_documents, repeat)}")
+        print(f"  documents with a tag     {timed(tagged_documents, repeat)}")
+        print(f"  get one (with content)   {timed(get_document, repeat)}")
+    finally:
+        session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=2000)
+    parser.add_argument("--kb", type=int, default=40, help="Approximate raw_text + corrected_html size per document")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-storage-")
+    before_path = os.path.join(workdir, "before.db")
+    after_path = os.path.join(workdir, "after.db")
+
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.orm import sessionmaker
+
+    start = time.perf_counter()
+    seed(before_path, args.docs, args.kb, random.Random(7))
+    print(f"Seeded {args.docs} documents (~{args.kb} KB of text each) in {time.perf_counter() - start:.1f}s")
+    shutil.copy(before_path, after_path)
+
+    print(f"\nBefore: plain String columns, loaded with every row   ({os.path.getsize(before_path) / 1024 / 1024:.1f} MB)")
+    _, LegacyDocument, LegacyTag, _ = legacy_models()
+    engine = create_engine(f"sqlite:///{before_path}")
+    run_queries(sessionmaker(bind=engine), LegacyDocument, LegacyTag, args.repeat)
+    engine.dispose()
+
+    os.environ["DATABASE_URL"] = f"sqlite:///{after_path}"
+    sys.path.insert(0, ROOT)
+    from backend import models, migrations, database
+    from sqlalchemy.orm import undefer_group
+
+    start = time.perf_counter()
+    models.Base.metadata.create_all(bind=database.engine)
+    migrations.upgrade(database.engine)
+    migrated = time.perf_counter() - start
+    with database.engine.connect() as conn:
+        conn.execute(text("VACUUM"))
+
+    print(f"\nAfter: compressed, deferred LOB columns   ({os.path.getsize(after_path) / 1024 / 1024:.1f} MB, migrated in {migrated:.1f}s)")
+    run_queries(database.SessionLocal, models.Document, models.Tag, args.repeat, full_loader=undefer_group("content"))
+
+
+if __name__ == "__main__":
+    main()
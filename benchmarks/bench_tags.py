@@ -0,0 +1,154 @@
+"""Tag filtering, tag counts and bulk tagging for a user with many documents.
+
+Boots the app with uvicorn against a temporary SQLite database and seeds one
+user with --documents documents (plus --other-users users with a tenth as
+many, carrying the same tag names, so every query has to stay within its
+user). Tag t<k> is on every (k + 2)-th document, "rare" on every 1000th.
+Then times:
+
+  list ...      GET /documents?summary=true&limit=50&tags=...&match=...,
+                the first page and a page deep into the results (cursor)
+  tags          GET /tags, every tag with its document count
+  bulk add      POST /tags/bulk, --bulk documents x 2 tags in one request
+  bulk remove   POST /tags/bulk/remove, the same pairs
+  single add    POST /documents/{id}/tags/{name}, one call per document
+
+and prints SQLite's plan for the AND filter, which should only search the
+tag indexes.
+
+Usage: python benchmarks/bench_tags.py [--documents 50000] [--requests 20]
+"""
+import argparse
+import statistics
+import time
+from datetime import datetime
+
+from common import start_server
+
+PASSWORD = "bench"
+TAGS = [f"t{k}" for k in range(10)]
+
+
+def doc_tags(n: int) -> list:
+    names = [name for k, name in enumerate(TAGS) if n % (k + 2) == 0]
+    if n % 1000 == 0:
+        names.append("rare")
+    return names
+
+
+def seed(documents: int, other_users: int) -> tuple:
+    """Users, documents, tags and pairs inserted in bulk; returns (user_id, email, [doc_id, ...]) of the measured user."""
+    from sqlalchemy import insert, select
+    from backend import auth, database, models
+
+    hashed = auth.get_password_hash(PASSWORD)
+    now = str(datetime.utcnow())
+    with database.SessionLocal() as db:
+        db.execute(insert(models.User), [
+            {"username": f"bench{n}", "email": f"bench{n}@example.com", "hashed_password": hashed} for n in range(other_users + 1)
+        ])
+        users = db.execute(select(models.User.id, models.User.email).order_by(models.User.id)).all()
+        main_id, main_email = users[0]
+        for user_id, _ in users:
+            count = documents if user_id == main_id else max(documents // 10, 1)
+            rows = [{
+                "user_id": user_id,
+                "upload_date": now,
+                "filename": f"seed-{user_id}-{n}.pdf",
+                "original_path": f"uploads/seed-{user_id}-{n}.pdf",
+                "corrected_html": f"<p>Document {n}</p>",
+                "status": "Ready",
+                "revision": 1,
+                "updated_at": now,
+            } for n in range(count)]
+            for start in range(0, len(rows), 5000):
+                db.execute(insert(models.Document), rows[start:start + 5000])
+            db.execute(insert(models.Tag), [{"user_id": user_id, "name": name, "color": "blue"} for name in TAGS + ["rare"]])
+            tag_ids = dict(db.execute(select(models.Tag.name, models.Tag.id).where(models.Tag.user_id == user_id)).all())
+            doc_ids = db.execute(select(models.Document.id).where(models.Document.user_id == user_id).order_by(models.Document.id)).scalars().all()
+            pairs = [{"document_id": doc_id, "tag_id": tag_ids[name]} for n, doc_id in enumerate(doc_ids) for name in doc_tags(n)]
+            for start in range(0, len(pairs), 20000):
+                db.execute(insert(models.document_tags), pairs[start:start + 20000])
+        db.commit()
+        main_docs = db.execute(select(models.Document.id).where(models.Document.user_id == main_id).order_by(models.Document.id)).scalars().all()
+    return main_id, main_email, main_docs
+
+
+def print_plan(user_id: int):
+    from sqlalchemy import text
+    from backend import database, main
+
+    query = main.documents_page_query(user_id, 0, 50, None, True, ["t0", "rare"], True)
+    sql = str(query.compile(database.engine, compile_kwargs={"literal_binds": True}))
+    with database.engine.connect() as conn:
+        print("plan for tags=t0,rare&match=all:")
+        for row in conn.execute(text("EXPLAIN QUERY PLAN " + sql)):
+            print(f"  {row[-1]}")
+
+
+def timed(call) -> float:
+    start = time.perf_counter()
+    r = call()
+    elapsed = (time.perf_counter() - start) * 1000
+    assert r.status_code == 200, (r.status_code, r.text[:200])
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--documents", type=int, default=50000, help="Documents of the measured user")
+    parser.add_argument("--other-users", type=int, default=4)
+    parser.add_argument("--bulk", type=int, default=1000, help="Documents per bulk request")
+    parser.add_argument("--single", type=int, default=100, help="Per-document tag calls to time")
+    parser.add_argument("--requests", type=int, default=20, help="Requests per measurement")
+    parser.add_argument("--port", type=int, default=8778)
+    args = parser.parse_args()
+
+    import requests
+    start_server(args.port, "tags")
+    base = f"http://127.0.0.1:{args.port}"
+
+    started = time.perf_counter()
+    user_id, email, doc_ids = seed(args.documents, args.other_users)
+    print(f"seeded {len(doc_ids):,} documents in {time.perf_counter() - started:.1f} s")
+
+    session = requests.Session()
+    token = session.post(f"{base}/token", data={"username": email, "password": PASSWORD}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    print_plan(user_id)
+
+    def median(call) -> float:
+        return statistics.median(timed(call) for _ in range(args.requests))
+
+    deep = doc_ids[int(len(doc_ids) * 0.9)]
+    for label, query in (
+        ("t0", "tags=t0"),
+        ("t9", "tags=t9"),
+        ("rare", "tags=rare"),
+        ("t0 AND t1", "tags=t0,t1&match=all"),
+        ("t0 AND rare", "tags=t0,rare&match=all"),
+        ("t8 OR t9", "tags=t8,t9&match=any"),
+        ("rare OR t9", "tags=rare,t9&match=any"),
+    ):
+        url = f"{base}/documents?summary=true&limit=50&{query}"
+        first = median(lambda: session.get(url, headers=headers))
+        later = median(lambda: session.get(f"{url}&cursor={deep}", headers=headers))
+        count = len(session.get(url, headers=headers).json())
+        print(f"  list {label:<12} first page {first:7.2f} ms   deep page {later:7.2f} ms   ({count} rows)")
+
+    print(f"  tags              {median(lambda: session.get(f'{base}/tags', headers=headers)):7.2f} ms")
+
+    chosen = doc_ids[:args.bulk]
+    body = {"document_ids": chosen, "tags": ["bulk-a", "bulk-b"]}
+    add = timed(lambda: session.post(f"{base}/tags/bulk", headers=headers, json=body))
+    remove = timed(lambda: session.post(f"{base}/tags/bulk/remove", headers=headers, json=body))
+    print(f"  bulk add          {add:7.2f} ms for {len(chosen)} documents x 2 tags")
+    print(f"  bulk remove       {remove:7.2f} ms")
+
+    single = [timed(lambda: session.post(f"{base}/documents/{doc_id}/tags/single", headers=headers)) for doc_id in doc_ids[:args.single]]
+    per_call = statistics.median(single)
+    print(f"  single add        {per_call:7.2f} ms per call, ~{per_call * len(chosen) * 2 / 1000:.1f} s for the same pairs")
+
+
+if __name__ == "__main__":
+    main()
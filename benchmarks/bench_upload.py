@@ -0,0 +1,82 @@
+"""Upload throughput under concurrent clients.
+
+Boots the app with uvicorn against a temporary SQLite database and measures
+MB/s for the multipart endpoint and the chunked upload-session endpoint.
+
+Usage: python benchmarks/bench_upload.py [--clients 8] [--files 32] [--size-mb 8]
+"""
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import start_server
+
+
+def auth_headers(base: str, requests) -> dict:
+    from backend import auth
+    email = "bench@example.com"
+    requests.post(f"{base}/signup", json={"username": "bench", "email": email, "password": "bench", "security_code": auth.INTERNAL_SIGNUP_CODE})
+    token = requests.post(f"{base}/token", data={"username": email, "password": "bench"}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def multipart_upload(session, base, headers, payload):
+    r = session.post(f"{base}/upload_and_convert", headers=headers, files={"file": ("bench.pdf", payload, "application/pdf")})
+    r.raise_for_status()
+
+
+def chunked_upload(session, base, headers, payload, chunk_size):
+    r = session.post(f"{base}/upload_sessions", headers=headers, json={"filename": "bench.pdf", "size": len(payload)})
+    r.raise_for_status()
+    upload_id = r.json()["upload_id"]
+    for offset in range(0, len(payload), chunk_size):
+        r = session.put(f"{base}/upload_sessions/{upload_id}", params={"offset": offset}, headers=headers, data=payload[offset:offset + chunk_size])
+        r.raise_for_status()
+    session.post(f"{base}/upload_sessions/{upload_id}/complete", headers=headers).raise_for_status()
+
+
+def run(name, fn, clients, files, payload):
+    import requests
+    local = threading.local()
+
+    def task(_):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        start = time.perf_counter()
+        fn(local.session, payload)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        latencies = sorted(pool.map(task, range(files)))
+    elapsed = time.perf_counter() - start
+    total_mb = len(payload) * files / (1024 * 1024)
+    p95 = latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)]
+    print(f"{name:<12}{total_mb / elapsed:>10.1f} MB/s{latencies[len(latencies) // 2]:>10.3f}s p50{p95:>10.3f}s p95")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--files", type=int, default=32)
+    parser.add_argument("--size-mb", type=float, default=8)
+    parser.add_argument("--chunk-mb", type=float, default=4)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    import requests
+    start_server(args.port, "upload", log_level="warning")
+    base = f"http://127.0.0.1:{args.port}"
+    headers = auth_headers(base, requests)
+    payload = os.urandom(int(args.size_mb * 1024 * 1024))
+    chunk_size = int(args.chunk_mb * 1024 * 1024)
+
+    print(f"{args.files} files x {args.size_mb} MB, {args.clients} concurrent clients")
+    run("multipart", lambda s, p: multipart_upload(s, base, headers, p), args.clients, args.files, payload)
+    run("chunked", lambda s, p: chunked_upload(s, base, headers, p, chunk_size), args.clients, args.files, payload)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""Shared setup for the benchmark scripts.
+
+The scripts run as `python benchmarks/bench_<name>.py`, so this directory is
+on sys.path and they import it as `common`.
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def start_server(port: int, name: str, env: dict = None, log_level: str = "error"):
+    """Boot the app with uvicorn in a thread, in a new temporary working directory.
+
+    Settings already in the environment win over the defaults here (a
+    temporary SQLite database, an N8N webhook nothing listens on, one dispatch
+    attempt); `env` is applied on top of both. Settings have to be in place
+    before the backend is imported, which is why that happens in here.
+    """
+    workdir = tempfile.mkdtemp(prefix=f"bench-{name}-")
+    os.chdir(workdir)
+    os.makedirs("uploads", exist_ok=True)
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{workdir}/bench.db")
+    os.environ.setdefault("N8N_WEBHOOK_URL", "http://127.0.0.1:9/webhook")
+    os.environ.setdefault("DISPATCH_MAX_ATTEMPTS", "1")
+    os.environ.update(env or {})
+    sys.path.insert(0, ROOT)
+
+    import uvicorn
+    from backend.main import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level=log_level))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
@@ -0,0 +1,66 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The backend reads its settings at import, so they are set before anything imports it
+WORKDIR = tempfile.mkdtemp(prefix="backend-tests-")
+os.chdir(WORKDIR)
+os.makedirs("uploads", exist_ok=True)
+os.environ["DATABASE_URL"] = f"sqlite:///{WORKDIR}/test.db"
+os.environ["N8N_WEBHOOK_URL"] = "http://127.0.0.1:9/webhook"
+os.environ.setdefault("DATABASE_ASYNC", "false")
+sys.path.insert(0, ROOT)
+
+from fastapi.testclient import TestClient
+from backend import auth, database, dispatch, main, models
+
+
+@pytest.fixture(autouse=True)
+def no_dispatch_threads(monkeypatch):
+    # Uploads still queue their jobs; tests that need the dispatcher run it by hand
+    monkeypatch.setattr(dispatch.dispatcher, "wake", lambda: None)
+
+
+@pytest.fixture
+def client():
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def db():
+    session = database.SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+_users = iter(range(1, 1000000))
+
+
+@pytest.fixture
+def make_user(client):
+    """Sign up a new user; returns (user_id, Authorization headers)."""
+    def make():
+        email = f"user{next(_users)}@example.com"
+        r = client.post("/signup", json={"username": email.split("@")[0], "email": email, "password": "pw", "security_code": auth.INTERNAL_SIGNUP_CODE})
+        assert r.status_code == 200, r.text
+        token = client.post("/token", data={"username": email, "password": "pw"}).json()["access_token"]
+        return r.json()["id"], {"Authorization": f"Bearer {token}"}
+    return make
+
+
+@pytest.fixture
+def make_document(db):
+    """Insert a Ready document straight into the database; returns its id."""
+    def make(user_id: int, html: str = "<p>hello world</p>", status: str = "Ready"):
+        doc = models.Document(user_id=user_id, filename="doc.txt", original_path="uploads/doc.txt", upload_date="2026-01-01 00:00:00",
+                              raw_text="hello world", corrected_html=html, status=status, revision=1)
+        db.add(doc)
+        db.commit()
+        return doc.id
+    return make
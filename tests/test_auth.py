@@ -0,0 +1,54 @@
+import time
+from datetime import timedelta
+
+from passlib.context import CryptContext
+from passlib.hash import pbkdf2_sha256
+
+from backend import auth, models
+
+
+def test_token_cache_entries_expire(db, make_user):
+    user_id, _ = make_user()
+    user = db.get(models.User, user_id)
+    token = auth.create_access_token({"sub": str(user_id)}, timedelta(minutes=5))
+
+    cache = auth.TokenCache(max_entries=10, ttl_seconds=0.05)
+    assert cache.put(token, user).id == user_id
+    assert cache.get(token).id == user_id
+    time.sleep(0.1)
+    assert cache.get(token) is None
+
+    # Never cached past the token's own expiry, however long the TTL
+    cache = auth.TokenCache(max_entries=10, ttl_seconds=3600)
+    expired = auth.create_access_token({"sub": str(user_id)}, timedelta(seconds=-1))
+    cache.put(expired, user)
+    assert cache.get(expired) is None
+
+
+def test_token_cache_drops_least_recently_used(db, make_user):
+    user_id, _ = make_user()
+    user = db.get(models.User, user_id)
+    cache = auth.TokenCache(max_entries=2, ttl_seconds=60)
+    tokens = [auth.create_access_token({"sub": str(user_id), "n": n}) for n in range(3)]
+    cache.put(tokens[0], user)
+    cache.put(tokens[1], user)
+    cache.get(tokens[0])
+    cache.put(tokens[2], user)
+    assert cache.get(tokens[1]) is None
+    assert cache.get(tokens[0]) is not None
+
+
+def test_login_upgrades_outdated_hash(client, db, make_user, monkeypatch):
+    user_id, _ = make_user()
+    user = db.get(models.User, user_id)
+    user.hashed_password = pbkdf2_sha256.using(rounds=1000).hash("pw")
+    db.commit()
+    monkeypatch.setattr(auth, "pwd_context", CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto", pbkdf2_sha256__rounds=5000))
+
+    r = client.post("/token", data={"username": user.email, "password": "pw"})
+    assert r.status_code == 200, r.text
+    db.expire_all()
+    stored = db.get(models.User, user_id).hashed_password
+    assert pbkdf2_sha256.from_string(stored).rounds == 5000
+    assert client.post("/token", data={"username": user.email, "password": "wrong"}).status_code == 401
+    assert client.post("/token", data={"username": user.email, "password": "pw"}).status_code == 200
@@ -0,0 +1,95 @@
+import os
+
+from fastapi.testclient import TestClient
+
+from backend import main, storage
+
+
+def upload(client, headers, data: bytes) -> int:
+    r = client.post("/upload_and_convert", headers=headers, files={"file": ("same.txt", data)})
+    assert r.status_code == 202, r.text
+    return r.json()["document_id"]
+
+
+def original_path(client, headers, doc_id: int) -> str:
+    return client.get(f"/documents/{doc_id}", headers=headers).json()["original_path"]
+
+
+def test_shared_blob_removed_with_last_document(client, make_user):
+    _, first = make_user()
+    _, second = make_user()
+    a = upload(client, first, b"shared content")
+    b = upload(client, second, b"shared content")
+    path = original_path(client, first, a)
+    assert path == original_path(client, second, b)
+
+    assert client.delete(f"/documents/{a}", headers=first).status_code == 204
+    assert os.path.exists(path)
+    assert client.delete(f"/documents/{b}", headers=second).status_code == 204
+    assert not os.path.exists(path)
+
+
+def test_pinned_blob_survives_delete_of_last_document(client, db, make_user):
+    user_id, headers = make_user()
+    doc_id = upload(client, headers, b"raced content")
+    path = original_path(client, headers, doc_id)
+
+    # A second upload of the same content has stored its blob but not committed its document yet
+    temp_path = storage.new_temp_path()
+    with open(temp_path, "wb") as f:
+        f.write(b"raced content")
+    digest = os.path.basename(path).split(".")[0]
+    assert storage.store_blob(temp_path, digest, "same.txt") == path
+
+    assert client.delete(f"/documents/{doc_id}", headers=headers).status_code == 204
+    assert os.path.exists(path)
+
+    new_doc = main.create_uploaded_document(db, user_id, "same.txt", path, digest, 13)
+    assert path not in storage._pinned_blobs
+    assert client.delete(f"/documents/{new_doc.id}", headers=headers).status_code == 204
+    assert not os.path.exists(path)
+
+
+def test_deleted_blob_is_stored_again(client, make_user):
+    _, headers = make_user()
+    doc_id = upload(client, headers, b"come back")
+    path = original_path(client, headers, doc_id)
+    client.delete(f"/documents/{doc_id}", headers=headers)
+    assert not os.path.exists(path)
+
+    doc_id = upload(client, headers, b"come back")
+    assert original_path(client, headers, doc_id) == path
+    with open(path, "rb") as f:
+        assert f.read() == b"come back"
+
+
+def post_batch(client, headers, *contents):
+    files = [("files", (f"file{n}.txt", data)) for n, data in enumerate(contents)]
+    return client.post("/upload_batches", headers=headers, files=files)
+
+
+def test_failed_batch_leaves_nothing_pinned(make_user, monkeypatch):
+    _, headers = make_user()
+    client = TestClient(main.app, raise_server_exceptions=False)
+    save_upload = storage.save_upload
+    saved = []
+
+    async def disk_full_on_second(file, **kwargs):
+        if saved:
+            raise OSError("No space left on device")
+        saved.append(await save_upload(file, **kwargs))
+        return saved[-1]
+
+    # Storing fails partway: the file already stored is released
+    monkeypatch.setattr(storage, "save_upload", disk_full_on_second)
+    assert post_batch(client, headers, b"stored first", b"never stored").status_code == 500
+    assert saved and saved[0][0] not in storage._pinned_blobs
+    monkeypatch.setattr(storage, "save_upload", save_upload)
+
+    # The insert fails: every stored file is released
+    def insert_fails(*args):
+        raise OSError("database is gone")
+
+    monkeypatch.setattr(main, "_create_uploaded_documents", insert_fails)
+    assert post_batch(client, headers, b"batch one", b"batch two").status_code == 500
+    assert not storage._pinned_blobs
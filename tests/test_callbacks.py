@@ -0,0 +1,42 @@
+import json
+
+from backend import models
+
+
+def test_partial_batch_applies_the_valid_results(client, db, make_user, make_document):
+    user_id, _ = make_user()
+    first = make_document(user_id, html="", status="Processing")
+    second = make_document(user_id, html="", status="Processing")
+    items = [
+        {"doc_id": first, "raw_text": "older result"},
+        {"doc_id": second, "raw_text": "second", "corrected_html": "<p>second</p>"},
+        {"doc_id": 999999, "raw_text": "no such document"},
+        {"doc_id": second}, # raw_text missing
+        {"doc_id": first, "raw_text": "first <b>"},
+    ]
+    r = client.post("/n8n/callback/batch", json=items)
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert (body["applied"], body["failed"]) == (2, 3)
+    errors = {result["index"]: result.get("error") for result in body["results"]}
+    assert errors[0] == "Superseded by a later result for the same document"
+    assert errors[2] == "Document not found"
+    assert "raw_text" in errors[3]
+    assert errors[1] is None and errors[4] is None
+
+    db.expire_all()
+    doc = db.get(models.Document, first)
+    assert (doc.status, doc.raw_text, doc.corrected_html) == ("Ready", "first <b>", "<div>first &lt;b&gt;</div>")
+    assert db.get(models.Document, second).corrected_html == "<p>second</p>"
+
+
+def test_ndjson_batch_reports_bad_lines(client, db, make_user, make_document):
+    user_id, _ = make_user()
+    doc_id = make_document(user_id, html="", status="Processing")
+    body = json.dumps({"doc_id": doc_id, "raw_text": "text"}) + "\n{not json\n\n"
+    r = client.post("/n8n/callback/batch", content=body, headers={"Content-Type": "application/x-ndjson"})
+    assert r.status_code == 200, r.text
+    assert r.json()["applied"] == 1
+    assert r.json()["results"][1]["error"] == "Invalid JSON"
+    db.expire_all()
+    assert db.get(models.Document, doc_id).status == "Ready"
@@ -0,0 +1,88 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+from backend import compression, migrations, models
+
+LONG = "<p>Quarterly report – naïve café ☕</p>\n" * 200
+SHORT = "<p>short</p>"
+
+
+@pytest.mark.parametrize("value", ["", SHORT, LONG])
+def test_compress_round_trip(value):
+    stored = compression.compress_text(value)
+    assert compression.is_compressed(stored)
+    assert compression.decompress_text(stored) == value
+
+
+def test_long_values_are_compressed():
+    assert compression.compress_text(LONG)[:1] == compression.ZLIB
+    assert len(compression.compress_text(LONG)) < len(LONG.encode("utf-8")) // 10
+    assert compression.compress_text(SHORT)[:1] == compression.RAW
+
+
+def test_legacy_values_read_back():
+    # A text column, or its UTF-8 bytes after the migration changed the column type
+    assert compression.decompress_text(LONG) == LONG
+    assert compression.decompress_text(LONG.encode("utf-8")) == LONG
+
+
+def test_zstd_round_trip(monkeypatch):
+    if compression.zstandard is None:
+        pytest.skip("zstandard is not installed")
+    monkeypatch.setattr(compression, "TEXT_COMPRESSION", "zstd")
+    stored = compression.compress_text(LONG)
+    assert stored[:1] == compression.ZSTD
+    assert compression.decompress_text(stored) == LONG
+
+
+@pytest.fixture
+def legacy_engine(tmp_path):
+    """A database from before the text columns were compressed: plain VARCHAR(5000) columns."""
+    engine = create_engine(f"sqlite:///{tmp_path}/legacy.db")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE documents (id INTEGER PRIMARY KEY, user_id INTEGER, upload_date VARCHAR(50), original_path VARCHAR(255),"
+            " raw_text VARCHAR(5000), corrected_html VARCHAR(5000), status VARCHAR(20))"
+        ))
+        conn.execute(text(
+            "CREATE TABLE document_versions (id INTEGER PRIMARY KEY, document_id INTEGER, version_number INTEGER,"
+            " corrected_html VARCHAR(5000), timestamp VARCHAR(50))"
+        ))
+        conn.execute(text("INSERT INTO documents VALUES (1, 1, 'x', 'uploads/a.pdf', :long, :short, 'Ready')"), {"long": LONG, "short": SHORT})
+        conn.execute(text("INSERT INTO documents VALUES (2, 1, 'x', 'uploads/b.pdf', NULL, NULL, 'Processing')"))
+        conn.execute(text("INSERT INTO document_versions VALUES (1, 1, 1, :long, 'x')"), {"long": LONG})
+    yield engine
+    engine.dispose()
+
+
+def stored_values(engine):
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT raw_text, corrected_html FROM documents ORDER BY id")).all()
+
+
+def test_migration_compresses_existing_rows(legacy_engine):
+    models.Base.metadata.create_all(bind=legacy_engine)
+    migrations.upgrade(legacy_engine)
+
+    [(raw_text, corrected_html), empty] = stored_values(legacy_engine)
+    assert bytes(raw_text)[:1] == compression.ZLIB
+    assert len(raw_text) < len(LONG.encode("utf-8")) // 10
+    assert bytes(corrected_html)[:1] == compression.RAW
+    assert tuple(empty) == (None, None)
+
+    with Session(legacy_engine) as db:
+        doc = db.get(models.Document, 1)
+        assert (doc.raw_text, doc.corrected_html) == (LONG, SHORT)
+        assert db.get(models.Document, 2).raw_text is None
+        assert db.query(models.DocumentVersion.corrected_html).scalar() == LONG
+
+
+def test_migration_leaves_compressed_rows_alone(legacy_engine):
+    models.Base.metadata.create_all(bind=legacy_engine)
+    migrations.upgrade(legacy_engine)
+    before = stored_values(legacy_engine)
+    # Run the step again, as after an interrupted upgrade
+    with legacy_engine.begin() as conn:
+        migrations.compress_text_columns(conn)
+    assert stored_values(legacy_engine) == before
@@ -0,0 +1,158 @@
+import threading
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from backend import dispatch, extractors, models, tasks
+from backend.tasks import DispatchError
+
+
+@pytest.fixture
+def job(db, make_user, make_document, monkeypatch):
+    """One due job for a Processing document, and no other due jobs."""
+    db.query(models.DispatchJob).filter(models.DispatchJob.status.in_(dispatch.ACTIVE_STATUSES)).update({"status": "done"})
+    db.commit()
+    user_id, _ = make_user()
+    doc_id = make_document(user_id, status="Processing")
+    job = dispatch.enqueue(db, doc_id)
+    db.commit()
+    monkeypatch.setattr(dispatch, "DISPATCH_MAX_ATTEMPTS", 2)
+    return job
+
+
+def run_attempt(db, job):
+    assert dispatch.dispatcher._process_one()
+    db.expire_all()
+    # Due again at once, so the next attempt doesn't wait for the backoff
+    if job.status == "pending":
+        job.next_attempt_at = 0
+        db.commit()
+
+
+def doc_status(db, job):
+    return db.query(models.Document.status).filter(models.Document.id == job.document_id).scalar()
+
+
+def raise_error(error):
+    def task(doc_id, *args, **kwargs):
+        raise error
+    return task
+
+
+def test_sent_job_is_done(db, job, monkeypatch):
+    monkeypatch.setattr(dispatch, "extract_document_task", lambda doc_id: False)
+    monkeypatch.setattr(dispatch, "process_document_task", lambda doc_id, final_attempt: "Sent")
+    run_attempt(db, job)
+    assert (job.status, job.attempts, job.last_error) == ("done", 1, None)
+
+
+def test_dispatch_error_is_retried_then_failed(db, job, monkeypatch):
+    calls = []
+
+    def process(doc_id, final_attempt):
+        calls.append(final_attempt)
+        raise DispatchError("N8N Connection Failed", "refused")
+
+    monkeypatch.setattr(dispatch, "extract_document_task", lambda doc_id: False)
+    monkeypatch.setattr(dispatch, "process_document_task", process)
+    run_attempt(db, job)
+    assert (job.status, job.attempts) == ("pending", 1)
+    assert job.last_error == "N8N Connection Failed: refused"
+    run_attempt(db, job)
+    assert (job.status, job.attempts) == ("failed", 2)
+    assert calls == [False, True]
+    assert not dispatch.dispatcher._process_one()
+
+
+@pytest.mark.parametrize("error", [
+    OperationalError("UPDATE documents", {}, Exception("database is locked")),
+    RuntimeError("extractor crashed"),
+])
+def test_unexpected_error_counts_as_attempt(db, job, monkeypatch, error):
+    monkeypatch.setattr(dispatch, "extract_document_task", raise_error(error))
+    run_attempt(db, job)
+    assert (job.status, job.attempts) == ("pending", 1)
+    assert job.last_error.startswith(type(error).__name__)
+    assert job.next_attempt_at is not None
+
+    run_attempt(db, job)
+    assert (job.status, job.attempts) == ("failed", 2)
+    # Not left Processing, where recover() would queue it again
+    assert doc_status(db, job) == "Error"
+    dispatch.recover()
+    assert db.query(models.DispatchJob).filter(
+        models.DispatchJob.document_id == job.document_id, models.DispatchJob.status.in_(dispatch.ACTIVE_STATUSES)
+    ).count() == 0
+
+
+def test_backoff_grows_and_is_capped(monkeypatch):
+    monkeypatch.setattr(dispatch, "DISPATCH_BACKOFF_SECONDS", 2)
+    monkeypatch.setattr(dispatch, "DISPATCH_BACKOFF_MAX_SECONDS", 10)
+    assert [dispatch.backoff_delay(n) for n in range(1, 6)] == [2, 4, 8, 10, 10]
+
+
+def active_jobs(db, doc_id):
+    return db.query(models.DispatchJob).filter(
+        models.DispatchJob.document_id == doc_id, models.DispatchJob.status.in_(dispatch.ACTIVE_STATUSES)
+    ).count()
+
+
+def test_enqueue_and_recover_queue_a_document_once(db, job):
+    assert dispatch.enqueue(db, job.document_id).id == job.id
+    db.commit()
+    dispatch.recover()
+    dispatch.recover()
+    assert active_jobs(db, job.document_id) == 1
+
+
+def test_only_one_worker_sweeps(monkeypatch):
+    monkeypatch.setattr(dispatch, "DISPATCH_SWEEP_SECONDS", 60)
+    dispatcher = dispatch.Dispatcher(4)
+    due = []
+    threads = [threading.Thread(target=lambda: due.append(dispatcher._sweep_due())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(due) == [False] * 7 + [True]
+
+
+def test_sent_status_does_not_overwrite_callback(db, job, monkeypatch):
+    class Response:
+        status_code = 200
+        text = "ok"
+
+    def post(*args, **kwargs):
+        # The callback lands while the webhook call is still open
+        db.query(models.Document).filter(models.Document.id == job.document_id).update({"status": "Ready", "revision": 5})
+        db.commit()
+        return Response()
+
+    monkeypatch.setattr(tasks.http, "post", post)
+    assert tasks.process_document_task(job.document_id) == "Sent"
+    db.expire_all()
+    doc = db.get(models.Document, job.document_id)
+    assert (doc.status, doc.revision) == ("Ready", 5)
+
+
+def test_local_extraction(client, db, make_user, monkeypatch):
+    monkeypatch.setattr(extractors, "EXTRACTOR_BACKEND", "local")
+    _, headers = make_user()
+
+    def upload(filename, data):
+        r = client.post("/upload_and_convert", headers=headers, files={"file": (filename, data)})
+        return r.json()["document_id"]
+
+    text_doc = upload("notes.txt", b"first line\n\nsecond <line>")
+    assert tasks.extract_document_task(text_doc)
+    db.expire_all()
+    doc = db.get(models.Document, text_doc)
+    assert doc.status == "Ready"
+    assert "second &lt;line&gt;" in doc.corrected_html
+    assert (doc.revision, doc.content_revision) == (2, 2)
+
+    # No local extractor for images: they still go to N8N
+    scan = upload("scan.png", b"\x89PNG not really")
+    assert not tasks.extract_document_task(scan)
+    db.expire_all()
+    assert db.get(models.Document, scan).status == "Processing"
@@ -0,0 +1,44 @@
+def test_cursor_pages_through_equal_upload_dates(client, make_user, make_document):
+    user_id, headers = make_user()
+    # make_document gives every document the same upload_date
+    docs = [make_document(user_id) for _ in range(7)]
+
+    seen, cursor = [], None
+    while True:
+        params = {"summary": "true", "limit": 3}
+        if cursor is not None:
+            params["cursor"] = cursor
+        r = client.get("/documents", params=params, headers=headers)
+        assert r.status_code == 200, r.text
+        seen += [doc["id"] for doc in r.json()]
+        cursor = r.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert seen == docs
+
+
+def test_unchanged_document_answers_304(client, make_user, make_document):
+    user_id, headers = make_user()
+    doc_id = make_document(user_id)
+    r = client.get(f"/documents/{doc_id}", headers=headers)
+    assert r.status_code == 200
+    etag = r.headers["ETag"]
+
+    r = client.get(f"/documents/{doc_id}", headers={**headers, "If-None-Match": etag})
+    assert r.status_code == 304
+    assert r.headers["ETag"] == etag
+    assert not r.content
+
+    # Tagging changes the response, so the old ETag no longer matches
+    assert client.post(f"/documents/{doc_id}/tags/urgent", headers=headers).status_code == 200
+    r = client.get(f"/documents/{doc_id}", headers={**headers, "If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.headers["ETag"] != etag
+
+
+def test_other_users_etag_reveals_nothing(client, make_user, make_document):
+    owner, owner_headers = make_user()
+    _, other_headers = make_user()
+    doc_id = make_document(owner)
+    etag = client.get(f"/documents/{doc_id}", headers=owner_headers).headers["ETag"]
+    assert client.get(f"/documents/{doc_id}", headers={**other_headers, "If-None-Match": etag}).status_code == 404
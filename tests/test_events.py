@@ -0,0 +1,47 @@
+import asyncio
+import json
+import sys
+import threading
+import types
+
+from backend import events
+
+
+class FakeRedis:
+    """Drops the first connection, then delivers one event and stays quiet."""
+
+    def __init__(self):
+        self.connections = 0
+        self.quiet = threading.Event()
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return self
+
+    def subscribe(self, channel):
+        self.connections += 1
+
+    def listen(self):
+        if self.connections == 1:
+            raise ConnectionError("Connection reset by peer")
+        yield {"data": json.dumps({"user_id": 1, "event": {"doc_id": 5, "status": "Ready"}})}
+        self.quiet.wait()
+
+    def close(self):
+        pass
+
+
+def test_listener_reconnects_after_a_dropped_connection(monkeypatch):
+    server = FakeRedis()
+    monkeypatch.setitem(sys.modules, "redis", types.SimpleNamespace(Redis=types.SimpleNamespace(from_url=lambda url: server)))
+    monkeypatch.setattr(events, "EVENT_BROKER_RETRY_SECONDS", 0.01)
+    broker = events.RedisBroker("redis://test", "status")
+
+    async def receive():
+        sub = broker.subscribe(1)
+        return await asyncio.wait_for(sub.queue.get(), 5)
+
+    try:
+        assert asyncio.run(receive()) == {"doc_id": 5, "status": "Ready"}
+        assert server.connections == 2
+    finally:
+        server.quiet.set()
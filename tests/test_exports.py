@@ -0,0 +1,50 @@
+import time
+
+import pytest
+
+from backend import exports
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = exports.ExportCache(str(tmp_path / "exports"), 1024 * 1024)
+    monkeypatch.setattr(exports, "cache", cache)
+    return cache
+
+
+def wait_done(client, headers, job_id):
+    for _ in range(200):
+        job = client.get(f"/export/jobs/{job_id}", headers=headers).json()
+        if job["status"] != "queued":
+            return job
+        time.sleep(0.05)
+    raise AssertionError("export did not finish")
+
+
+def test_second_export_is_served_from_cache(client, cache, make_user, make_document):
+    user_id, headers = make_user()
+    doc_id = make_document(user_id, html="<h1>Title</h1><p>body</p>")
+
+    first = client.post(f"/export/{doc_id}/docx/jobs", headers=headers).json()
+    assert wait_done(client, headers, first["job_id"])["status"] == "done"
+    rendered = client.get(f"/export/jobs/{first['job_id']}/result", headers=headers).content
+
+    second = client.post(f"/export/{doc_id}/docx/jobs", headers=headers).json()
+    assert second["status"] == "done"
+    job = exports.jobs.get(second["job_id"], user_id)
+    # Points at the cache entry rather than holding another copy
+    assert job.result is None
+    assert client.get(f"/export/jobs/{second['job_id']}/result", headers=headers).content == rendered
+
+    cache.invalidate(doc_id)
+    assert client.get(f"/export/jobs/{second['job_id']}/result", headers=headers).status_code == 410
+
+
+def test_cache_hits_count_against_the_job_limit(cache):
+    manager = exports.ExportJobManager(max_jobs_per_user=1, ttl_seconds=60)
+    cache.put(7, exports.content_hash("<p>x</p>", "T"), "docx", b"data")
+    assert manager.submit(1, 7, "<p>x</p>", "T", "docx").data() == b"data"
+
+    manager._active[1] = 1 # One render still running
+    with pytest.raises(exports.TooManyExportJobs):
+        manager.submit(1, 7, "<p>x</p>", "T", "docx")
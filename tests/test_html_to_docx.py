@@ -0,0 +1,88 @@
+import io
+
+import pytest
+from docx import Document as DocxDocument
+
+from backend import html_to_docx
+
+
+def convert(html, title="Title", chunks=None):
+    out = io.BytesIO()
+    html_to_docx.convert(chunks or [html], title, out)
+    out.seek(0)
+    return DocxDocument(out)
+
+
+def paragraphs(document):
+    return [(p.style.name, p.text) for p in document.paragraphs]
+
+
+def test_headings_paragraphs_and_title():
+    document = convert("<h1>Heading</h1><p>First   paragraph\n text</p><h3>Sub</h3><div>Block</div>", title="My doc")
+    assert paragraphs(document) == [
+        ("Title", "My doc"),
+        ("Heading 1", "Heading"),
+        ("Normal", "First paragraph text"),
+        ("Heading 3", "Sub"),
+        ("Normal", "Block"),
+    ]
+
+
+def test_inline_formatting_runs():
+    [_, paragraph] = convert("<p>plain <b>bold <i>both</i></b> <u>under</u></p>").paragraphs
+    runs = [(run.text, bool(run.bold), bool(run.italic), bool(run.underline)) for run in paragraph.runs]
+    assert runs == [
+        ("plain ", False, False, False),
+        ("bold ", True, False, False),
+        ("both", True, True, False),
+        (" ", False, False, False),
+        ("under", False, False, True),
+    ]
+
+
+def test_line_breaks_and_pre():
+    [_, br, pre] = convert("<p>one<br>two</p><pre>a\n  b</pre>").paragraphs
+    assert br.text == "one\ntwo"
+    assert pre.text == "a\n  b"
+
+
+def test_lists_nesting_and_quill_indent():
+    html = (
+        "<ul><li>a<ul><li>nested</li></ul></li><li>b</li></ul>"
+        '<ol><li>one</li><li class="ql-indent-1">indented</li><li class="ql-indent-5">deep</li></ol>'
+    )
+    assert paragraphs(convert(html))[1:] == [
+        ("List Bullet", "a"),
+        ("List Bullet 2", "nested"),
+        ("List Bullet", "b"),
+        ("List Number", "one"),
+        ("List Number 2", "indented"),
+        ("List Number 3", "deep"),
+    ]
+
+
+def test_table():
+    document = convert("<table><tr><th>Name</th><th>Qty</th></tr><tr><td>apple</td></tr></table><p>after</p>")
+    [table] = document.tables
+    assert [[cell.text for cell in row.cells] for row in table.rows] == [["Name", "Qty"], ["apple", ""]]
+    assert table.rows[0].cells[0].paragraphs[0].runs[0].bold
+    assert paragraphs(document)[-1] == ("Normal", "after")
+
+
+def test_text_is_escaped_and_cleaned():
+    document = convert("<p>a &lt;b&gt; &amp; \"c\" \x01d</p><script>alert(1)</script>", title="<T & T>")
+    assert paragraphs(document) == [("Title", "<T & T>"), ("Normal", 'a <b> & "c" d')]
+
+
+@pytest.mark.parametrize("size", [1, 7, 100])
+def test_chunked_input_matches_whole(size):
+    html = "<h2>Report</h2>" + "".join(f"<p>row <b>{n}</b> &amp; more</p><ul><li>item {n}</li></ul>" for n in range(50))
+    chunks = [html[start:start + size] for start in range(0, len(html), size)]
+    assert paragraphs(convert(html, chunks=chunks)) == paragraphs(convert(html))
+
+
+def test_large_document_flushes_in_pieces():
+    html = "".join(f"<p>paragraph {n}</p>" for n in range(5000))
+    document = convert(html)
+    assert len(document.paragraphs) == 5001
+    assert document.paragraphs[-1].text == "paragraph 4999"
@@ -0,0 +1,26 @@
+import pytest
+
+from backend import metrics
+
+
+@pytest.fixture
+def token(monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_TOKEN", "secret")
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", True)
+    return "secret"
+
+
+def test_metrics_are_not_served_without_a_token(client, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_TOKEN", "")
+    assert not metrics.METRICS_ENABLED # Off at startup: the tests set no METRICS_TOKEN
+    for headers in ({}, {"Authorization": "Bearer "}, {"Authorization": "Bearer anything"}):
+        assert client.get("/metrics", headers=headers).status_code == 404
+    assert client.get("/metrics/profile", params={"seconds": 0}).status_code == 404
+
+
+def test_metrics_need_the_token(client, token):
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    r = client.get("/metrics", headers={"Authorization": f"Bearer {token}"})
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain")
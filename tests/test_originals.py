@@ -0,0 +1,79 @@
+import io
+import os
+import time
+
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from backend import main, originals
+
+
+def upload(client, headers, filename, data):
+    r = client.post("/upload_and_convert", headers=headers, files={"file": (filename, data)})
+    assert r.status_code == 202, r.text
+    return r.json()["document_id"]
+
+
+def png(color):
+    out = io.BytesIO()
+    Image.new("RGB", (400, 300), color).save(out, "PNG")
+    return out.getvalue()
+
+
+def no_thumbnail_markers():
+    return [name for name in os.listdir(originals.THUMBNAIL_DIR) if name.endswith(".none")] if os.path.isdir(originals.THUMBNAIL_DIR) else []
+
+
+def test_undecodable_image_is_remembered(client, make_user):
+    _, headers = make_user()
+    doc_id = upload(client, headers, "broken.png", b"not an image at all")
+    before = no_thumbnail_markers()
+    r = client.get(f"/documents/{doc_id}/thumbnail", headers=headers)
+    assert r.status_code == 404
+    assert "max-age" in r.headers["Cache-Control"]
+    assert len(no_thumbnail_markers()) == len(before) + 1
+
+
+def test_transient_failure_is_not_cached(make_user, monkeypatch):
+    _, headers = make_user()
+    client = TestClient(main.app, raise_server_exceptions=False)
+    doc_id = upload(client, headers, "scan.png", png("red"))
+    before = no_thumbnail_markers()
+    render = originals.render_thumbnail
+
+    def disk_full(*args):
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(originals, "render_thumbnail", disk_full)
+    assert client.get(f"/documents/{doc_id}/thumbnail", headers=headers).status_code == 500
+    assert no_thumbnail_markers() == before
+
+    monkeypatch.setattr(originals, "render_thumbnail", render)
+    r = client.get(f"/documents/{doc_id}/thumbnail", headers=headers)
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "image/jpeg"
+
+
+def test_file_keys_are_scoped_and_expire(client, make_user):
+    _, headers = make_user()
+    _, other_headers = make_user()
+    doc_id = upload(client, headers, "a.txt", b"first file")
+    other_doc = upload(client, headers, "b.txt", b"second file")
+    someone_elses = upload(client, other_headers, "c.txt", b"third file")
+
+    def fetch(doc, key):
+        return client.get(f"/documents/{doc}/original", params={"key": key}).status_code
+
+    # N8N's key opens its one document only
+    document_key = originals.document_file_key(doc_id)
+    assert fetch(doc_id, document_key) == 200
+    assert fetch(other_doc, document_key) == 404
+    # The dashboard's key opens all of its user's documents, and nobody else's
+    user_key = client.get("/documents/file_key", headers=headers).json()["key"]
+    assert fetch(other_doc, user_key) == 200
+    assert fetch(someone_elses, user_key) == 404
+
+    expired, _ = originals.file_key(f"d{doc_id}", now=time.time() - 3 * originals.FILE_KEY_TTL_SECONDS)
+    assert fetch(doc_id, expired) == 403
+    scope, expires, signature = document_key.split(".")
+    assert fetch(other_doc, f"d{other_doc}.{expires}.{signature}") == 403
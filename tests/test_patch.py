@@ -0,0 +1,142 @@
+from backend import database, models, pages
+
+
+def get_document(client, headers, doc_id):
+    r = client.get(f"/documents/{doc_id}", headers=headers)
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def patch(client, headers, doc_id, base_revision, ops):
+    return client.patch(f"/documents/{doc_id}", headers=headers, json={"base_revision": base_revision, "ops": ops})
+
+
+def test_patch_applies_ops(client, make_user, make_document):
+    user_id, headers = make_user()
+    doc_id = make_document(user_id, html="<p>hello world</p>")
+    doc = get_document(client, headers, doc_id)
+
+    r = patch(client, headers, doc_id, doc["content_revision"], [{"retain": 9}, {"insert": "big "}])
+    assert r.status_code == 200, r.text
+    result = r.json()
+    assert result["changed"]
+    assert result["content_revision"] == doc["content_revision"] + 1
+    assert result["revision"] == doc["revision"] + 1
+    assert get_document(client, headers, doc_id)["corrected_html"] == "<p>hello big world</p>"
+
+
+def test_stale_patch_is_rejected(client, make_user, make_document):
+    user_id, headers = make_user()
+    doc_id = make_document(user_id, html="<p>hello world</p>")
+    base = get_document(client, headers, doc_id)["content_revision"]
+    assert patch(client, headers, doc_id, base, [{"insert": "A "}]).status_code == 200
+
+    # A second tab still editing on top of the old content
+    r = patch(client, headers, doc_id, base, [{"insert": "B "}])
+    assert r.status_code == 409
+    assert r.headers["X-Document-Revision"] == str(base + 1)
+    assert get_document(client, headers, doc_id)["corrected_html"] == "A <p>hello world</p>"
+
+
+def test_tagging_does_not_conflict_with_patch(client, make_user, make_document):
+    user_id, headers = make_user()
+    doc_id = make_document(user_id, html="<p>hello world</p>")
+    before = get_document(client, headers, doc_id)
+
+    assert client.post(f"/documents/{doc_id}/tags/urgent", headers=headers).status_code == 200
+    tagged = get_document(client, headers, doc_id)
+    # The ETag revision moves, the content revision doesn't
+    assert tagged["revision"] > before["revision"]
+    assert tagged["content_revision"] == before["content_revision"]
+
+    r = patch(client, headers, doc_id, before["content_revision"], [{"insert": "A "}])
+    assert r.status_code == 200, r.text
+    assert r.json()["revision"] == tagged["revision"] + 1
+
+
+def test_page_save_after_tagging(client, db, make_user, make_document):
+    user_id, headers = make_user()
+    doc_id = make_document(user_id, html="<p>hello world</p>")
+    page = client.get(f"/documents/{doc_id}/pages", headers=headers).json()["pages"][0]
+    assert client.post(f"/documents/{doc_id}/tags/urgent", headers=headers).status_code == 200
+
+    update = {"pages": [{"number": 1, "base_revision": page["revision"], "html": "<p>edited</p>"}]}
+    r = client.put(f"/documents/{doc_id}/pages", headers=headers, json=update)
+    assert r.status_code == 200, r.text
+    assert r.json()["pages"] == [{"number": 1, "revision": r.json()["content_revision"]}]
+    # The same base again is stale now
+    assert client.put(f"/documents/{doc_id}/pages", headers=headers, json=update).status_code == 409
+    assert db.get(models.Document, doc_id).corrected_html == "<p>edited</p>"
+
+
+def test_page_save_during_concurrent_first_split(client, db, make_user, make_document, monkeypatch):
+    user_id, headers = make_user()
+    doc_id = make_document(user_id, html="<p>hello world</p>")
+    split_pages = pages.split_pages
+
+    def split_elsewhere_first(session, doc):
+        # Another request commits the same split just before this one writes its pages
+        monkeypatch.setattr(pages, "split_pages", split_pages)
+
+        def flush(*args, **kwargs):
+            del session.flush
+            with database.SessionLocal() as other:
+                split_pages(other, other.get(models.Document, doc_id))
+                other.commit()
+            return session.flush(*args, **kwargs)
+
+        session.flush = flush
+        return split_pages(session, doc)
+
+    monkeypatch.setattr(pages, "split_pages", split_elsewhere_first)
+    update = {"pages": [{"number": 1, "base_revision": 1, "html": "<p>edited</p>"}]}
+    r = client.put(f"/documents/{doc_id}/pages", headers=headers, json=update)
+    assert r.status_code == 200, r.text
+    assert r.json()["changed"]
+    db.expire_all()
+    assert db.get(models.Document, doc_id).corrected_html == "<p>edited</p>"
+    assert db.query(models.DocumentPage).filter(models.DocumentPage.document_id == doc_id).count() == 1
+
+
+def test_put_checks_base_revision(client, make_user, make_document):
+    user_id, headers = make_user()
+    doc_id = make_document(user_id, html="<p>hello world</p>")
+    base = get_document(client, headers, doc_id)["content_revision"]
+
+    r = client.put(f"/documents/{doc_id}", headers=headers, json={"corrected_html": "<p>A</p>", "base_revision": base})
+    assert r.status_code == 200, r.text
+    assert r.json()["content_revision"] == base + 1
+    r = client.put(f"/documents/{doc_id}", headers=headers, json={"corrected_html": "<p>B</p>", "base_revision": base})
+    assert r.status_code == 409
+    assert r.headers["X-Document-Revision"] == str(base + 1)
+    # Without a base the save still goes through, as before
+    assert client.put(f"/documents/{doc_id}", headers=headers, json={"corrected_html": "<p>C</p>"}).status_code == 200
+
+
+def test_put_racing_another_save(client, db, make_user, make_document, monkeypatch):
+    user_id, headers = make_user()
+    doc_id = make_document(user_id, html="<p>hello world</p>")
+    before = get_document(client, headers, doc_id)
+    touch = models.Document.touch
+
+    def save_elsewhere_first(doc, content=False):
+        # A callback lands after this request read the row, before it writes
+        monkeypatch.setattr(models.Document, "touch", touch)
+        with database.SessionLocal() as other:
+            other.get(models.Document, doc_id).touch(content=True)
+            other.commit()
+        touch(doc, content)
+
+    monkeypatch.setattr(models.Document, "touch", save_elsewhere_first)
+    update = {"corrected_html": "<p>mine</p>", "base_revision": before["content_revision"]}
+    r = client.put(f"/documents/{doc_id}", headers=headers, json=update)
+    assert r.status_code == 409
+    doc = get_document(client, headers, doc_id)
+    assert doc["corrected_html"] == "<p>hello world</p>"
+    assert (doc["revision"], doc["content_revision"]) == (before["revision"] + 1, before["content_revision"] + 1)
+
+    # Without a base, both writes count: neither revision is lost
+    monkeypatch.setattr(models.Document, "touch", save_elsewhere_first)
+    r = client.put(f"/documents/{doc_id}", headers=headers, json={"corrected_html": "<p>mine</p>"})
+    assert r.status_code == 200, r.text
+    assert r.json()["revision"] == before["revision"] + 3
@@ -0,0 +1,49 @@
+import pytest
+
+from backend import models, search
+
+
+@pytest.fixture
+def fts5():
+    if search.get_backend().name != "fts5":
+        pytest.skip("snippets come from the FTS5 backend")
+
+
+def index_text(db, doc_id, raw_text):
+    doc = db.get(models.Document, doc_id)
+    doc.raw_text = raw_text
+    search.index_document(db, doc)
+    db.commit()
+
+
+def test_snippet_escapes_document_text(client, db, make_user, make_document, fts5):
+    user_id, headers = make_user()
+    doc_id = make_document(user_id)
+    index_text(db, doc_id, "<img src=x onerror=alert(1)> invoice & \x02receipt\x03")
+
+    r = client.get("/documents/search", params={"q": "invoice"}, headers=headers)
+    assert r.status_code == 200, r.text
+    [result] = r.json()
+    assert result["id"] == doc_id
+    assert result["snippet"] == "&lt;img src=x onerror=alert(1)&gt; <mark>invoice</mark> &amp; receipt"
+
+
+def test_highlight():
+    assert search.highlight(None) is None
+    assert search.highlight("a \x02<b>\x03 c") == "a <mark>&lt;b&gt;</mark> c"
+
+
+def test_empty_index_is_filled_on_start(client, db, make_user, make_document):
+    user_id, headers = make_user()
+    doc_id = make_document(user_id)
+    db.get(models.Document, doc_id).raw_text = "quarterly ledger"
+    db.commit()
+    # As in a database from before search: documents, but nothing indexed
+    search.get_backend().clear(db)
+    db.commit()
+
+    assert search.ensure_index() == db.query(models.Document).count()
+    r = client.get("/documents/search", params={"q": "ledger"}, headers=headers)
+    assert [result["id"] for result in r.json()] == [doc_id]
+    # Only while the index is empty
+    assert search.ensure_index() == 0
@@ -0,0 +1,115 @@
+import sqlite3
+
+from sqlalchemy import create_engine, insert, text
+
+from backend import migrations, models
+from backend import tags as tagging
+
+
+def tag_counts(client, headers):
+    r = client.get("/tags", headers=headers)
+    assert r.status_code == 200, r.text
+    return {tag["name"]: tag["document_count"] for tag in r.json()}
+
+
+def listed(client, headers, **params):
+    r = client.get("/documents", params={"summary": "true", **params}, headers=headers)
+    assert r.status_code == 200, r.text
+    return [doc["id"] for doc in r.json()]
+
+
+def bulk(client, headers, path, document_ids, names):
+    r = client.post(path, headers=headers, json={"document_ids": document_ids, "tags": names})
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def test_same_name_is_a_separate_tag_per_user(client, make_user, make_document):
+    alice, alice_headers = make_user()
+    bob, bob_headers = make_user()
+    alice_doc = make_document(alice)
+    bob_doc = make_document(bob)
+
+    alice_tag = client.post(f"/documents/{alice_doc}/tags/urgent", headers=alice_headers).json()["tags"][0]
+    bob_tag = client.post(f"/documents/{bob_doc}/tags/urgent", headers=bob_headers).json()["tags"][0]
+    assert alice_tag["id"] != bob_tag["id"]
+    assert tag_counts(client, alice_headers) == {"urgent": 1}
+    assert tag_counts(client, bob_headers) == {"urgent": 1}
+
+    assert listed(client, alice_headers, tags="urgent") == [alice_doc]
+    assert listed(client, bob_headers, tags="urgent") == [bob_doc]
+
+
+def test_other_users_documents_and_tags_are_untouched(client, make_user, make_document):
+    alice, alice_headers = make_user()
+    bob, bob_headers = make_user()
+    alice_doc = make_document(alice)
+    bob_doc = make_document(bob)
+    alice_tag = client.post(f"/documents/{alice_doc}/tags/private", headers=alice_headers).json()["tags"][0]
+
+    # Alice's document ids are ignored in Bob's bulk requests
+    result = bulk(client, bob_headers, "/tags/bulk", [alice_doc, bob_doc], ["mine"])
+    assert (result["pairs"], result["documents"]) == (1, 1)
+    assert bulk(client, bob_headers, "/tags/bulk/remove", [alice_doc], ["private"])["pairs"] == 0
+    # Alice's tag id means nothing on Bob's document, and her document is not his
+    assert client.delete(f"/documents/{bob_doc}/tags/{alice_tag['id']}", headers=bob_headers).json()["tags"][0]["name"] == "mine"
+    assert client.delete(f"/documents/{alice_doc}/tags/{alice_tag['id']}", headers=bob_headers).status_code == 404
+
+    assert tag_counts(client, alice_headers) == {"private": 1}
+    assert tag_counts(client, bob_headers) == {"mine": 1}
+
+
+def test_bulk_tagging_and_filters(client, make_user, make_document):
+    user_id, headers = make_user()
+    docs = [make_document(user_id) for _ in range(4)]
+
+    result = bulk(client, headers, "/tags/bulk", docs[:3], ["a", "b"])
+    assert (result["pairs"], result["documents"]) == (6, 3)
+    assert [tag["name"] for tag in result["tags"]] == ["a", "b"]
+    # Adding the same pairs again adds nothing
+    assert bulk(client, headers, "/tags/bulk", docs[:3], ["a"])["pairs"] == 0
+    assert bulk(client, headers, "/tags/bulk/remove", docs[1:3], ["b"])["pairs"] == 2
+    bulk(client, headers, "/tags/bulk", [docs[3]], ["c"])
+
+    assert listed(client, headers, tags="a,b", match="all") == [docs[0]]
+    assert listed(client, headers, tags="b,c", match="any") == [docs[0], docs[3]]
+    assert listed(client, headers, tags="a", limit=2) == docs[:2]
+    assert listed(client, headers, tags="a", cursor=docs[1]) == [docs[2]]
+    assert listed(client, headers, tags="missing") == []
+    assert tag_counts(client, headers) == {"a": 3, "b": 1, "c": 1}
+
+
+def test_migration_copies_shared_tags_per_user(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/legacy.db")
+    with engine.begin() as conn:
+        # Global tags, as before 0006
+        conn.execute(text("CREATE TABLE tags (id INTEGER PRIMARY KEY, name VARCHAR(50), color VARCHAR(20))"))
+        conn.execute(text("CREATE UNIQUE INDEX ix_tags_name ON tags (name)"))
+        conn.execute(text("CREATE TABLE document_tags (document_id INTEGER, tag_id INTEGER)"))
+        conn.execute(text("CREATE TABLE documents (id INTEGER PRIMARY KEY, user_id INTEGER, upload_date VARCHAR(50), original_path VARCHAR(255), status VARCHAR(20))"))
+        conn.execute(text("INSERT INTO documents (id, user_id) VALUES (1, 1), (2, 2), (3, 2)"))
+        conn.execute(text("INSERT INTO tags VALUES (1, 'shared', 'red'), (2, 'unused', 'blue')"))
+        conn.execute(text("INSERT INTO document_tags VALUES (1, 1), (2, 1), (3, 1), (3, 1), (9, 1)"))
+    models.Base.metadata.create_all(bind=engine)
+    migrations.upgrade(engine)
+
+    with engine.connect() as conn:
+        tags = conn.execute(text("SELECT id, user_id, name, color FROM tags ORDER BY id")).all()
+        pairs = conn.execute(text("SELECT document_id, tag_id FROM document_tags ORDER BY document_id")).all()
+    assert [tuple(tag[1:]) for tag in tags] == [(1, "shared", "red"), (2, "shared", "red")]
+    copy_id = tags[1][0]
+    assert [tuple(pair) for pair in pairs] == [(1, 1), (2, copy_id), (3, copy_id)]
+    engine.dispose()
+
+
+def test_bulk_tagging_stays_under_old_sqlite_parameter_limit(db, make_user):
+    user_id, _ = make_user()
+    db.execute(insert(models.Document), [{"user_id": user_id, "status": "Ready", "revision": 1} for _ in range(1200)])
+    doc_ids = [doc_id for (doc_id,) in db.query(models.Document.id).filter(models.Document.user_id == user_id)]
+    tag_ids = [tag.id for tag in tagging.get_or_create_tags(db, user_id, [f"t{n}" for n in range(tagging.TAG_FILTER_MAX)]).values()]
+    # SQLite before 3.32 allowed at most 999 bound parameters per statement
+    db.connection().connection.driver_connection.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)
+
+    assert tagging.add_tags(db, user_id, doc_ids, tag_ids) == (1200 * len(tag_ids), 1200)
+    assert tagging.remove_tags(db, user_id, doc_ids, tag_ids) == (1200 * len(tag_ids), 1200)
+    db.rollback()
@@ -0,0 +1,41 @@
+import io
+import zipfile
+
+from backend import models
+
+
+def zip_of(entries: dict) -> bytes:
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, "w") as archive:
+        for name, data in entries.items():
+            archive.writestr(name, data)
+    return out.getvalue()
+
+
+def test_batch_with_archives_and_a_reused_extraction(client, db, make_user):
+    _, headers = make_user()
+    r = client.post("/upload_and_convert", headers=headers, files={"file": ("old.txt", b"extracted before")})
+    old_id = r.json()["document_id"]
+    assert client.post("/n8n/callback", json={"doc_id": old_id, "raw_text": "extracted before"}).status_code == 200
+
+    files = [
+        ("files", ("again.txt", b"extracted before")),
+        ("files", ("new.txt", b"brand new")),
+        ("files", ("scans.zip", zip_of({"one.txt": b"one", "dir/two.txt": b"two", "__MACOSX/._one.txt": b"x"}))),
+        ("files", ("broken.zip", b"not a zip")),
+    ]
+    r = client.post("/upload_batches", headers=headers, files=files)
+    assert r.status_code == 202, r.text
+    batch = r.json()
+    assert (batch["accepted"], batch["rejected"]) == (4, 1)
+    by_name = {f["filename"]: f for f in batch["files"]}
+    assert set(by_name) == {"again.txt", "new.txt", "one.txt", "two.txt", "broken.zip"}
+    assert by_name["broken.zip"]["error"] == "Not a valid zip archive"
+    # The same file was extracted before: its text is reused, nothing goes to N8N
+    assert by_name["again.txt"]["status"] == "Ready"
+    assert db.get(models.Document, by_name["again.txt"]["document_id"]).raw_text == "extracted before"
+    assert by_name["new.txt"]["status"] == "Processing"
+
+    progress = client.get(f"/upload_batches/{batch['batch_id']}", headers=headers).json()
+    assert (progress["total"], progress["ready"], progress["processing"], progress["complete"]) == (4, 1, 3, False)
+    assert client.get(f"/upload_batches/{batch['batch_id']}", headers=make_user()[1]).status_code == 404
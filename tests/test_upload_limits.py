@@ -0,0 +1,50 @@
+import os
+
+from fastapi.testclient import TestClient
+
+from backend import main, models, storage
+
+LIMIT = 4096
+
+
+def multipart_chunks(size: int, boundary: str = "limit-test"):
+    yield (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"big.txt\"\r\n"
+           "Content-Type: text/plain\r\n\r\n").encode()
+    for _ in range(size // 1024):
+        yield b"x" * 1024
+    yield f"\r\n--{boundary}--\r\n".encode()
+
+
+def upload(client, headers, size):
+    # A generator body goes out with Transfer-Encoding: chunked and no Content-Length
+    return client.post("/upload_and_convert", headers={**headers, "Content-Type": "multipart/form-data; boundary=limit-test"}, content=multipart_chunks(size))
+
+
+def uploaded_files():
+    return set(os.listdir(storage.UPLOAD_DIR))
+
+
+def test_chunked_body_over_the_limit_is_refused(make_user, db):
+    user_id, headers = make_user()
+    limited = TestClient(storage.UploadSizeLimitMiddleware(main.app, max_body_bytes=LIMIT))
+    before = uploaded_files()
+
+    r = upload(limited, headers, 64 * 1024)
+    assert r.status_code == 413
+    assert r.json() == {"detail": "Upload too large"}
+    assert uploaded_files() == before
+    assert db.query(models.Document).filter(models.Document.user_id == user_id).count() == 0
+
+
+def test_chunked_body_under_the_limit_passes(make_user):
+    _, headers = make_user()
+    limited = TestClient(storage.UploadSizeLimitMiddleware(main.app, max_body_bytes=LIMIT))
+    r = upload(limited, headers, 2048)
+    assert r.status_code == 202, r.text
+
+
+def test_declared_length_over_the_limit_is_refused(make_user):
+    _, headers = make_user()
+    limited = TestClient(storage.UploadSizeLimitMiddleware(main.app, max_body_bytes=LIMIT))
+    r = limited.post("/upload_and_convert", headers=headers, files={"file": ("big.txt", b"x" * (2 * LIMIT))})
+    assert r.status_code == 413
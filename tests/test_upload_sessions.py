@@ -0,0 +1,37 @@
+import hashlib
+
+from backend import storage
+
+
+def test_unknown_session_leaves_no_lock(client, make_user):
+    _, headers = make_user()
+    for n in range(20):
+        assert client.put(f"/upload_sessions/made{n}up?offset=0", headers=headers, content=b"x").status_code == 404
+        assert client.post(f"/upload_sessions/made{n}up/complete", headers=headers).status_code == 404
+    assert not any(upload_id.startswith("made") for upload_id in storage.upload_sessions._locks)
+
+
+def test_other_users_session_is_not_found(client, make_user):
+    _, owner = make_user()
+    _, other = make_user()
+    upload_id = client.post("/upload_sessions", headers=owner, json={"filename": "a.txt", "size": 3}).json()["upload_id"]
+    assert client.put(f"/upload_sessions/{upload_id}?offset=0", headers=other, content=b"abc").status_code == 404
+    assert upload_id not in storage.upload_sessions._locks
+    client.delete(f"/upload_sessions/{upload_id}", headers=owner)
+
+
+def test_completed_session_drops_its_lock(client, make_user):
+    _, headers = make_user()
+    data = b"resumable upload"
+    upload_id = client.post("/upload_sessions", headers=headers, json={"filename": "a.txt", "size": len(data)}).json()["upload_id"]
+    assert client.put(f"/upload_sessions/{upload_id}?offset=0", headers=headers, content=data[:5]).json()["received"] == 5
+    assert client.put(f"/upload_sessions/{upload_id}?offset=0", headers=headers, content=data).status_code == 409
+    assert client.put(f"/upload_sessions/{upload_id}?offset=5", headers=headers, content=data[5:]).json()["received"] == len(data)
+    assert upload_id in storage.upload_sessions._locks
+
+    r = client.post(f"/upload_sessions/{upload_id}/complete", headers=headers)
+    assert r.status_code == 202, r.text
+    assert r.json()["sha256"] == hashlib.sha256(data).hexdigest()
+    assert upload_id not in storage.upload_sessions._locks
+    assert client.put(f"/upload_sessions/{upload_id}?offset=0", headers=headers, content=data).status_code == 404
+    assert upload_id not in storage.upload_sessions._locks
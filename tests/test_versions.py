@@ -0,0 +1,100 @@
+import random
+
+import pytest
+
+from backend import deltas, models, versions
+
+PAIRS = [
+    ("", ""),
+    ("", "<p>new</p>"),
+    ("<p>old</p>", ""),
+    ("<p>hello world</p>", "<p>hello big world</p>"),
+    ("<h1>Title</h1>\n<p>one</p>\n<p>two</p>", "<h1>Title</h1>\n<p>two</p>\n<p>three</p>"),
+    ("<p>café \U0001F600</p><p>end</p>", "<p>café \U0001F601 \U0001F600</p><p>end</p>"),
+    ("a\nb\nc\n", "a\nc\nb\n"),
+]
+
+
+@pytest.mark.parametrize("old, new", PAIRS)
+def test_diff_round_trip(old, new):
+    assert deltas.apply_delta(old, versions.diff(old, new)) == new
+
+
+def test_diff_round_trip_random_edits():
+    rng = random.Random(12)
+    pieces = ["<p>", "</p>", "\n", "word ", "\U0001F600", "<b>x</b>", "tail"]
+    html = "".join(rng.choice(pieces) for _ in range(200))
+    for _ in range(100):
+        edited = list(html)
+        for _ in range(rng.randint(1, 5)):
+            at = rng.randint(0, len(edited))
+            if rng.random() < 0.5 and at < len(edited):
+                del edited[at:at + rng.randint(1, 10)]
+            else:
+                edited[at:at] = rng.choice(pieces)
+        edited = "".join(edited)
+        assert deltas.apply_delta(html, versions.diff(html, edited)) == edited
+        html = edited
+
+
+def test_diff_drops_trailing_retain():
+    assert versions.diff("<p>a</p>\n<p>b</p>", "<p>x</p>\n<p>b</p>") == [{"retain": 3}, {"delete": 5}, {"insert": "x</p>"}]
+
+
+def test_apply_delta_counts_utf16_units():
+    # The emoji is two code units in JavaScript, so the browser retains 2 for it
+    assert deltas.apply_delta("\U0001F600ab", [{"retain": 2}, {"delete": 1}, {"insert": "X"}]) == "\U0001F600Xb"
+
+
+@pytest.mark.parametrize("ops, message", [
+    ([{"retain": 10}], "longer than the document"),
+    ([{"delete": -1}], "non-negative"),
+    ([{"retain": True}], "non-negative"),
+    ([{"insert": 5}], "must be a string"),
+    ([{"retain": 1}, {"insert": "x"}], "surrogate pair"),
+])
+def test_apply_delta_rejects_bad_ops(ops, message):
+    with pytest.raises(deltas.DeltaError, match=message):
+        deltas.apply_delta("\U0001F600", ops)
+
+
+@pytest.fixture
+def history(db, make_user, make_document, monkeypatch):
+    """A document with one version per edit, a keyframe every third version; returns (doc, contents by version)."""
+    monkeypatch.setattr(versions, "VERSION_INTERVAL_SECONDS", 0)
+    monkeypatch.setattr(versions, "VERSION_KEYFRAME_INTERVAL", 3)
+    user_id, _ = make_user()
+    doc = db.get(models.Document, make_document(user_id, html=""))
+    rng = random.Random(3)
+    # Varied text, so a small delta compresses better than the whole document
+    paragraphs = [f"<p>{' '.join(str(rng.random()) for _ in range(8))}</p>\n" for _ in range(40)]
+    contents = {}
+    for n in range(8):
+        paragraphs[rng.randrange(len(paragraphs))] = f"<p>edit {n}</p>\n"
+        doc.corrected_html = "".join(paragraphs)
+        version = versions.record(db, doc)
+        db.flush()
+        contents[version.version_number] = doc.corrected_html
+    db.commit()
+    return doc, contents
+
+
+def test_versions_rebuild_through_deltas(db, history):
+    doc, contents = history
+    kinds = [v.kind for v in sorted(versions.list_versions(db, doc.id), key=lambda v: v.version_number)]
+    assert "delta" in kinds and kinds.count("full") >= 3
+    for number, html in contents.items():
+        assert versions.content_at(db, doc.id, number) == html
+    with pytest.raises(versions.VersionNotFound):
+        versions.content_at(db, doc.id, max(contents) + 1)
+
+
+def test_compaction_keeps_contents(db, history, monkeypatch):
+    doc, contents = history
+    monkeypatch.setattr(versions, "VERSION_MAX_PER_DOCUMENT", 3)
+    assert versions.compact_document(db, doc.id) == len(contents) - 3
+    db.commit()
+    kept = [v.version_number for v in versions.list_versions(db, doc.id)]
+    assert kept == sorted(contents)[-3:][::-1]
+    for number in kept:
+        assert versions.content_at(db, doc.id, number) == contents[number]